@@ -122,10 +122,16 @@
 
 
 from library import Library
+from library_service import LibraryService
+from storage import SQLiteStore
+import sys
 
 def main():
     
-    library = Library()
+    # Running with a database path (e.g. python "Library Management System.py" library.db) keeps the library between sessions:
+    store = SQLiteStore(sys.argv[1]) if len(sys.argv) > 1 else None
+    library = Library(LibraryService(store))
+    library.service.accrue_fines() # Bringing the fines of a persistent library up to date for the days it wasn't running
 
     while True:
         print("\nWelcome to the Library Management System!")
@@ -145,8 +151,9 @@ def main():
                             "\n2. Borrow a book"
                             "\n3. Return a book"
                             "\n4. Search for a book"
-                            "\n5. Display books\n"
-                        "\nEnter your choice from 1 to 4:\n").lower().strip()
+                            "\n5. Display books"
+                            "\n6. Cancel a reservation\n"
+                        "\nEnter your choice from 1 to 6:\n").lower().strip()
                     if choice == "1".strip():
                         library.add_book()
                     elif choice == "2".strip():
@@ -158,14 +165,17 @@ def main():
                             choice = input("\nHow would you like to search for a book\n"
                                             "\n1. By title"
                                             "\n2. By author"
-                                            "\n3. By ISBN\n"
-                                            "\nEnter your choice from 1 to 3:\n").lower().strip()
+                                            "\n3. By ISBN"
+                                            "\n4. By genre, category, author and availability\n"
+                                            "\nEnter your choice from 1 to 4:\n").lower().strip()
                             if choice == "1".strip():
                                 library.search_book_title()
                             elif choice == "2".strip():
                                 library.search_book_author()
                             elif choice == "3".strip():
                                 library.search_book_isbn()
+                            elif choice == "4".strip():
+                                library.filter_books()
                             else:
                                 print("\nPlease enter a valid response!\n")
                         except Exception as e:
@@ -174,16 +184,24 @@ def main():
                         try: 
                             choice = input("\nWhich books would you like to display?\n"
                                             "\n1. All books in the library"
-                                            "\n2. All currently loaned books\n"
-                                            "\nEnter your choice from 1 to 2:\n").lower().strip()
+                                            "\n2. All currently loaned books"
+                                            "\n3. Overdue books"
+                                            "\n4. Circulation report\n"
+                                            "\nEnter your choice from 1 to 4:\n").lower().strip()
                             if choice == "1".strip():
                                 library.display_all_books()
                             elif choice == "2".strip():
                                 library.display_all_loaned_books()
+                            elif choice == "3".strip():
+                                library.display_overdue_books()
+                            elif choice == "4".strip():
+                                library.display_circulation_report()
                             else:
                                 print("\nPlease enter a valid response!")
                         except Exception as e:
                             print(f"An error occurred: {e}")
+                    elif choice == "6".strip():
+                        library.cancel_reservation()
                     else:
                         print("\nPlease enter a valid response!\n")
                 except Exception as e:
@@ -193,14 +211,17 @@ def main():
                     choice = input("\nWhat would you like to do?\n"
                             "\n1. Add a new user"
                             "\n2. View user details"
-                            "\n3. Display all users\n"
-                        "\nEnter your choice from 1 to 3:\n").lower().strip()
+                            "\n3. Display all users"
+                            "\n4. Pay a fine\n"
+                        "\nEnter your choice from 1 to 4:\n").lower().strip()
                     if choice == "1".strip():
                         library.add_user()
                     elif choice == "2".strip():
                         library.view_user_info()
                     elif choice == "3".strip():
                         library.display_all_users()
+                    elif choice == "4".strip():
+                        library.pay_fine()
                     else:
                         print("\nPlease enter a valid response!")
                 except Exception as e:
@@ -247,6 +268,9 @@ def main():
         except Exception as e:
                 print(f"An error occurred: {e}")
 
+    if store is not None:
+        store.close()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
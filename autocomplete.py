@@ -0,0 +1,65 @@
+from token_index import tokenize
+from bisect import bisect_left, insort
+import threading
+
+# As-you-type suggestions for titles, author names and library IDs.
+# A PrefixIndex keeps all its entries in one sorted list, so every entry starting with a given prefix sits in one contiguous run:
+# a binary search finds the start of the run and the top-N completions are simply the next N entries, whatever the catalog size.
+
+MERGE_ONE_BY_ONE = 32 # Up to this many new entries are inserted one at a time; more are merged into the sorted list with one sort
+
+def normalize_text(text): # "The Lord of the Rings: Part 2" -> "the lord of the rings part 2", so case and punctuation don't matter
+    return " ".join(tokenize(text))
+
+class PrefixIndex:
+    def __init__(self, normalize=normalize_text):
+        self.__normalize = normalize
+        self.__entries = [] # Sorted (normalized key, display value) pairs; the same value can be there several times (e.g. editions)
+        self.__pending = [] # Entries added since the last query, merged in by the next one
+        self.__lock = threading.Lock() # Queries merge the pending entries, so even two concurrent queries change the index
+
+    def __len__(self):
+        return len(self.__entries) + len(self.__pending)
+
+    def add(self, value):
+        # Only appending here: a bulk load (or the first build of the index) costs one sort on the first query instead of
+        # one insertion into the middle of the list per entry
+        entry = (self.__normalize(value), value)
+        with self.__lock:
+            self.__pending.append(entry)
+
+    def remove(self, value): # Removing one occurrence of a value, e.g. the title of a book that has been replaced
+        entry = (self.__normalize(value), value)
+        with self.__lock:
+            self.__merge()
+            position = bisect_left(self.__entries, entry)
+            if position < len(self.__entries) and self.__entries[position] == entry:
+                del self.__entries[position]
+
+    def __merge(self): # Called with the lock held
+        if len(self.__pending) <= MERGE_ONE_BY_ONE:
+            for entry in self.__pending:
+                insort(self.__entries, entry)
+        else:
+            self.__entries.extend(self.__pending)
+            self.__entries.sort() # Timsort finds the already sorted run, so this costs about as much as sorting the new entries alone
+        self.__pending.clear()
+
+    def complete(self, prefix, limit=10): # Returning up to limit distinct values starting with the prefix, in alphabetical order
+        key = self.__normalize(prefix)
+        if key and prefix[-1:].isspace(): # A finished word: "the " completes to "the hobbit" but not to "theatre"
+            key += " "
+        completions = []
+        with self.__lock:
+            if self.__pending:
+                self.__merge()
+            entries = self.__entries
+            for position in range(bisect_left(entries, (key,)), len(entries)):
+                entry_key, value = entries[position]
+                if not entry_key.startswith(key):
+                    break
+                if value not in completions:
+                    if len(completions) >= limit:
+                        break
+                    completions.append(value)
+        return completions
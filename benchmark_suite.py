@@ -0,0 +1,175 @@
+from library import Library
+from library_service import LibraryService
+from search_cache import SearchCache
+from snapshot import write_snapshot, SnapshotStore
+from synthetic_data import TITLE_WORDS, LAST_NAMES, FICTION_CATEGORIES, author_name, author_count_for, generate_books, generate_users, generate_loan_history, make_isbn
+from contextlib import redirect_stdout
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+# Timed end-to-end scenarios over a synthetic catalog, at several catalog sizes, with machine-readable results.
+# Run: python benchmark_suite.py --scales 1000,100000,1000000 --output results.json
+# and later compare another run against it: python benchmark_suite.py --compare results.json
+# The data comes from synthetic_data.py with a fixed seed, so every run measures exactly the same workload.
+
+DEFAULT_SCALES = (1_000, 100_000, 1_000_000)
+
+class SuiteRun:
+    def __init__(self, seed):
+        self.seed = seed
+        self.results = [] # One dictionary per (scenario, scale)
+
+    def time(self, scenario, scale, operations, function):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        result = {"scenario": scenario, "scale": scale, "operations": operations, "seconds": elapsed,
+                  "ops_per_sec": operations / elapsed if elapsed else 0.0, "us_per_op": elapsed / operations * 1e6}
+        self.results.append(result)
+        print(f"{scale:>10,} {scenario:<24} {operations:>9,} ops {elapsed:>9.3f}s {result['us_per_op']:>12.2f} us/op")
+        return result
+
+    def to_json(self):
+        return {"meta": {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                         "platform": platform.platform(), "seed": self.seed, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                "results": self.results}
+
+def run_scale(run, scale, seed):
+    # Every scenario of the suite against one catalog of `scale` books (and a tenth as many users)
+    rng = random.Random(seed)
+    users = max(100, scale // 10)
+    service = LibraryService(search_cache_size=0) # The search scenarios measure the searches themselves; the cache has its own scenario
+    records = list(generate_books(scale, seed)) # Generated up front, so only the library's own work is timed
+
+    def add_books():
+        with service.batch():
+            for record in records:
+                service.add_book(record["title"], record["author"], record["isbn"], record["genre"], record["category"])
+    run.time("add_book", scale, scale, add_books)
+    people = list(generate_users(users))
+
+    def add_users():
+        for name, library_id in people:
+            service.add_user(name, library_id)
+    run.time("add_user", scale, users, add_users)
+
+    title_queries = [" ".join(rng.sample(TITLE_WORDS, rng.randint(1, 2))) for _ in range(200)]
+    run.time("search_title", scale, len(title_queries), lambda: [service.search_title(query) for query in title_queries])
+    substring_queries = [rng.choice(TITLE_WORDS)[1:5] for _ in range(20)] # Partial words, answered by scanning every title
+    run.time("search_title_substring", scale, len(substring_queries),
+             lambda: [service.search_title(query, substring=True) for query in substring_queries])
+    authors = author_count_for(scale)
+    author_queries = [author_name(rng.randrange(authors)) if rng.random() < 0.5 else rng.choice(LAST_NAMES) for _ in range(200)]
+    run.time("search_author", scale, len(author_queries), lambda: [service.search_author(query) for query in author_queries])
+    # Misspelled queries (one letter dropped from a word), answered from the trigram and BK-tree indexes; the first query builds them
+    typo = lambda word: word[:len(word) // 2] + word[len(word) // 2 + 1:]
+    fuzzy_title_queries = [" ".join(typo(word) for word in query.split()) for query in title_queries[:50]]
+    run.time("fuzzy_search_title", scale, len(fuzzy_title_queries), lambda: [service.fuzzy_search_title(query) for query in fuzzy_title_queries])
+    fuzzy_author_queries = [typo(rng.choice(LAST_NAMES)) for _ in range(50)]
+    run.time("fuzzy_search_author", scale, len(fuzzy_author_queries), lambda: [service.fuzzy_search_author(query) for query in fuzzy_author_queries])
+    # As-you-type prefixes, one to four letters long as if typed keystroke by keystroke. The prefix index is built before timing,
+    # so the scenario measures the per-keystroke latency only:
+    prefixes = [query[:rng.randint(1, 4)] for query in title_queries] * 50
+    service.complete_title("")
+    run.time("complete_title", scale, len(prefixes), lambda: [service.complete_title(prefix) for prefix in prefixes])
+    # The same searches repeated, as at a front desk. The first search of each query is made before timing, so the scenario
+    # measures the cache hits only:
+    service.search_cache = SearchCache()
+    repeated_queries = [rng.choice(title_queries[:50]) for _ in range(10_000)]
+    for query in title_queries[:50]:
+        service.search_title(query)
+    run.time("search_title_cached", scale, len(repeated_queries), lambda: [service.search_title(query) for query in repeated_queries])
+    service.search_cache = None
+    isbn_queries = [make_isbn(rng.randrange(scale)) for _ in range(10_000)]
+    run.time("search_isbn", scale, len(isbn_queries), lambda: [service.search_isbn(isbn) for isbn in isbn_queries])
+
+    history = list(generate_loan_history(min(scale, 100_000), scale, users, seed))
+
+    def replay_loans():
+        for event, library_id, isbn in history:
+            if event == "checked_out":
+                service.check_out_book(library_id, isbn)
+            else:
+                service.check_in_book(library_id, isbn)
+    run.time("checkout_return", scale, len(history), replay_loans)
+    # Circulation reports over the loans just replayed: the running top titles, then whole reports computed from the event columns
+    run.time("most_borrowed", scale, 1_000, lambda: [service.most_borrowed(10) for _ in range(1_000)])
+    run.time("circulation_report", scale, 10, lambda: [service.circulation_report() for _ in range(10)])
+
+    # Faceted filters over the books left on loan by the history, e.g. available Fiction books in Fantasy by a given author.
+    # The facet bitmaps are built before timing:
+    service.filter_books()
+    filters = [{"available": rng.choice((True, False, None)), "genre": "Fiction", "category": rng.choice(FICTION_CATEGORIES),
+                "author": rng.choice(LAST_NAMES) if rng.random() < 0.5 else None} for _ in range(50)]
+    run.time("filter_books", scale, len(filters), lambda: [service.filter_books(**facets) for facets in filters])
+
+    run.time("list_books_first_page", scale, 1_000, lambda: [service.list_books(0, 50) for _ in range(1_000)])
+    run.time("list_books_last_page", scale, 10, lambda: [service.list_books(max(0, scale - 50), 50) for _ in range(10)])
+
+    # The CLI views, rendered into memory in a single page so only building and formatting the listing is timed:
+    library = Library(service, page_size=sys.maxsize)
+
+    def view(method):
+        def render():
+            with redirect_stdout(io.StringIO()):
+                method()
+        return render
+    run.time("display_all_books", scale, scale, view(library.display_all_books))
+    run.time("view_genre_details", scale, scale, view(library.view_genre_details))
+    run.time("view_all_genres", scale, scale, view(library.view_all_genres))
+
+    # A read-only replica from a binary snapshot: writing the snapshot, then opening it and looking up books that aren't in memory yet
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.snapshot")
+        run.time("write_snapshot", scale, 1, lambda: write_snapshot(service, path))
+        replicas = []
+        run.time("open_snapshot", scale, 10, lambda: replicas.extend(LibraryService(SnapshotStore(path)) for _ in range(10)))
+        replica = replicas[-1]
+        cold_isbns = [make_isbn(rng.randrange(scale)) for _ in range(1_000)]
+        run.time("snapshot_search_isbn", scale, len(cold_isbns), lambda: [replica.search_isbn(isbn) for isbn in cold_isbns])
+        for replica in replicas:
+            replica.store.close()
+
+def compare(results, baseline, threshold):
+    # Printing the change of every scenario against a previous run and returning the scenarios that got slower than threshold allows
+    previous = {(result["scenario"], result["scale"]): result for result in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with the run of {baseline['meta']['timestamp']} (Python {baseline['meta']['python']}):")
+    for result in results:
+        old = previous.get((result["scenario"], result["scale"]))
+        if old is None:
+            continue
+        ratio = result["us_per_op"] / old["us_per_op"] if old["us_per_op"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{result['scale']:>10,} {result['scenario']:<24} {old['us_per_op']:>12.2f} -> {result['us_per_op']:>12.2f} us/op ({ratio:.2f}x){flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the library benchmark suite on synthetic catalogs.")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES), help="Comma-separated catalog sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="A previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args()
+
+    run = SuiteRun(args.seed)
+    print(f"{'books':>10} {'scenario':<24} {'operations':>13} {'time':>10} {'per operation':>18}")
+    for scale in (int(scale) for scale in args.scales.split(",")):
+        run_scale(run, scale, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(run.to_json(), file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(run.results, json.load(file), args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,341 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import fines
+from author import Author
+from errors import BookUnavailableError
+from fiction import FictionBook
+from genre import Genre
+from library_service import LibraryService
+from loan_journal import LoanJournal
+from registry import Registry
+from sharded_catalog import ShardedLibrary
+from synthetic_data import make_isbn
+from user import User
+
+# Benchmarks for the library's data structures. Run with: python benchmarks.py
+# The benchmarks that check a property (flat lookup cost, no double loans) raise AssertionError when it doesn't hold.
+
+MAX_LOOKUP_GROWTH = 10.0 # How much slower a hot-key lookup may get from the smallest registry to the largest: loose enough for a
+# noisy machine, while a scan would be ~1000x slower (tests/test_registry.py checks the O(1) lookups without timing them)
+
+def time_lookups(registry, keys, repeats=3): # Best nanoseconds per registry.get() over a few runs
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for key in keys:
+            registry.get(key)
+        best = min(best, (time.perf_counter() - start) / len(keys) * 1e9)
+    return best
+
+def bench_registry_scaling(sizes=(1_000, 10_000, 100_000, 1_000_000), lookups=100_000, hot_keys=1_000):
+    # Measuring the per-operation cost of adding users/authors and looking them up by key as the registries grow.
+    # With keyed registries the cost per operation should stay flat instead of growing with the number of entities.
+    # Lookups of random keys slow down with size as the registry outgrows the CPU caches, so flatness is asserted on "hot get":
+    # the same hot_keys keys looked up over and over, which stays in cache and leaves only the cost of the lookup itself.
+    print("\nRegistry scaling (nanoseconds per operation):")
+    print(f"{'entities':>10} {'add user':>10} {'get user':>10} {'add author':>11} {'get author':>11} {'hot get':>8}")
+    results = []
+    rng = random.Random(42)
+    for size in sizes:
+        users = [User(f"User {i}", f"AA{i:07d}") for i in range(size)]
+        authors = [Author(f"Author {i}", "") for i in range(size)]
+        user_registry = Registry(User.get_library_id)
+        author_registry = Registry(Author.get_name)
+
+        start = time.perf_counter()
+        for user in users:
+            user_registry.add(user)
+        add_user = (time.perf_counter() - start) / size * 1e9
+        start = time.perf_counter()
+        for author in authors:
+            author_registry.add(author)
+        add_author = (time.perf_counter() - start) / size * 1e9
+
+        user_keys = [users[rng.randrange(size)].get_library_id() for _ in range(lookups)]
+        author_keys = [authors[rng.randrange(size)].get_name() for _ in range(lookups)]
+        get_user = time_lookups(user_registry, user_keys, repeats=1)
+        get_author = time_lookups(author_registry, author_keys, repeats=1)
+        hot_get = time_lookups(user_registry, user_keys[:hot_keys] * (lookups // hot_keys))
+
+        print(f"{size:>10} {add_user:>10.0f} {get_user:>10.0f} {add_author:>11.0f} {get_author:>11.0f} {hot_get:>8.0f}")
+        results.append((size, add_user, get_user, add_author, get_author, hot_get))
+    get_costs = [row[2] for row in results]
+    hot_costs = [row[5] for row in results]
+    print(f"Lookup cost ratio largest/smallest catalog: {get_costs[-1] / get_costs[0]:.2f}x (hot keys: {hot_costs[-1] / hot_costs[0]:.2f}x)")
+    growth = max(hot_costs) / hot_costs[0]
+    assert growth < MAX_LOOKUP_GROWTH, f"Registry lookups got {growth:.1f}x slower from {sizes[0]:,} to {sizes[-1]:,} entities"
+    return results
+
+def make_loan_library(books, users): # A library with the given number of books and users, ready for loan benchmarks
+    service = LibraryService()
+    for number in range(books):
+        service.add_book(f"Book {number}", f"Author {number % 1000}", make_isbn(number), "Fiction", "Novel")
+    for number in range(users):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    return service
+
+def bench_journal_throughput(operations=50_000, books=10_000, users=1_000):
+    # Measuring how many checkouts/returns per second land durably in the journal with group commit
+    print("\nLoan journal throughput:")
+    service = make_loan_library(books, users)
+    with tempfile.TemporaryDirectory() as directory:
+        journal = LoanJournal(directory)
+        journal.attach(service)
+        start = time.perf_counter()
+        for number in range(operations // 2):
+            library_id = f"AA{number % users:05d}"
+            isbn = make_isbn(number % books)
+            service.check_out_book(library_id, isbn)
+            service.check_in_book(library_id, isbn)
+        journal.sync() # Counting the time until the last operation is on disk
+        elapsed = time.perf_counter() - start
+        journal.close()
+    print(f"{operations} loan operations in {elapsed:.2f}s: {operations / elapsed:,.0f} durable ops/sec")
+    return operations / elapsed
+
+def write_loan_events(journal, count, books, users): # Appending checkout/return pairs directly, as the service would have journaled them
+    for number in range(count // 2):
+        record = {"library_id": f"AA{number % users:05d}", "isbn": make_isbn(number % books)}
+        journal.append(dict(record, op="checkout"))
+        journal.append(dict(record, op="return"))
+
+def bench_journal_recovery(lengths=(10_000, 100_000, 1_000_000), books=10_000, users=1_000, tail=1_000):
+    # Measuring restart time against journal length: replaying the whole journal, then a snapshot plus a short tail of records
+    print("\nLoan journal recovery time:")
+    print(f"{'records':>10} {'replay all (ms)':>16} {'snapshot + tail (ms)':>21}")
+    results = []
+    for length in lengths:
+        with tempfile.TemporaryDirectory() as directory:
+            journal = LoanJournal(directory, group_commit_size=10_000, snapshot_every=length * 2)
+            for number in range(users):
+                journal.append({"op": "user", "library_id": f"AA{number:05d}", "name": f"User {number}"})
+            write_loan_events(journal, length - users, books, users)
+            journal.close()
+            full = LoanJournal(directory).recover(make_loan_library(books, 0))
+
+            # Compacting everything into a snapshot and writing a short tail of records after it:
+            journal = LoanJournal(directory, group_commit_size=10_000, snapshot_every=length * 2)
+            service = make_loan_library(books, 0)
+            journal.recover(service)
+            journal.snapshot(service)
+            write_loan_events(journal, tail, books, users)
+            journal.close()
+            compacted = LoanJournal(directory).recover(make_loan_library(books, 0))
+        print(f"{length:>10} {full.elapsed * 1000:>16.1f} {compacted.elapsed * 1000:>21.1f}")
+        results.append((length, full.elapsed, compacted.elapsed))
+    return results
+
+class LegacyFictionBook:
+    # The layout FictionBook had before it used __slots__: the same attributes, stored in a per-instance __dict__
+    def __init__(self, title, author, isbn, genre, category):
+        self._Book__title = title
+        self._Book__author = author
+        self._Book__isbn = isbn
+        self._Book__genre = genre
+        self._Book__is_available = True
+        self._FictionBook__category = category
+        author.add_author_book(self)
+
+def measure_bytes_per_book(build, count):
+    # Tracing the memory allocated while building count books (titles and ISBN strings included) and still held afterwards
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / count
+
+def bench_book_memory(count=100_000):
+    # Comparing the memory cost of one book: dict-based objects (before) and __slots__ objects
+    authors = [Author(f"Author {number}", "") for number in range(1000)]
+    genre = Genre("Fiction", "")
+    categories = [f"Category {number}" for number in range(30)]
+
+    def build_objects(book_class):
+        def build(count):
+            books = {}
+            for number in range(count):
+                isbn = make_isbn(number)
+                books[isbn] = book_class(f"Book title number {number}", authors[number % 1000], isbn, genre, categories[number % 30])
+            return books
+        return build
+
+    print(f"\nMemory per book ({count} books, including titles, ISBNs and the catalog index):")
+    results = {}
+    for name, build in (("dict-based Book (before)", build_objects(LegacyFictionBook)),
+                        ("__slots__ FictionBook", build_objects(FictionBook))):
+        for author in authors:
+            author.author_books.clear()
+        results[name] = measure_bytes_per_book(build, count)
+        print(f"{name:>26}: {results[name]:>6.0f} bytes")
+    return results
+
+def bench_concurrent_checkout(thread_counts=(1, 2, 4, 8), operations_per_thread=20_000, hot_books=50, users=1_000):
+    # Stress test for concurrent mode: every thread keeps borrowing and returning random books from a small, heavily contended set.
+    # After a successful checkout a thread claims the ISBN in a shared dictionary; finding it already claimed means the book was
+    # lent twice. Also reports the overall throughput for each number of threads.
+    print("\nConcurrent checkout/return (per-ISBN striped locks):")
+    print(f"{'threads':>8} {'ops/sec':>10} {'loans':>8} {'double loans':>13}")
+    results = []
+    for thread_count in thread_counts:
+        service = LibraryService(concurrent=True)
+        for number in range(hot_books):
+            service.add_book(f"Book {number}", f"Author {number}", make_isbn(number), "Fiction", "Novel")
+        for number in range(users):
+            service.add_user(f"User {number}", f"AA{number:05d}")
+        holders = {} # ISBN -> library ID, claimed by the thread right after a successful checkout
+        double_loans = []
+        loans = [0] * thread_count
+
+        def worker(index):
+            rng = random.Random(index)
+            for _ in range(operations_per_thread):
+                isbn = make_isbn(rng.randrange(hot_books))
+                library_id = f"AA{rng.randrange(users):05d}"
+                try:
+                    service.check_out_book(library_id, isbn)
+                except BookUnavailableError:
+                    continue
+                if holders.setdefault(isbn, library_id) != library_id:
+                    double_loans.append(isbn)
+                loans[index] += 1
+                del holders[isbn]
+                service.check_in_book(library_id, isbn)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        # Every loan has been returned, so the ledger must be empty and every book available again:
+        consistent = not service.has_loans() and all(book.is_available() for book in service.books.values())
+        operations = thread_count * operations_per_thread
+        print(f"{thread_count:>8} {operations / elapsed:>10,.0f} {sum(loans):>8} {len(double_loans):>13}" + ("" if consistent else "  INCONSISTENT"))
+        results.append((thread_count, operations / elapsed, len(double_loans), consistent))
+        assert not double_loans, f"{len(double_loans)} books were lent twice with {thread_count} threads"
+        assert consistent, f"Books still on loan after every loan was returned ({thread_count} threads)"
+        # Every checkout the threads saw succeed was counted once by the ledger, and so was every return:
+        assert service.ledger.total_checkouts == service.ledger.total_returns == sum(loans)
+    return results
+
+TITLE_WORDS = ("river", "night", "garden", "winter", "stone", "silver", "empire", "shadow", "ocean", "letters",
+               "fire", "glass", "storm", "forest", "crown", "memory", "island", "city", "wolf", "light")
+
+def bench_sharded_scaling(worker_counts=(1, 2, 4), books=200_000, users=1_000, searches=300, loans=50_000, loan_batch=1_000):
+    # Measuring title/author search and checkout/return throughput of the process-sharded catalog with more and more workers.
+    # Searches are scatter-gathered over every shard; loans are sent in batches so each shard works through its part in parallel.
+    # Scaling is bounded by the number of cores (os.cpu_count() here) and by the cost of pickling results back to the parent.
+    print(f"\nSharded catalog scaling ({books:,} books, {os.cpu_count()} cores):")
+    print(f"{'workers':>8} {'load s':>8} {'searches/sec':>13} {'loans/sec':>10}")
+    words = len(TITLE_WORDS)
+    records = [(f"{TITLE_WORDS[number % words]} {TITLE_WORDS[number // words % words]} {number}", f"Author {number % 5_000}",
+                make_isbn(number), "Fiction", "Novel") for number in range(books)]
+    rng = random.Random(7)
+    queries = [f"{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}" for _ in range(searches)]
+    authors = [f"Author {rng.randrange(5_000)}" for _ in range(searches)]
+    loan_pairs = [(f"AA{rng.randrange(users):05d}", make_isbn(number)) for number in rng.sample(range(books), loans)]
+    results = []
+    for worker_count in worker_counts:
+        with ShardedLibrary(worker_count) as library:
+            start = time.perf_counter()
+            library.add_books(records)
+            for number in range(users):
+                library.add_user(f"User {number}", f"AA{number:05d}")
+            load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for title, author in zip(queries, authors):
+                library.search_title(title)
+                library.search_author(author)
+            search_rate = 2 * searches / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for offset in range(0, loans, loan_batch):
+                batch = loan_pairs[offset:offset + loan_batch]
+                library.check_out_books(batch)
+                library.check_in_books(batch)
+            loan_rate = 2 * loans / (time.perf_counter() - start)
+        print(f"{worker_count:>8} {load:>8.2f} {search_rate:>13,.0f} {loan_rate:>10,.0f}")
+        results.append((worker_count, load, search_rate, loan_rate))
+    return results
+
+def bench_reservation_waitlist(hold_counts=(100, 10_000, 50_000), returns=1_000):
+    # Measuring reserve, cancel and return-with-hand-off on one very popular book as its waitlist grows. Half the holds are
+    # cancelled first (at random, so the heap is full of cancelled entries) and a quarter have a higher priority.
+    # The cost per operation should stay roughly flat: the waitlist is a heap, so nothing scans the line.
+    print("\nReservation waitlist (microseconds per operation):")
+    print(f"{'holds':>10} {'reserve':>10} {'cancel':>10} {'return':>10}")
+    rng = random.Random(0)
+    results = []
+    for holds in hold_counts:
+        service = make_loan_library(1, holds + 1)
+        isbn = make_isbn(0)
+        service.check_out_book("AA00000", isbn)
+        library_ids = [f"AA{number:05d}" for number in range(1, holds + 1)]
+        start = time.perf_counter()
+        for library_id in library_ids:
+            service.reserve_book(library_id, isbn, 1 if rng.random() < 0.25 else 0)
+        reserve = (time.perf_counter() - start) / holds * 1e6
+        cancelled = rng.sample(library_ids, holds // 2)
+        start = time.perf_counter()
+        for library_id in cancelled:
+            service.cancel_reservation(library_id, isbn)
+        cancel = (time.perf_counter() - start) / len(cancelled) * 1e6
+        count = min(returns, holds - len(cancelled))
+        start = time.perf_counter()
+        for _ in range(count): # Every return hands the book over to the next in line
+            service.check_in_book(service.who_has(isbn).get_library_id(), isbn)
+        hand_off = (time.perf_counter() - start) / count * 1e6
+        print(f"{holds:>10,} {reserve:>10.1f} {cancel:>10.1f} {hand_off:>10.1f}")
+        results.append((holds, reserve, cancel, hand_off))
+    return results
+
+def bench_overdue_fines(loan_counts=(10_000, 100_000, 300_000), overdue_share=0.01, users=10_000):
+    # Measuring "what is overdue now" against the number of loans, with 1% of them overdue. The first query moves every overdue loan
+    # out of the due-date heap (O(k log n)); the following ones, e.g. the next page view, only look at the k overdue loans.
+    # A scan, the only option before, visits every loan each time. Also times one nightly fine accrual over the overdue loans.
+    print(f"\nOverdue loans and fine accrual ({overdue_share:.0%} of the loans overdue, {'NumPy' if fines.numpy is not None else 'no NumPy'}):")
+    print(f"{'loans':>10} {'overdue':>8} {'first (ms)':>11} {'again (ms)':>11} {'scan (ms)':>10} {'accrue (ms)':>12}")
+    rng = random.Random(0)
+    results = []
+    for loans in loan_counts:
+        service = make_loan_library(loans, users)
+        now = time.time()
+        for number in range(loans):
+            days = -rng.uniform(1, 30) if rng.random() < overdue_share else rng.uniform(1, 14)
+            service.check_out_book(f"AA{number % users:05d}", make_isbn(number), due_at=now + days * fines.DAY)
+        start = time.perf_counter()
+        overdue = service.overdue_loans(now)
+        first = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        service.overdue_loans(now)
+        again = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        scanned = [loan for loan in service.ledger.loans() if loan.due_at <= now]
+        scan = (time.perf_counter() - start) * 1e3
+        assert len(scanned) == len(overdue)
+        start = time.perf_counter()
+        service.accrue_fines(now)
+        accrue = (time.perf_counter() - start) * 1e3
+        print(f"{loans:>10,} {len(overdue):>8,} {first:>11.2f} {again:>11.2f} {scan:>10.2f} {accrue:>12.2f}")
+        results.append((loans, len(overdue), first, again, scan, accrue))
+    return results
+
+if __name__ == "__main__":
+    sizes = tuple(int(arg) for arg in sys.argv[1:]) or (1_000, 10_000, 100_000, 1_000_000)
+    bench_registry_scaling(sizes)
+    bench_journal_throughput()
+    bench_journal_recovery()
+    bench_book_memory()
+    bench_concurrent_checkout()
+    bench_sharded_scaling()
+    bench_reservation_waitlist()
+    bench_overdue_fines()
@@ -2,6 +2,9 @@ from author import Author
 from genre import Genre
 
 class Book:
+    # Using __slots__ instead of a per-instance __dict__ to keep every book smaller in memory (the names are mangled like the attributes)
+    __slots__ = ("__title", "__author", "__isbn", "__genre", "__is_available")
+
     def __init__(self, title, author, isbn, genre):
         self.__title = title
         self.__author = author # Author object
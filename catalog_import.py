@@ -0,0 +1,164 @@
+from fiction import FictionBook
+from nonfiction import NonFictionBook
+from library_service import LibraryService, GENRES
+from isbn import canonical_isbns
+from storage import SQLiteStore
+from errors import LibraryError, InvalidISBNError
+import argparse
+import csv
+import json
+import time
+
+# Streaming bulk import of catalog records from CSV or JSONL files.
+# Each record needs the fields title, author, isbn, genre (Fiction or Nonfiction) and category (or subject for nonfiction books);
+# biography and description are optional and only used when the author or genre is new to the library.
+
+class ImportReport:
+    def __init__(self, max_rejections_kept=1000):
+        self.records = 0 # Rows read from the source
+        self.added = 0 # Books added to the library
+        self.duplicates = 0 # Rows skipped because their ISBN is already in the library
+        self.rejected = 0 # Rows rejected for any reason, duplicates included
+        self.rejections = [] # (row number, reason) for the first max_rejections_kept rejected rows, so memory stays bounded
+        self.elapsed = 0.0
+        self.__max_rejections_kept = max_rejections_kept
+
+    def reject(self, row_number, reason):
+        self.rejected += 1
+        if len(self.rejections) < self.__max_rejections_kept:
+            self.rejections.append((row_number, reason))
+
+    @property
+    def records_per_second(self):
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        lines = [f"Read {self.records} records in {self.elapsed:.2f}s ({self.records_per_second:,.0f} records/sec): "
+                 f"{self.added} added, {self.rejected} rejected ({self.duplicates} duplicate ISBNs)"]
+        for row_number, reason in self.rejections:
+            lines.append(f"  - row {row_number}: {reason}")
+        if self.rejected > len(self.rejections):
+            lines.append(f"  ... and {self.rejected - len(self.rejections)} more rejected rows")
+        return "\n".join(lines)
+
+def read_csv(path): # Yielding one dictionary per CSV row, reading the file lazily
+    with open(path, newline="", encoding="utf-8") as file:
+        yield from csv.DictReader(file)
+
+def read_jsonl(path): # Yielding one dictionary per JSON line; malformed lines are yielded as the error so the importer can reject them
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield ValueError(f"malformed JSON ({e.msg})")
+
+class CatalogImporter:
+    def __init__(self, service, batch_size=1000, max_rejections_kept=1000):
+        self.service = service
+        self.batch_size = batch_size
+        self.max_rejections_kept = max_rejections_kept
+
+    def import_file(self, path):
+        if path.endswith(".csv"):
+            records = read_csv(path)
+        elif path.endswith(".jsonl") or path.endswith(".ndjson"):
+            records = read_jsonl(path)
+        else:
+            raise ValueError(f"Unsupported catalog file '{path}' (expected .csv or .jsonl)")
+        return self.import_records(records)
+
+    def import_records(self, records): # Importing any iterable of record dictionaries, batch by batch
+        report = ImportReport(self.max_rejections_kept)
+        start = time.perf_counter()
+        batch = []
+        for record in records:
+            report.records += 1
+            batch.append((report.records, record))
+            if len(batch) >= self.batch_size:
+                self.__import_batch(batch, report)
+                batch = []
+        if batch:
+            self.__import_batch(batch, report)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def __import_batch(self, batch, report):
+        with self.service.batch(): # Storing the whole batch in one transaction
+            self.__import_rows(batch, report)
+
+    def __import_rows(self, batch, report):
+        # Authors and genres are resolved once per batch through these caches; they are dropped with the batch so memory stays bounded
+        authors = {}
+        genres = {}
+        # Validating the ISBN column of the whole batch in one call (vectorized when NumPy is installed):
+        isbns = canonical_isbns(record.get("isbn") if isinstance(record, dict) and isinstance(record.get("isbn"), str) else ""
+                                for _, record in batch)
+        for (row_number, record), isbn in zip(batch, isbns):
+            try:
+                book = self.__build_book(record, isbn, authors, genres)
+            except (LibraryError, ValueError) as e:
+                report.reject(row_number, str(e))
+                continue
+            if book is None: # Duplicate ISBN
+                report.duplicates += 1
+                report.reject(row_number, f"duplicate ISBN '{record['isbn'].strip()}' skipped")
+                continue
+            self.service.register_book(book)
+            report.added += 1
+
+    def __build_book(self, record, isbn, authors, genres): # isbn is the canonical form of the record's ISBN, or None if it is invalid
+        if isinstance(record, Exception):
+            raise record
+        if not isinstance(record, dict):
+            raise ValueError("record is not an object")
+        fields = {}
+        for field in ("title", "author", "isbn", "genre"):
+            value = record.get(field)
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"missing {field}")
+            fields[field] = value.strip()
+        for field in ("biography", "description"): # Optional, but text when given
+            value = record.get(field)
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"invalid {field}")
+            fields[field] = (value or "").strip()
+        category = str(record.get("category") or record.get("subject") or "").strip()
+        if not category:
+            raise ValueError("missing category/subject")
+        if isbn is None:
+            raise InvalidISBNError(fields["isbn"])
+        if isbn in self.service.books: # Skipping duplicates before the book is built, since a new Book registers itself with its author
+            return None
+        genre_name = fields["genre"].title()
+        if genre_name not in GENRES:
+            raise ValueError(f"invalid genre '{fields['genre']}'")
+
+        author_name = fields["author"]
+        author = authors.get(author_name)
+        if author is None:
+            author = self.service.find_author(author_name) or self.service.add_author(author_name, fields["biography"])
+            authors[author_name] = author
+        genre = genres.get(genre_name)
+        if genre is None:
+            genre = self.service.find_genre(genre_name) or self.service.add_genre(genre_name, fields["description"])
+            genres[genre_name] = genre
+
+        if genre_name == "Fiction":
+            return FictionBook(fields["title"], author, isbn, genre, category)
+        return NonFictionBook(fields["title"], author, isbn, genre, category)
+
+if __name__ == "__main__":
+    # Importing catalog files and printing the report, e.g.: python catalog_import.py --db library.db books.csv more_books.jsonl
+    parser = argparse.ArgumentParser(description="Bulk import of catalog records from CSV or JSONL files.")
+    parser.add_argument("--db", help="SQLite database to import into (default: a throwaway in-memory library)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    service = LibraryService(SQLiteStore(args.db) if args.db else None)
+    importer = CatalogImporter(service, batch_size=args.batch_size)
+    for path in args.files:
+        print(f"{path}:\n{importer.import_file(path)}")
+    service.store.close()
@@ -0,0 +1,243 @@
+try:
+    import numpy
+except ImportError: # NumPy is optional: without it, the reports walk the event columns in Python
+    numpy = None
+from array import array
+from fines import DAY
+import heapq
+import math
+import threading
+
+# Circulation analytics over the stream of checkouts and returns (LibraryService records every loan here, see service.circulation).
+# Every event is appended to a columnar buffer: one typed array per field (kind, time, book, borrower, genre, loan duration), with
+# books, borrowers and genres interned as dense ordinals, so an event takes 29 bytes and a million loans fit in about 60 MB.
+# Running aggregates are updated with each event: checkouts per book and per genre, books on loan per genre, loan durations in whole
+# days, and the most borrowed books, kept exact in a small heap. They answer in microseconds however many loans there have been.
+# Reports over a time window are computed from the columns, vectorized with NumPy when it is installed (milliseconds per million events).
+
+CHECKOUT = 0
+RETURN = 1
+TOP_BOOKS = 100 # How many of the most borrowed books are kept up to date as loans come in
+DURATION_DAYS = 90 # Loans of this many days or more share the last bucket of the duration distribution
+PERCENTILES = (50, 90, 99)
+
+class TopCounts:
+    # The `capacity` keys with the highest counts, kept exact while counts go up one at a time. Counts only grow, so a key outside the
+    # top never has more than the smallest count inside it: when a key passes that smallest count, the two swap places. The smallest
+    # is found with a min-heap whose outdated entries are skipped (lazy deletion), so an update is O(log capacity).
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.__members = {} # Key -> count, for the keys in the top
+        self.__heap = [] # (count, key); an entry is outdated once its key has left the top or counted higher
+
+    def update(self, key, count): # Recording that a key's count has grown to `count`
+        members = self.__members
+        if key not in members and len(members) >= self.capacity:
+            smallest_count, smallest = self.__smallest()
+            if count <= smallest_count:
+                return
+            heapq.heappop(self.__heap)
+            del members[smallest]
+        members[key] = count
+        heapq.heappush(self.__heap, (count, key))
+        if len(self.__heap) > 2 * self.capacity + 64: # Mostly outdated entries: rebuilding the heap from the members, O(capacity) now and then
+            self.__heap = [(count, key) for key, count in members.items()]
+            heapq.heapify(self.__heap)
+
+    def __smallest(self):
+        heap = self.__heap
+        members = self.__members
+        while members.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def top(self, limit): # (key, count) pairs, highest count first and the lower key first among equal counts
+        return sorted(self.__members.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+class CirculationAnalytics:
+    def __init__(self, top_books=TOP_BOOKS):
+        self.__lock = threading.Lock() # Loans of different books are recorded from several threads in concurrent mode
+        # The event columns, one entry per event:
+        self.__kinds = array("b") # CHECKOUT or RETURN
+        self.__times = array("d") # Unix timestamps
+        self.__book_ids = array("i")
+        self.__borrower_ids = array("i")
+        self.__genre_ids = array("i")
+        self.__durations = array("d") # Seconds a returned book was out, NaN for checkouts
+        # Interned values, ordinal -> value and value -> ordinal:
+        self.__books = [] # The latest Book under each ISBN
+        self.__book_ordinals = {}
+        self.__borrowers = [] # Library IDs
+        self.__borrower_ordinals = {}
+        self.__genres = [] # Genre names
+        self.__genre_ordinals = {}
+        # Running aggregates:
+        self.__checkouts = array("q") # Book ordinal -> checkouts
+        self.__genre_checkouts = array("q") # Genre ordinal -> checkouts
+        self.__genre_on_loan = array("q") # Genre ordinal -> books on loan now
+        self.__duration_days = array("q", [0] * (DURATION_DAYS + 1)) # Whole days a book was out -> returns
+        self.__top = TopCounts(top_books)
+        self.checkouts = 0
+        self.returns = 0
+
+    def __len__(self): # Number of events recorded
+        return len(self.__kinds)
+
+    def __book(self, book): # The ordinal of a book, interning it (and keeping the latest object under its ISBN) as needed
+        isbn = book.get_isbn()
+        ordinal = self.__book_ordinals.get(isbn)
+        if ordinal is None:
+            ordinal = self.__book_ordinals[isbn] = len(self.__books)
+            self.__books.append(book)
+            self.__checkouts.append(0)
+        else:
+            self.__books[ordinal] = book
+        return ordinal
+
+    def __borrower(self, library_id):
+        ordinal = self.__borrower_ordinals.get(library_id)
+        if ordinal is None:
+            ordinal = self.__borrower_ordinals[library_id] = len(self.__borrowers)
+            self.__borrowers.append(library_id)
+        return ordinal
+
+    def __genre(self, name):
+        ordinal = self.__genre_ordinals.get(name)
+        if ordinal is None:
+            ordinal = self.__genre_ordinals[name] = len(self.__genres)
+            self.__genres.append(name)
+            self.__genre_checkouts.append(0)
+            self.__genre_on_loan.append(0)
+        return ordinal
+
+    def __append(self, kind, at, book, borrower, genre, duration):
+        self.__kinds.append(kind)
+        self.__times.append(at)
+        self.__book_ids.append(book)
+        self.__borrower_ids.append(borrower)
+        self.__genre_ids.append(genre)
+        self.__durations.append(duration)
+
+    def record_checkout(self, loan): # A book has been loaned (a loan_ledger.Loan)
+        with self.__lock:
+            book = self.__book(loan.book)
+            genre = self.__genre(loan.book.get_genre().get_name())
+            self.__append(CHECKOUT, loan.checked_out_at, book, self.__borrower(loan.user.get_library_id()), genre, math.nan)
+            self.__checkouts[book] += 1
+            self.__top.update(book, self.__checkouts[book])
+            self.__genre_checkouts[genre] += 1
+            self.__genre_on_loan[genre] += 1
+            self.checkouts += 1
+
+    def record_restored(self, loan): # A loan that was already out when the service started: on loan now, but not a checkout seen here
+        with self.__lock:
+            self.__book(loan.book)
+            self.__genre_on_loan[self.__genre(loan.book.get_genre().get_name())] += 1
+
+    def record_return(self, loan, returned_at): # The loan has ended at returned_at
+        duration = max(0.0, returned_at - loan.checked_out_at)
+        with self.__lock:
+            genre = self.__genre(loan.book.get_genre().get_name())
+            self.__append(RETURN, returned_at, self.__book(loan.book), self.__borrower(loan.user.get_library_id()), genre, duration)
+            self.__genre_on_loan[genre] -= 1
+            self.__duration_days[min(int(duration // DAY), DURATION_DAYS)] += 1
+            self.returns += 1
+
+    # Running aggregates:
+    def most_borrowed(self, limit=10): # (Book, checkouts) pairs, most borrowed first
+        with self.__lock:
+            if limit <= self.__top.capacity:
+                top = self.__top.top(limit)
+            else: # More than the tracked top: one pass over the counts
+                top = heapq.nlargest(limit, enumerate(self.__checkouts), key=lambda item: (item[1], -item[0]))
+            return [(self.__books[ordinal], count) for ordinal, count in top if count]
+
+    def checkout_count(self, isbn): # How many times a book has been borrowed
+        with self.__lock:
+            ordinal = self.__book_ordinals.get(isbn)
+            return self.__checkouts[ordinal] if ordinal is not None else 0
+
+    def genre_stats(self): # Genre name -> (checkouts, books on loan now)
+        with self.__lock:
+            return {name: (self.__genre_checkouts[ordinal], self.__genre_on_loan[ordinal]) for ordinal, name in enumerate(self.__genres)}
+
+    def duration_distribution(self): # Whole days a returned book was out -> number of returns; the last bucket counts DURATION_DAYS or more
+        with self.__lock:
+            return {days: count for days, count in enumerate(self.__duration_days) if count}
+
+    # Reports over the event columns:
+    def report(self, since=None, until=None, limit=10):
+        # Circulation between the timestamps since (included) and until (excluded), either of which may be None: the number of
+        # checkouts and returns, the distinct borrowers, the `limit` most borrowed books with their checkouts, the checkouts per
+        # genre, and the loan durations of the returns in days (count, mean, max and PERCENTILES).
+        with self.__lock: # Copying the columns (a memory copy each), so loans carry on while the report is computed
+            columns = (self.__kinds[:], self.__times[:], self.__book_ids[:], self.__borrower_ids[:], self.__genre_ids[:], self.__durations[:])
+            books = list(self.__books)
+            genres = list(self.__genres)
+        if numpy is None or not columns[0]:
+            checkouts, returns, borrowers, book_counts, genre_counts, durations = self.__scan(columns, since, until)
+            top = heapq.nlargest(limit, book_counts.items(), key=lambda item: (item[1], -item[0]))
+            durations.sort()
+            duration_summary = {"count": len(durations), "mean": sum(durations) / len(durations) if durations else 0.0,
+                                "max": durations[-1] if durations else 0.0}
+            for percentile in PERCENTILES: # Linear interpolation between the closest ranks, as numpy.percentile does
+                duration_summary[f"p{percentile}"] = interpolate(durations, percentile) if durations else 0.0
+        else:
+            checkouts, returns, borrowers, top, genre_counts, duration_summary = self.__vectorized(columns, since, until, limit,
+                                                                                                  len(books), len(genres))
+        return {"checkouts": checkouts, "returns": returns, "borrowers": borrowers,
+                "most_borrowed": [(books[ordinal], count) for ordinal, count in top],
+                "genre_checkouts": {genres[ordinal]: count for ordinal, count in genre_counts.items()},
+                "loan_days": duration_summary}
+
+    def __scan(self, columns, since, until): # The report's counts, one event at a time
+        checkouts = returns = 0
+        borrowers = set()
+        book_counts = {}
+        genre_counts = {}
+        durations = []
+        for kind, at, book, borrower, genre, duration in zip(*columns):
+            if (since is not None and at < since) or (until is not None and at >= until):
+                continue
+            if kind == CHECKOUT:
+                checkouts += 1
+                borrowers.add(borrower)
+                book_counts[book] = book_counts.get(book, 0) + 1
+                genre_counts[genre] = genre_counts.get(genre, 0) + 1
+            else:
+                returns += 1
+                durations.append(duration / DAY)
+        return checkouts, returns, len(borrowers), book_counts, genre_counts, durations
+
+    def __vectorized(self, columns, since, until, limit, book_total, genre_total): # The report's counts as whole-column operations
+        kinds, times, book_ids, borrower_ids, genre_ids, durations = (numpy.frombuffer(column, dtype=column.typecode) for column in columns)
+        window = numpy.ones(len(kinds), dtype=bool)
+        if since is not None:
+            window &= times >= since
+        if until is not None:
+            window &= times < until
+        checked_out = window & (kinds == CHECKOUT)
+        returned = window & (kinds == RETURN)
+        book_counts = numpy.bincount(book_ids[checked_out], minlength=book_total)
+        limit = min(limit, book_total)
+        if limit: # Every book with at least the limit-th highest count, so that the ties at the cutoff are decided by ordinal below
+            cutoff = numpy.partition(book_counts, book_total - limit)[book_total - limit]
+            candidates = numpy.flatnonzero(book_counts >= cutoff)
+        else:
+            candidates = numpy.arange(0)
+        candidates = candidates[numpy.lexsort((candidates, -book_counts[candidates]))][:limit] # Most first, the earlier book first among ties
+        top = [(int(ordinal), int(book_counts[ordinal])) for ordinal in candidates if book_counts[ordinal]]
+        genre_counts = numpy.bincount(genre_ids[checked_out], minlength=genre_total)
+        borrowers = int(numpy.count_nonzero(numpy.bincount(borrower_ids[checked_out]))) if checked_out.any() else 0
+        days = durations[returned] / DAY
+        summary = {"count": int(days.size), "mean": float(days.mean()) if days.size else 0.0, "max": float(days.max()) if days.size else 0.0}
+        for percentile, value in zip(PERCENTILES, numpy.percentile(days, PERCENTILES) if days.size else [0.0] * len(PERCENTILES)):
+            summary[f"p{percentile}"] = float(value)
+        return (int(checked_out.sum()), int(returned.sum()), borrowers, top,
+                {ordinal: int(count) for ordinal, count in enumerate(genre_counts) if count}, summary)
+
+def interpolate(values, percentile): # The percentile of sorted values, interpolating linearly between the closest ranks
+    rank = (len(values) - 1) * percentile / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
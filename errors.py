@@ -0,0 +1,124 @@
+# Exceptions raised by the library service layer (library_service.py).
+# Every error derives from LibraryError, so callers can catch the whole family with a single except clause.
+
+def rebuild_error(error_class, message, attributes):
+    error = error_class.__new__(error_class)
+    Exception.__init__(error, message)
+    error.__dict__.update(attributes)
+    return error
+
+class LibraryError(Exception):
+    def __reduce__(self):
+        # Pickling by message and attributes, because the subclasses' constructors take other arguments than the message
+        # (errors are sent between processes by sharded_catalog.py)
+        return (rebuild_error, (type(self), str(self), self.__dict__))
+
+# Invalid input:
+class ValidationError(LibraryError):
+    pass
+
+class InvalidISBNError(ValidationError):
+    def __init__(self, isbn):
+        super().__init__(f"'{isbn}' is not a valid ISBN (example: 978-92-95055-02-5)")
+        self.isbn = isbn
+
+class InvalidLibraryIDError(ValidationError):
+    def __init__(self, library_id):
+        super().__init__(f"'{library_id}' is not a valid library ID (example: AA12345)")
+        self.library_id = library_id
+
+class InvalidGenreError(ValidationError):
+    def __init__(self, genre):
+        super().__init__(f"Invalid genre type '{genre}'. Please specify 'Fiction' or 'Nonfiction'.")
+        self.genre = genre
+
+class InvalidPaymentError(ValidationError):
+    def __init__(self, amount, balance):
+        super().__init__(f"Invalid payment of {amount} cents: a payment must be more than 0 and at most the balance of {balance} cents")
+        self.amount = amount
+        self.balance = balance
+
+class InvalidChargeError(ValidationError):
+    def __init__(self, amount):
+        super().__init__(f"Invalid charge of {amount} cents: a fine must be a whole number of cents more than 0")
+        self.amount = amount
+
+# Missing entities:
+class NotFoundError(LibraryError):
+    pass
+
+class BookNotFoundError(NotFoundError):
+    def __init__(self, isbn):
+        super().__init__(f"There is no book with ISBN '{isbn}' in the library!")
+        self.isbn = isbn
+
+class UserNotFoundError(NotFoundError):
+    def __init__(self, library_id):
+        super().__init__(f"No user with Library ID: {library_id} has been found in the library!")
+        self.library_id = library_id
+
+class AuthorNotFoundError(NotFoundError):
+    def __init__(self, name):
+        super().__init__(f"{name} is not in the list of authors in the library!")
+        self.name = name
+
+# Conflicts with the current state of the library:
+class DuplicateError(LibraryError):
+    pass
+
+class DuplicateBookError(DuplicateError):
+    def __init__(self, isbn):
+        super().__init__(f"A book with ISBN '{isbn}' is already in the library!")
+        self.isbn = isbn
+
+class DuplicateUserError(DuplicateError):
+    def __init__(self, library_id):
+        super().__init__(f"User with the library ID {library_id} already exists!")
+        self.library_id = library_id
+
+class DuplicateAuthorError(DuplicateError):
+    def __init__(self, name):
+        super().__init__(f"{name} already exists in the library")
+        self.name = name
+
+class DuplicateGenreError(DuplicateError):
+    def __init__(self, name):
+        super().__init__(f"Genre '{name}' already exists in the library")
+        self.name = name
+
+class DuplicateReservationError(DuplicateError):
+    def __init__(self, library_id, isbn):
+        super().__init__(f"Library ID {library_id} already has or is waiting for the book with ISBN '{isbn}'")
+        self.library_id = library_id
+        self.isbn = isbn
+
+class BookUnavailableError(LibraryError):
+    def __init__(self, isbn):
+        super().__init__(f"The book with ISBN '{isbn}' is unavailable!")
+        self.isbn = isbn
+
+class BookAvailableError(LibraryError):
+    def __init__(self, isbn):
+        super().__init__(f"The book with ISBN '{isbn}' is available, there is no need to reserve it!")
+        self.isbn = isbn
+
+class BookOnLoanError(LibraryError):
+    def __init__(self, isbn):
+        super().__init__(f"The book with ISBN '{isbn}' is on loan and can't be replaced until it is returned!")
+        self.isbn = isbn
+
+class ReadOnlyStoreError(LibraryError):
+    def __init__(self):
+        super().__init__("This library is a read-only replica and can't be changed!")
+
+class LoanNotFoundError(LibraryError):
+    def __init__(self, library_id, isbn):
+        super().__init__(f"No record found for the book with ISBN {isbn} borrowed by Library ID {library_id}")
+        self.library_id = library_id
+        self.isbn = isbn
+
+class ReservationNotFoundError(NotFoundError):
+    def __init__(self, library_id, isbn):
+        super().__init__(f"Library ID {library_id} has no reservation for the book with ISBN {isbn}")
+        self.library_id = library_id
+        self.isbn = isbn
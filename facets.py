@@ -0,0 +1,137 @@
+from itertools import islice
+from pagination import take_page
+import re
+import threading
+
+# Faceted filtering: "available Fiction books in category Fantasy by Tolkien", with the number of matches per facet value.
+# Every book gets a dense ordinal (0, 1, 2, ... in the order books are added), and every facet value has a bitmap with one bit per
+# ordinal: one for the available books, one per genre, one per fiction category / nonfiction subject and one per author.
+# The bitmaps are bytearrays, so borrowing or returning a book flips a single bit in O(1). A query turns the bitmaps it needs into
+# Python integers (int.from_bytes, a memory copy) and combines them with & and |, 64 books per machine word, then counts with
+# int.bit_count(): filtering a million books takes a few milliseconds, however many facets are combined.
+
+FACETS = ("genre", "category", "author")
+NONZERO_BYTE = re.compile(rb"[^\x00]")
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)) # Byte value -> positions of its set bits
+
+class Bitmap:
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = bytearray() # Bit n is bit n % 8 of byte n // 8, so int.from_bytes(data, "little") has bit n set for ordinal n
+
+    def set(self, position):
+        index = position >> 3
+        if index >= len(self.data):
+            self.data.extend(bytes(index + 1 - len(self.data))) # Growing as ordinals are handed out (amortized O(1), like a list)
+        self.data[index] |= 1 << (position & 7)
+
+    def clear(self, position):
+        index = position >> 3
+        if index < len(self.data):
+            self.data[index] &= ~(1 << (position & 7))
+
+    def __contains__(self, position):
+        index = position >> 3
+        return index < len(self.data) and bool(self.data[index] >> (position & 7) & 1)
+
+    def to_int(self):
+        return int.from_bytes(self.data, "little")
+
+def iter_bits(bits): # The positions of the set bits of an integer, lowest first
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for match in NONZERO_BYTE.finditer(data): # Skipping the empty stretches at C speed: only bytes with set bits are looked at
+        index = match.start()
+        base = index * 8
+        for bit in BYTE_BITS[data[index]]:
+            yield base + bit
+
+class FacetResult:
+    def __init__(self, books, total, counts):
+        self.books = books # One Page of the matching books, in the order they were added
+        self.total = total # Number of matching books
+        self.counts = counts # Facet -> {value: matching books with that value}, e.g. {"genre": {"Fiction": 12}, "available": {True: 9, False: 3}}
+
+class FacetIndex:
+    # Facet bitmaps over every book of the catalog. The caller (LibraryService) adds each book once it is in the catalog and reports
+    # every change of availability; a book replaced under the same ISBN keeps its ordinal and only has its facet bits moved.
+    def __init__(self, category_of):
+        self.__category_of = category_of # Book -> its fiction category or nonfiction subject
+        self.__ordinals = {} # ISBN -> ordinal
+        self.__books = [] # Ordinal -> Book
+        self.__available = Bitmap()
+        self.__facets = {facet: {} for facet in FACETS} # Facet -> {value: Bitmap}
+        self.__lock = threading.Lock() # "byte |= mask" isn't atomic: two flips in the same byte from two threads could lose one
+
+    def __len__(self):
+        return len(self.__books)
+
+    def __values(self, book):
+        return {"genre": book.get_genre().get_name(), "category": self.__category_of(book), "author": book.get_author().get_name()}
+
+    def add(self, book):
+        isbn = book.get_isbn()
+        with self.__lock:
+            ordinal = self.__ordinals.get(isbn)
+            if ordinal is None:
+                ordinal = self.__ordinals[isbn] = len(self.__books)
+                self.__books.append(book)
+            else: # Replacing a book: clearing the bits of its old facet values first
+                for facet, value in self.__values(self.__books[ordinal]).items():
+                    self.__facets[facet][value].clear(ordinal)
+                self.__books[ordinal] = book
+            for facet, value in self.__values(book).items():
+                bitmap = self.__facets[facet].get(value)
+                if bitmap is None:
+                    bitmap = self.__facets[facet][value] = Bitmap()
+                bitmap.set(ordinal)
+            if book.is_available():
+                self.__available.set(ordinal)
+            else:
+                self.__available.clear(ordinal)
+
+    def set_available(self, isbn, available): # O(1): one bit of one byte
+        ordinal = self.__ordinals.get(isbn)
+        if ordinal is None:
+            return
+        with self.__lock:
+            if available:
+                self.__available.set(ordinal)
+            else:
+                self.__available.clear(ordinal)
+
+    def values(self, facet): # The values of a facet that at least one book has had, e.g. every genre name
+        return list(self.__facets[facet]) # list() copies the keys in one step, so a book added meanwhile can't break the iteration
+
+    def __any_of(self, facet, values): # The books having any of the values (OR), as an integer bitmap
+        bitmaps = self.__facets[facet]
+        bits = 0
+        for value in values:
+            bitmap = bitmaps.get(value)
+            if bitmap is not None:
+                bits |= bitmap.to_int()
+        return bits
+
+    def query(self, available=None, genre=None, category=None, author=None, offset=0, limit=50, count_facets=("genre", "category")):
+        # The books matching every given filter (AND): available=True/False, and for the other facets a list of values of which
+        # a book must have one (OR, so an empty list matches nothing); None doesn't filter on that facet. Returns a FacetResult
+        # with one page of the books and, for the availability and every facet in count_facets, how many of the matches have each
+        # value. Authors are only counted for the authors asked for: counting every author would cost one bitmap per author.
+        bits = (1 << len(self.__books)) - 1 # Every ordinal
+        for facet, values in (("genre", genre), ("category", category), ("author", author)):
+            if values is not None:
+                bits &= self.__any_of(facet, values)
+        available_bits = self.__available.to_int()
+        if available is not None:
+            bits = bits & available_bits if available else bits & ~available_bits
+        counts = {"available": {True: (bits & available_bits).bit_count(), False: (bits & ~available_bits).bit_count()}}
+        for facet in count_facets:
+            counts[facet] = {value: (bits & bitmap.to_int()).bit_count() for value, bitmap in list(self.__facets[facet].items())}
+        if author is not None:
+            counts["author"] = {value: (bits & self.__any_of("author", (value,))).bit_count() for value in author}
+        for facet_counts in counts.values(): # Leaving out the values no matching book has
+            for value in [value for value, count in facet_counts.items() if not count]:
+                del facet_counts[value]
+        books = self.__books
+        page = take_page((books[ordinal] for ordinal in islice(iter_bits(bits), offset, None)), offset, limit)
+        return FacetResult(page, bits.bit_count(), counts)
@@ -1,6 +1,8 @@
 from book import Book
 
 class FictionBook(Book):
+    __slots__ = ("__category",)
+
     def __init__(self, title, author, isbn, genre, category):
         super().__init__(title, author, isbn, genre)
         self.__category = category
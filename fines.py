@@ -0,0 +1,47 @@
+try:
+    import numpy
+except ImportError: # NumPy is optional: without it, fines are computed one loan at a time
+    numpy = None
+import re
+import time
+
+# Due dates and late fines.
+# Every loan is due LOAN_DAYS after it starts. Each started day past the due date costs FINE_PER_DAY, up to MAX_FINE for one loan
+# (about the price of replacing the book). Amounts are integer cents, so balances never pick up floating point rounding errors.
+# A loan remembers how much it has been charged so far, so accruing fines again (e.g. twice the same night) never charges twice.
+
+DAY = 24 * 60 * 60 # Seconds
+LOAN_DAYS = 14
+FINE_PER_DAY = 25 # Cents
+MAX_FINE = 2000 # Cents per loan
+MONEY_PATTERN = re.compile(r"(\d+)(?:\.(\d{1,2}))?")
+
+def format_money(cents): # 250 -> "2.50"
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def format_date(timestamp): # A due date as shown to patrons, e.g. "2024-05-31"
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+def parse_money(text): # "2.5" -> 250, or None if the text isn't an amount with at most two decimals
+    match = MONEY_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    whole, fraction = match.groups()
+    return int(whole) * 100 + int((fraction or "").ljust(2, "0"))
+
+def fine_for(due_at, now, fine_per_day=FINE_PER_DAY, max_fine=MAX_FINE): # The whole fine of a loan at time `now`
+    if now <= due_at:
+        return 0
+    days = -(-(now - due_at) // DAY) # Every started day counts
+    return min(int(days) * fine_per_day, max_fine)
+
+def new_charges(due_dates, charged, now, fine_per_day=FINE_PER_DAY, max_fine=MAX_FINE):
+    # What each loan owes on top of what it has already been charged, for whole columns of due dates and charged amounts.
+    # With NumPy the nightly run over every overdue loan is a handful of array operations instead of a Python loop.
+    if numpy is None or not due_dates:
+        return [fine_for(due_at, now, fine_per_day, max_fine) - already for due_at, already in zip(due_dates, charged)]
+    due = numpy.asarray(due_dates, dtype=numpy.float64)
+    days = numpy.ceil(numpy.maximum(now - due, 0) / DAY).astype(numpy.int64)
+    fines = numpy.minimum(days * fine_per_day, max_fine)
+    return (fines - numpy.asarray(charged, dtype=numpy.int64)).tolist()
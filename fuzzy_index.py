@@ -0,0 +1,125 @@
+from collections import Counter
+
+# Building blocks of the typo-tolerant searches in LibraryService.
+# TrigramIndex finds the words of a vocabulary that look like a misspelled word by the character trigrams they share, and BKTree finds
+# the strings within a small edit distance of a query without comparing it to every string. Both only grow, one entry at a time.
+
+def trigrams(word): # Character trigrams of a word, padded so the start and end of the word count too ("cat" -> "  c", " ca", "cat", "at ")
+    padded = f"  {word} "
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+def levenshtein(a, b, max_distance=None):
+    # Edit distance between two strings (insertions, deletions and substitutions). With max_distance, any distance larger than
+    # that is returned as max_distance + 1, and strings whose lengths alone differ by more are rejected without comparing them.
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a) if max_distance is None else min(len(a), max_distance + 1)
+    # Myers' bit-parallel algorithm: one column of the dynamic programming table is kept as two bit vectors of +1/-1 vertical
+    # steps (one bit per character of b, in a Python int), so each character of a costs a handful of integer operations
+    # instead of a loop over b. That makes a comparison about ten times cheaper, which is what BK-tree inserts and searches pay for.
+    matches = {} # Character -> bit mask of its positions in b
+    for position, char in enumerate(b):
+        matches[char] = matches.get(char, 0) | 1 << position
+    mask = (1 << len(b)) - 1
+    last = 1 << len(b) - 1
+    plus, minus = mask, 0 # Vertical +1 and -1 steps of the current column
+    distance = len(b)
+    for char in a:
+        equal = matches.get(char, 0)
+        vertical = equal | minus
+        horizontal = ((equal & plus) + plus ^ plus) | equal
+        horizontal_plus = minus | ~(horizontal | plus)
+        horizontal_minus = plus & horizontal
+        if horizontal_plus & last:
+            distance += 1
+        elif horizontal_minus & last:
+            distance -= 1
+        horizontal_plus = horizontal_plus << 1 | 1
+        horizontal_minus <<= 1
+        plus = (horizontal_minus | ~(vertical | horizontal_plus)) & mask
+        minus = horizontal_plus & vertical
+    return distance if max_distance is None or distance <= max_distance else max_distance + 1
+
+class TrigramIndex:
+    # A vocabulary of words indexed by character trigrams, for "did you mean" lookups of a misspelled word
+    def __init__(self):
+        self.__postings = {} # trigram -> set of words
+        self.__sizes = {} # word -> number of distinct trigrams, for the similarity score
+
+    def __len__(self):
+        return len(self.__sizes)
+
+    def __contains__(self, word):
+        return word in self.__sizes
+
+    def add(self, word):
+        if word in self.__sizes:
+            return
+        grams = trigrams(word)
+        self.__sizes[word] = len(grams)
+        for gram in grams:
+            self.__postings.setdefault(gram, set()).add(word)
+
+    def similar(self, word, limit=5, min_similarity=0.3):
+        # Returning up to limit (similarity, word) pairs, most similar first. The similarity is the Dice coefficient of the
+        # trigram sets (1.0 for the same word), and only words sharing at least one trigram with the query are ever looked at.
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            posting = self.__postings.get(gram)
+            if posting:
+                shared.update(posting)
+        scored = []
+        for candidate, count in shared.items():
+            similarity = 2 * count / (len(grams) + self.__sizes[candidate])
+            if similarity >= min_similarity:
+                scored.append((similarity, candidate))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return scored[:limit]
+
+class BKTree:
+    # A Burkhard-Keller tree over strings. Every child hangs under its parent at the edit distance between the two, so by the
+    # triangle inequality a search within max_distance only has to visit children in [d - max_distance, d + max_distance].
+    def __init__(self):
+        self.__root = None # [word, {distance: child node}]
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, word):
+        if self.__root is None:
+            self.__root = [word, {}]
+            self.__size = 1
+            return
+        node = self.__root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return # Already in the tree
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self.__size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        # Returning (distance, word) pairs for every word within max_distance edits, closest first
+        if self.__root is None:
+            return []
+        found = []
+        pending = [self.__root]
+        while pending:
+            node_word, children = pending.pop()
+            distance = levenshtein(word, node_word)
+            if distance <= max_distance:
+                found.append((distance, node_word))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        found.sort()
+        return found
@@ -2,27 +2,48 @@ class Genre:
     def __init__(self, name, description):
         self.__name = name
         self.__description = description
-        self.__categories = {}  # Using a dictionary to store categories and their books
+        # Using a dictionary of categories, each one keyed by ISBN, so the genre is an index of its books that can be updated in O(1):
+        self.__categories = {} # category -> {ISBN: Book}, in the order the books were added
+        self.__book_count = 0 # Number of books across all categories, kept up to date on every add/remove
 
     def get_name(self):
         return self.__name
-    
+
     def get_description(self):
         return self.__description
-    
-    def get_categories(self):
-        return self.__categories
-    
+
+    def get_categories(self): # Returning each category with a live view of its books
+        return {category: books.values() for category, books in self.__categories.items()}
+
+    def get_category_books(self, category):
+        return self.__categories.get(category, {}).values()
+
+    def iter_books(self): # Yielding every book of the genre, category by category, without copying anything
+        for books in self.__categories.values():
+            yield from books.values()
+
+    def get_book_count(self):
+        return self.__book_count
+
+    def get_category_count(self, category):
+        return len(self.__categories.get(category, ()))
+
     def add_category(self, category):
         if category not in self.__categories:
-            self.__categories[category] = []
+            self.__categories[category] = {}
 
     def add_book_to_category(self, category, book): # adding a book to the appropriate category within the genre
-        if category in self.__categories:
-            self.__categories[category].append(book)
-        else:
-            self.__categories[category] = [book]
+        books = self.__categories.setdefault(category, {})
+        if book.get_isbn() not in books:
+            self.__book_count += 1
+        books[book.get_isbn()] = book
+
+    def remove_book_from_category(self, category, book):
+        books = self.__categories.get(category)
+        if books is not None and books.get(book.get_isbn()) is book:
+            del books[book.get_isbn()]
+            self.__book_count -= 1
 
     # Using a string representation method to provide a meaningful and informative representation of genre objects when they are converted to strings:
     def __str__(self):
-        return f"Genre: {self.get_name()}, Description: {self.get_description()}, Categories: {', '.join(self.__categories.keys())}"
\ No newline at end of file
+        return f"Genre: {self.get_name()}, Description: {self.get_description()}, Categories: {', '.join(self.__categories.keys())}"
@@ -0,0 +1,170 @@
+from errors import LibraryError
+import functools
+import json
+import math
+import threading
+import time
+
+# Opt-in metrics for LibraryService: call counts, latency percentiles, search result sizes, loan throughput and index hits/misses.
+# Nothing is measured until instrument(service) is called. It replaces the service's public operations on that one instance with
+# timed wrappers, so a service that isn't instrumented runs exactly the same code as before; the only other cost is the
+# "if self.metrics is not None" check in front of the service's hit/miss counters.
+#
+#   metrics = instrument(service)
+#   ...
+#   print(metrics.to_prometheus())   # or metrics.to_json(), or metrics.snapshot() for a dictionary
+
+# The operations wrapped by instrument(), and whether their result is a collection whose size is worth recording:
+INSTRUMENTED_OPERATIONS = {
+    "add_book": False, "register_book": False, "add_user": False, "add_author": False, "add_genre": False,
+    "check_out_book": False, "check_in_book": False, "reserve_book": False, "cancel_reservation": False,
+    "overdue_loans": True, "accrue_fines": True, "pay_fine": False,
+    "search_title": True, "search_author": True, "search_isbn": True,
+    "fuzzy_search_title": True, "fuzzy_search_author": True,
+    "complete_title": True, "complete_author": True, "complete_library_id": True, "filter_books": False,
+    "most_borrowed": True, "genre_utilization": False, "circulation_report": False,
+    "list_books": True, "list_users": True, "list_authors": True, "list_genres": True,
+}
+LOAN_OPERATIONS = ("check_out_book", "check_in_book")
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    # A histogram with logarithmic buckets: every bucket is `factor` times wider than the previous one, so any value from a
+    # microsecond to minutes (or a result size from 1 to millions) is recorded in O(1) with a bounded number of buckets, and
+    # quantiles are accurate to within that factor
+    def __init__(self, base, factor=1.2):
+        self.__base = base # Upper bound of the first bucket
+        self.__log_factor = math.log(factor)
+        self.__factor = factor
+        self.__buckets = {} # Bucket number -> count, only for buckets that have been hit
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0
+
+    def add(self, value):
+        bucket = 0 if value <= self.__base else math.ceil(math.log(value / self.__base) / self.__log_factor)
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q): # The upper bound of the bucket holding the q-th value (capped by the largest value seen)
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.__buckets):
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                return min(self.__base * self.__factor ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES}
+        summary["mean"] = self.sum / self.count if self.count else 0
+        summary["max"] = self.max
+        summary["sum"] = self.sum
+        summary["count"] = self.count
+        return summary
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = {} # Exception class name -> count
+        self.latency = Histogram(base=1e-6) # Seconds, from 1 microsecond up
+        self.result_size = Histogram(base=1) # Only filled for operations returning a collection
+
+class Metrics:
+    def __init__(self):
+        self.__lock = threading.Lock() # Instrumented services may be called from several threads (concurrent mode, HTTP server)
+        self.__operations = {} # Operation name -> OperationStats
+        self.__counters = {} # Counter name -> value, e.g. "title_index_hits"
+        self.started_at = time.time()
+
+    def observe(self, operation, seconds, result_size=None, error=None):
+        with self.__lock:
+            stats = self.__operations.get(operation)
+            if stats is None:
+                stats = self.__operations[operation] = OperationStats()
+            stats.calls += 1
+            stats.latency.add(seconds)
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+            elif result_size is not None:
+                stats.result_size.add(result_size)
+
+    def increment(self, counter, amount=1):
+        with self.__lock:
+            self.__counters[counter] = self.__counters.get(counter, 0) + amount
+
+    def snapshot(self): # All the metrics as a dictionary of plain values
+        with self.__lock:
+            uptime = time.time() - self.started_at
+            operations = {}
+            for name, stats in self.__operations.items():
+                operation = {"calls": stats.calls, "errors": dict(stats.errors), "latency_seconds": stats.latency.summary()}
+                if stats.result_size.count:
+                    operation["result_size"] = stats.result_size.summary()
+                operations[name] = operation
+            loans = sum(stats.calls - sum(stats.errors.values()) for name, stats in self.__operations.items() if name in LOAN_OPERATIONS)
+            return {"uptime_seconds": uptime, "operations": operations, "counters": dict(self.__counters),
+                    "loans": loans, "loans_per_second": loans / uptime if uptime else 0.0}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="library"): # The metrics in the Prometheus text exposition format
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_operation_calls_total Calls of each library operation, failed ones included",
+                 f"# TYPE {prefix}_operation_calls_total counter"]
+        operations = snapshot["operations"]
+        for name, operation in operations.items():
+            lines.append(f'{prefix}_operation_calls_total{{operation="{name}"}} {operation["calls"]}')
+        lines += [f"# HELP {prefix}_operation_errors_total Library operations that raised an error, by error type",
+                  f"# TYPE {prefix}_operation_errors_total counter"]
+        for name, operation in operations.items():
+            for error, count in operation["errors"].items():
+                lines.append(f'{prefix}_operation_errors_total{{operation="{name}",error="{error}"}} {count}')
+        for metric, key, help_text in (("operation_latency_seconds", "latency_seconds", "Latency of each library operation"),
+                                       ("result_size", "result_size", "Number of results returned by searches and listings")):
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} summary"]
+            for name, operation in operations.items():
+                summary = operation.get(key)
+                if summary is None:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f'{prefix}_{metric}{{operation="{name}",quantile="{q}"}} {summary[f"p{round(q * 100)}"]}')
+                lines.append(f'{prefix}_{metric}_sum{{operation="{name}"}} {summary["sum"]}')
+                lines.append(f'{prefix}_{metric}_count{{operation="{name}"}} {summary["count"]}')
+        for counter, value in snapshot["counters"].items():
+            lines += [f"# TYPE {prefix}_{counter}_total counter", f"{prefix}_{counter}_total {value}"]
+        lines += [f"# HELP {prefix}_loans_total Successful checkouts and returns", f"# TYPE {prefix}_loans_total counter",
+                  f"{prefix}_loans_total {snapshot['loans']}"]
+        return "\n".join(lines) + "\n"
+
+def timed(metrics, operation, method, sized):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except LibraryError as e:
+            metrics.observe(operation, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        metrics.observe(operation, time.perf_counter() - start, len(result) if sized else None)
+        return result
+    return wrapper
+
+def instrument(service, metrics=None): # Turning metrics on for a service and returning the Metrics object that collects them
+    metrics = metrics if metrics is not None else Metrics()
+    service.metrics = metrics
+    for operation, sized in INSTRUMENTED_OPERATIONS.items():
+        # Shadowing the class's method with a wrapper on this instance only; the original is always the one defined by the class
+        setattr(service, operation, timed(metrics, operation, getattr(type(service), operation).__get__(service), sized))
+    return metrics
+
+def uninstrument(service): # Turning metrics off again: dropping the wrappers brings back the class's own methods
+    for operation in INSTRUMENTED_OPERATIONS:
+        service.__dict__.pop(operation, None)
+    service.metrics = None
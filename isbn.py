@@ -0,0 +1,64 @@
+try:
+    import numpy
+except ImportError: # NumPy is optional: without it, batches are validated one ISBN at a time
+    numpy = None
+
+# ISBN-13 validation and normalization.
+# An ISBN is accepted with or without hyphens/spaces ("9789295055025", "978-92-95055-02-5", "978 92 95055 02 5") as long as it has
+# 13 digits and a correct check digit, and it is always stored under one canonical key: the hyphenated 3-2-5-2-1 form the library
+# has always used, so the same book can't end up in the catalog twice under two spellings.
+
+ISBN_PREFIXES = ("978", "979") # Every ISBN-13 starts with one of the two "Bookland" prefixes
+ISBN_WEIGHTS = (1, 3) * 6 + (1,) # The check digit makes the weighted sum of all 13 digits a multiple of 10
+CANONICAL_HYPHENS = (3, 6, 12, 15) # Positions of the hyphens in the canonical form: 978-92-95055-02-5
+
+def check_digit(first_twelve): # The ISBN-13 check digit of a 12-digit string
+    return (10 - sum(int(digit) * weight for digit, weight in zip(first_twelve, ISBN_WEIGHTS)) % 10) % 10
+
+def format_isbn(digits): # The canonical hyphenated form of 13 digits
+    return f"{digits[:3]}-{digits[3:5]}-{digits[5:10]}-{digits[10:12]}-{digits[12]}"
+
+def isbn_to_int(isbn): # "978-92-95055-02-5" -> 9789295055025, for fixed-size binary records (see snapshot.py)
+    return int(isbn.replace("-", ""))
+
+def int_to_isbn(number): # 9789295055025 -> "978-92-95055-02-5"
+    return format_isbn(f"{number:013d}")
+
+def canonical_isbn(isbn): # The canonical key of an ISBN, or None if it isn't a valid ISBN-13
+    digits = isbn.replace("-", "").replace(" ", "")
+    if len(digits) != 13 or not digits.isascii() or not digits.isdigit() or not digits.startswith(ISBN_PREFIXES):
+        return None
+    # Summing the ASCII codes directly: every code is the digit plus 48, and those 48s add up to 48 * (7 + 3 * 6) = 1200, a multiple of 10
+    codes = digits.encode("ascii")
+    if (sum(codes[0::2]) + 3 * sum(codes[1::2])) % 10: # Weights 1 and 3 alternate, starting with 1
+        return None
+    return format_isbn(digits)
+
+def is_valid_isbn(isbn):
+    return canonical_isbn(isbn) is not None
+
+def canonical_isbns(isbns):
+    # Validating a whole column of ISBNs (e.g. one import batch) and returning the list of canonical keys, None for each invalid one.
+    # With NumPy the whole column is checked at once as a matrix of bytes, one row per ISBN; otherwise each ISBN is checked on its own.
+    isbns = list(isbns)
+    if numpy is None or not isbns:
+        return [canonical_isbn(isbn) for isbn in isbns]
+    try:
+        raw = numpy.array(isbns, dtype="S17") # 13 digits and at most 4 separators; longer values are rechecked one by one below
+    except UnicodeEncodeError: # Non-ASCII characters somewhere in the column: validating this column one ISBN at a time
+        return [canonical_isbn(isbn) for isbn in isbns]
+    lengths = numpy.fromiter(map(len, isbns), dtype=numpy.int64, count=len(isbns))
+    codes = numpy.frombuffer(raw.tobytes(), dtype=numpy.uint8).reshape(len(isbns), 17)
+    separators = (codes == ord("-")) | (codes == ord(" "))
+    # Moving the separators and the zero padding to the end of each row (a stable sort keeps the digits in order):
+    order = numpy.argsort(separators | (codes == 0), axis=1, kind="stable")
+    digits = numpy.take_along_axis(codes, order, axis=1)[:, :13]
+    values = digits.astype(numpy.int64) - ord("0")
+    valid = ((lengths - separators.sum(axis=1) == 13) & ((values >= 0) & (values <= 9)).all(axis=1)
+             & (values[:, 0] == 9) & (values[:, 1] == 7) & ((values[:, 2] == 8) | (values[:, 2] == 9))
+             & ((values @ numpy.array(ISBN_WEIGHTS)) % 10 == 0))
+    canonical = numpy.full((len(isbns), 17), ord("-"), dtype=numpy.uint8) # The hyphens stay where no digit is written
+    canonical[:, [position for position in range(17) if position not in CANONICAL_HYPHENS]] = digits
+    keys = canonical.view("S17").ravel().tolist()
+    return [canonical_isbn(isbn) if length > 17 else key.decode("ascii") if ok else None
+            for isbn, length, key, ok in zip(isbns, lengths.tolist(), keys, valid.tolist())]
@@ -1,236 +1,340 @@
-from book import Book
-from user import User
-from author import Author
-from genre import Genre
-from fiction import FictionBook
-from nonfiction import NonFictionBook
-import re
+from library_service import LibraryService, validate_isbn, validate_library_id
+from errors import LibraryError, ValidationError, BookUnavailableError
+from pagination import iter_pages
+from fines import DAY, format_date, format_money, parse_money
+import sys
+import time
+
+PAGE_SIZE = 50 # Lines written per page by the listings before asking whether to go on
+MORE_PROMPT = "\n-- Press Enter for more, or 'q' to stop --\n"
 
 class Library:
+    # The interactive (input()/print()) front end of the library. All the bookkeeping happens in LibraryService (library_service.py);
+    # the methods below only prompt for the arguments, call the service and report the outcome.
+
+    def __init__(self, service=None, page_size=PAGE_SIZE):
+        self.service = service if service is not None else LibraryService()
+        self.page_size = page_size
+
+    # Exposing the service's state under the attribute names the rest of the program has always used:
+    @property
+    def books(self):
+        return self.service.books
+
+    @property
+    def loaned_books(self):
+        return self.service.loaned_books
+
+    @property
+    def users(self):
+        return self.service.users
+
+    @property
+    def authors(self):
+        return self.service.authors
+
+    @property
+    def genres(self):
+        return self.service.genres
+
+    def _prompt(self, prompt, retry_prompt, validator): # Asking again until the validator accepts the answer, then returning the cleaned-up value
+        value = input(prompt)
+        while True:
+            try:
+                return validator(value)
+            except ValidationError:
+                value = input(retry_prompt)
 
-    def __init__(self):
-        self.books = {} # Dictionary to store books with ISBN as key
-        self.loaned_books = {} # Dictionary to track loaned books with library ID as key
-        self.users = [] # List to store User objects
-        self.authors = [] # List to store Author objects
-        self.genres = [] # List to store Genre objects
+    def _write_pages(self, lines):
+        # Showing a listing page by page: the lines come from a generator, so the first page appears without walking the whole
+        # collection, and each page goes out as one buffered write instead of one print() call per line
+        for number, page in enumerate(iter_pages(lines, self.page_size)):
+            if number and input(MORE_PROMPT).strip().lower() == "q":
+                return
+            sys.stdout.write("".join(page))
+            sys.stdout.flush()
+
+    def _prompt_isbn(self, prompt="\nBook ISBN (13 digits: example: 978-92-95055-02-5):\n"):
+        return self._prompt(prompt, "\nPlease enter a valid 13-digit ISBN (example: 978-92-95055-02-5):\n", validate_isbn)
+
+    def _prompt_library_id(self, prompt="\nYour library ID (example: AZ12345):\n"):
+        return self._prompt(prompt, "\nPlease enter your library ID in the correct format (example: AZ12345):\n", validate_library_id)
 
     def add_book(self, silent=False): # Using silent parameter to suppress certain prompts or messages when adding a book
         print("\nPlease enter the following information to add a book:")
         title = input("\nBook title:\n").title().strip()
         author = input("\nBook author:\n").title().strip()
         # Checking if the author already exists in the library:
-        author_obj = None # Initializing author_obj as None
-        for existing_author in self.authors:
-            if existing_author.get_name() == author:
-                author_obj = existing_author # Setting author_obj if a match is found
-                break
-        if not author_obj:
+        if not self.service.find_author(author):
             # If the author does not exist, call the add_author function
             print("\nThis author has not been found in the library.")
-            author_obj = self.add_author(silent=silent) # Passing the correct silent parameter
-        isbn = input("\nBook ISBN (13 digits: example: 978-92-95055-02-5):\n").strip()
-        while not re.match(r"^\d{3}-\d{2}-\d{5}-\d{2}-\d{1}$", isbn):
-            isbn = input("\nPlease enter the ISBN in the correct format (example: 978-92-95055-02-5):\n").strip()
-        if isbn in self.books:
+            author = self.add_author(author, silent=silent).get_name() # Passing the correct silent parameter
+        isbn = self._prompt_isbn()
+        replace = isbn in self.books
+        if replace:
             print("\nThis book is already in the library!")
         genre = input("\nPlease enter the type of genre (Fiction or Nonfiction):\n").title().strip()
-        # Checking if the genre exists
-        genre_obj = None
-        for existing_genre in self.genres:
-            if existing_genre.get_name() == genre:
-                genre_obj = existing_genre
-                break
         # If genre does not exist, adding the genre:
-        if not genre_obj:
+        if genre in ("Fiction", "Nonfiction") and not self.service.find_genre(genre):
             # Passing silent parameter to avoid redundant prompts about subject for nonfiction genre
-            genre_obj = self.add_genre(genre, silent=silent)
+            self.add_genre(genre, silent=silent)
         # Prompting for category/subject and creating the appropriate book object
         if genre == "Fiction":
             category = input("\nFiction Genre category:\n").title().strip()
-            genre_obj.add_category(category) # Adding category to genre
-            new_book = FictionBook(title, author_obj, isbn, genre_obj, category)
-            genre_obj.add_book_to_category(category, new_book) # Adding book to genre category
         elif genre == "Nonfiction":
-            subject = input("\nNonFiction Genre subject:\n").title().strip()
-            genre_obj.add_category(subject)
-            new_book = NonFictionBook(title, author_obj, isbn, genre_obj, subject)
-            genre_obj.add_book_to_category(subject, new_book)
+            category = input("\nNonFiction Genre subject:\n").title().strip()
         else:
             print("Invalid genre type. Please specify 'Fiction' or 'Nonfiction'.")
             return
-        # Assigning the newly created book object (new_book) to the books dictionary attribute of the Library class, using the ISBN as the key:
-        self.books[isbn] = new_book
+        try:
+            self.service.add_book(title, author, isbn, genre, category, replace=replace)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
         print(f'\nThe book "{title}" by {author} has been added to the library.')
 
     def add_user(self):
         name = input("\nWhat is your full name?\n").title().strip()
-        library_id = input("\nYour library id (example: AA12345):\n").upper().strip()
-        while not re.match(r"^[A-Za-z]{2}\d{5}$", library_id):
-            library_id = input("\nPlease enter your library_id in the correct format (example: AA123-45678):\n").upper().strip()
+        library_id = self._prompt("\nYour library id (example: AA12345):\n",
+                                  "\nPlease enter your library_id in the correct format (example: AA12345):\n", validate_library_id)
         # Checking if the user already exists in the system:
-        for user in self.users:
-            if user.get_library_id() == library_id:
-                print("\nUser with the same library ID already exists!")
-                return user
-        # If the user doesn't exist, create a new user object and add it to the list:
-        new_user = User(name, library_id)
-        self.users.append(new_user)
+        user = self.service.find_user(library_id)
+        if user:
+            print("\nUser with the same library ID already exists!")
+            return user
+        new_user = self.service.add_user(name, library_id)
         print(f"\n{new_user.name} (Library ID: {new_user.get_library_id()}) has been added as a new user to the library.")
         return new_user
 
     def check_out_book(self):
         print("\nPlease enter the following information:")
-        isbn = input("\nBook ISBN (13 digits: example: 978-92-95055-02-5):\n").strip()
-        while not re.match(r"^\d{3}-\d{2}-\d{5}-\d{2}-\d{1}$", isbn):
-            isbn = input("\nPlease enter the ISBN in the correct format (example: 978-92-95055-02-5):\n").strip()
-        if isbn in self.books:
-            current_user = self.add_user()  # Adding or getting the current user
-            if self.books[isbn].borrow_book():
-                current_user.borrowed_books.append(self.books[isbn]) # Adding the book to the current user's borrowed books
-                print(f'\nThe book "{self.books[isbn].get_title()}" by {self.books[isbn].get_author()}, ISBN: {isbn}, has been loaned to {current_user.name.title()}, library ID {current_user.get_library_id()}')
-                # Adding the book to the loaned_books dictionary:
-                if current_user.get_library_id() not in self.loaned_books:
-                    # Initializing an empty dictionary for the user's library ID. Without it, we will have a KeyError if the ID doesn't exist:
-                    self.loaned_books[current_user.get_library_id()] = {} 
-                self.loaned_books[current_user.get_library_id()][isbn] = self.books[isbn] # Adding the book to the user's library ID dictionary
-            else:
-                print("\nThe book is unavailable!")
-        else:
-           print(f"\nThere is no book with ISBN '{isbn}' in the library!")     
+        isbn = self._prompt_isbn()
+        if isbn not in self.books:
+            print(f"\nThere is no book with ISBN '{isbn}' in the library!")
+            return
+        current_user = self.add_user()  # Adding or getting the current user
+        try:
+            book = self.service.check_out_book(current_user.get_library_id(), isbn)
+        except BookUnavailableError:
+            print("\nThe book is unavailable!")
+            self._offer_reservation(current_user, isbn)
+            return
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        print(f'\nThe book "{book.get_title()}" by {book.get_author()}, ISBN: {isbn}, has been loaned to {current_user.name.title()}, library ID {current_user.get_library_id()}')
+        print(f"\nIt is due back on {format_date(self.service.ledger.get_loan(isbn).due_at)}.")
 
     def check_in_book(self):
         print("\nPlease enter the following information to return a book:")
-        library_id = input("\nYour library ID (example: AZ12345):\n").upper().strip()
-        while not re.match(r"^[A-Za-z]{2}\d{5}$", library_id):
-            library_id = input("\nPlease enter your library ID in the correct format (example: AZ12345):\n").upper().strip()
-        isbn = input("\nBook ISBN (example: 978-92-95055-02-5):\n").strip()
-        while not re.match(r"^\d{3}-\d{2}-\d{5}-\d{2}-\d{1}$", isbn):
-            isbn = input("\nPlease enter the ISBN in the correct format (example: 978-92-95055-02-5):\n").strip()
-        # Looking for the user by Library ID:
-        user = None # Initializing user variable
-        for returning_user in self.users:
-            if returning_user.get_library_id() == library_id:
-                user = returning_user
-                # Adding "break" here to ensure that once the matching user is found, the loop exits immediately reducing the number 
-                # of unnecessary iterations. It also help us avoid potential errors if there are duplicate library IDs or other unforeseen issues:
-                break
-        if user is None:  # If no user is found with the given library ID
-            print(f"\nNo user with Library ID: {library_id} has been found in the library!")
-        else:
-            if library_id in self.loaned_books and isbn in self.loaned_books[library_id]:  # Checking if the book is recorded as loaned to the user
-                book = self.loaned_books[library_id].pop(isbn)  # Removing the book from loaned_books
-                if book in user.borrowed_books:
-                    user.borrowed_books.remove(book)  # Removing the book from the user's borrowed_books list
-                    book.return_book() # Setting the book as available
-                    print(f"\nThe book '{book.get_title()}', ISBN: {isbn} has been returned by {user.name}, (Library ID: {library_id})")
-                else:
-                    # If book was not found in the user's borrowed_books list
-                    print(f"\nThe book with ISBN {isbn} has not been borrowed by {user.name.title()} (Library ID: {library_id})")
-            else:
-                print(f"\nNo record found for the book with ISBN {isbn} borrowed by {user.name.title()}, (Library ID: {library_id})")
+        library_id = self._prompt_library_id()
+        isbn = self._prompt_isbn("\nBook ISBN (example: 978-92-95055-02-5):\n")
+        user = self.service.find_user(library_id)
+        balance = user.get_balance() if user is not None else 0
+        try:
+            book = self.service.check_in_book(library_id, isbn)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        print(f"\nThe book '{book.get_title()}', ISBN: {isbn} has been returned by {user.name}, (Library ID: {library_id})")
+        if user.get_balance() > balance:
+            print(f"\nThe book was returned late: a fine of {format_money(user.get_balance() - balance)} has been charged "
+                  f"(balance: {format_money(user.get_balance())}).")
+        holder = self.service.who_has(isbn) # Set if the book went straight to the first patron waiting for it
+        if holder is not None:
+            print(f"\nIt has been loaned to {holder.name.title()} (Library ID: {holder.get_library_id()}), who had reserved it.")
 
-    def search_book_title(self):
-        title = input("\nEnter the book title:\n").lower().strip()
-        search_result = {}
-        # if search_result = []
-        for isbn, book in self.books.items():
-            if title in book.get_title().lower(): # Checking if the title input is found in any of our books
-                search_result[isbn] = book # Adding all matching books to search results
+    def _offer_reservation(self, user, isbn): # Offering to put the user in line for a book that is on loan
+        answer = input("\nWould you like to reserve it? It will be loaned to you as soon as it is returned (yes/no):\n").lower().strip()
+        if answer not in ("y", "yes"):
+            return
+        try:
+            self.service.reserve_book(user.get_library_id(), isbn)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        position = self.service.reservation_position(user.get_library_id(), isbn)
+        print(f"\nThe book has been reserved for {user.name.title()}, who is number {position} in line.")
+
+    def cancel_reservation(self):
+        print("\nPlease enter the following information to cancel a reservation:")
+        library_id = self._prompt_library_id()
+        isbn = self._prompt_isbn("\nBook ISBN (example: 978-92-95055-02-5):\n")
+        try:
+            reservation = self.service.cancel_reservation(library_id, isbn)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        print(f"\nThe reservation of '{reservation.book.get_title()}' by {reservation.user.name.title()} (Library ID: {library_id}) has been cancelled.")
+
+    def _print_search_result(self, search_result, not_found_message):
         if search_result: # Checking if any books were found
             print("\nThis is what we have found in the library:\n")
             for isbn, book in search_result.items():
                 print(f"{book.get_title()} by {book.get_author()}, ISBN: {isbn}")
         else:
-            print(f"\nNo book titled '{title.title()}' has been found in the library!")
+            print(not_found_message)
 
+    def search_book_title(self, substring=False): # Using the title index by default; substring=True forces the old full scan
+        title = input("\nEnter the book title:\n").lower().strip()
+        search_result = self.service.search_title(title, substring=substring)
+        if not search_result and title: # Maybe a typo: offering the closest titles instead
+            search_result = self.service.fuzzy_search_title(title)
+            if search_result:
+                print(f"\nNo book titled '{title.title()}' has been found, but these titles are close.")
+        self._print_search_result(search_result, f"\nNo book titled '{title.title()}' has been found in the library!")
         return search_result
 
     def search_book_author(self):
         author = input("\nEnter the book author?\n").lower().strip()
-        search_result = {}
-        for isbn, book in self.books.items():
-            if author in book.get_author().lower(): 
-                search_result[isbn] = book
-        if search_result:
-            print("\nThis is what we have found in the library:\n")
-            for isbn, book in search_result.items():
-                print(f"{book.get_title()} by {book.get_author()}, ISBN: {isbn}")
-        else:
-            print(f"\nNo '{author.title()}' has been found in the library!")
-
+        search_result = self.service.search_author(author)
+        if not search_result and author: # Maybe a typo: offering the books of the closest author names instead
+            search_result = self.service.fuzzy_search_author(author)
+            if search_result:
+                print(f"\nNo '{author.title()}' has been found, but these authors have similar names.")
+        self._print_search_result(search_result, f"\nNo '{author.title()}' has been found in the library!")
         return search_result
 
     def search_book_isbn(self):
-        isbn = input("\nEnter the book ISBN (13 digits: example: 978-92-95055-02-5):\n").strip()
-        while not re.match(r"^\d{3}-\d{2}-\d{5}-\d{2}-\d{1}$", isbn):
-                isbn = input("\nPlease enter the ISBN in the correct format (example: 978-92-95055-02-5):\n").strip()
-        search_result = {}
-        for book_isbn, book in self.books.items():
-            if book.get_isbn() == isbn:
-                search_result[isbn] = book
-        if search_result:
-            print("\nThis is what we have found in the library:\n")
-            for book_isbn, book in search_result.items():
-                print(f"{book.get_title()} by {book.get_author()}, ISBN: {book_isbn}")
-        else:
-            print(f"\nNo ISBN '{isbn}' has been found in our library!")
-
+        isbn = self._prompt_isbn("\nEnter the book ISBN (13 digits: example: 978-92-95055-02-5):\n")
+        search_result = self.service.search_isbn(isbn)
+        self._print_search_result(search_result, f"\nNo ISBN '{isbn}' has been found in our library!")
         return search_result
 
+    def filter_books(self): # Narrowing the catalog down by genre, category, author and availability at once
+        print("\nLeave a question empty to not filter on it.")
+        genre = input("\nGenre (Fiction or Nonfiction):\n").strip() or None
+        category = input("\nFiction category or nonfiction subject:\n").strip() or None
+        author = input("\nAuthor:\n").strip() or None
+        answer = input("\nOnly available books (yes), only books on loan (no), or both (empty)?\n").lower().strip()
+        available = True if answer in ("y", "yes") else False if answer in ("n", "no") else None
+        filters = (available, genre, category, author)
+        result = self.service.filter_books(*filters, limit=self.page_size)
+        if not result.total:
+            print("\nNo book matches these filters!")
+            return result
+        print(f"\n{result.total} book{'s' if result.total > 1 else ''} found, {result.counts['available'].get(True, 0)} of them available.")
+        for facet, label in (("genre", "Genres"), ("category", "Categories and subjects"), ("author", "Authors")):
+            if result.counts.get(facet):
+                top = sorted(result.counts[facet].items(), key=lambda item: -item[1])[:10] # The ten most common values
+                print(f"{label}: {', '.join(f'{value} ({count})' for value, count in top)}")
+        print()
+        self._write_pages(self._filtered_book_lines(result.books, filters))
+        return result
+
+    def _filtered_book_lines(self, page, filters): # The matching books, asking the service for the next page when the last one is shown
+        while True:
+            for book in page:
+                yield f"{book.get_title()} by {book.get_author()}, ISBN: {book.get_isbn()}{'' if book.is_available() else ' (on loan)'}\n"
+            if page.next_offset is None:
+                return
+            page = self.service.filter_books(*filters, offset=page.next_offset, limit=self.page_size).books
+
     def display_all_books(self):
         print("\nHere is the list of books in the library:\n")
-        for isbn, book in self.books.items():
-            print(f"{book.get_title()} by {book.get_author()}, ISBN: {isbn}")
         if not self.books:
             print("Currently, there are no books in the library!")
+        else:
+            self._write_pages(f"{book.get_title()} by {book.get_author()}, ISBN: {book.get_isbn()}\n" for book in self.service.iter_books())
               
     def display_all_loaned_books(self):
         print("\nHere is the list of loaned books in the library:")
-        if not self.loaned_books: # First checking if there are no loaned books before iterating over each book and Library ID
+        if not self.service.has_loans(): # Asking the loan ledger, instead of checking every user
             print("\nNo books are currently loaned!")
         else:
-            for library_id, books in self.loaned_books.items(): # Iterating over each library_id and its associated books in loaned_books dictionary
-                user = self.find_user_by_library_id(library_id) # Finding the user associated with the current library_id
-                if user and user.borrowed_books: # Checking if the user exists and has borrowed books
-                    print(f"\nBooks loaned to {user.name} (Library ID: {library_id}):")
-                    # Iterating over each book (ISBN and Book object) loaned to the user:
-                    for isbn, book in books.items():
-                        print(f"\n{book.get_title()} by {book.get_author()}, ISBN: {isbn}") 
-                elif not user:
-                    # Although the code set up ensures that each borrowed book is linked to a valid user through their library ID, 
-                    # the message will be printed in case no user is found for loaned books:
-                    print(f"\nBooks loaned to unknown user (Library ID {library_id}):")
-        # Checking if there are no loaned books at all or no users with borrowed books
-        # If there are no users with borrowed books, it prints the message "No books are currently loaned!". Otherwise, it doesn't print anything
-        if not any(user.borrowed_books for user in self.users):
-            print("\nNo books are currently loaned!")   
+            self._write_pages(self._loaned_book_lines())
+
+    def display_overdue_books(self):
+        print("\nHere is the list of overdue books, the most overdue first:")
+        if not self.service.overdue_loans():
+            print("\nNo books are overdue!")
+        else:
+            self._write_pages(self._overdue_book_lines())
+
+    def _overdue_book_lines(self):
+        now = time.time()
+        for loan in self.service.overdue_loans(now):
+            book, user = loan.book, loan.user
+            days = int((now - loan.due_at) // DAY) + 1
+            yield (f"\n{book.get_title()}, ISBN: {book.get_isbn()}, loaned to {user.name} (Library ID: {user.get_library_id()}), "
+                   f"due {format_date(loan.due_at)} ({days} day{'s' if days > 1 else ''} late)\n")
+
+    def display_circulation_report(self):
+        report = self.service.circulation_report()
+        if not report["checkouts"] and not report["returns"]:
+            print("\nNo books have been borrowed yet!")
+            return
+        print(f"\n{report['checkouts']} checkout(s) and {report['returns']} return(s) by {report['borrowers']} borrower(s); "
+              f"{report['active_borrowers']} user(s) have books right now.")
+        print("\nMost borrowed books:")
+        for book, count in report["most_borrowed"]:
+            print(f"  - {book.get_title()} by {book.get_author()}: {count} time{'s' if count > 1 else ''}")
+        print("\nGenres:")
+        for name, genre in self.service.genre_utilization().items():
+            print(f"  - {name}: {genre['checkouts']} checkout(s), {genre['on_loan']} of {genre['books']} book(s) on loan "
+                  f"({genre['utilization']:.0%})")
+        days = report["loan_days"]
+        if days["count"]:
+            print(f"\nLoan durations: {days['mean']:.1f} days on average, half within {days['p50']:.1f} days, "
+                  f"90% within {days['p90']:.1f} days, longest {days['max']:.1f} days.")
+
+    def pay_fine(self):
+        print("\nPlease enter the following information to pay a fine:")
+        library_id = self._prompt_library_id()
+        user = self.service.find_user(library_id)
+        if user is None:
+            print(f"\nNo user was found with Library ID {library_id}.")
+            return
+        if not user.get_balance():
+            print(f"\n{user.name.title()} (Library ID: {library_id}) has no fines to pay.")
+            return
+        amount = parse_money(input(f"\nThe balance is {format_money(user.get_balance())}. How much is being paid?\n"))
+        if amount is None or not 0 < amount <= user.get_balance():
+            print(f"\nPlease enter an amount between 0.01 and {format_money(user.get_balance())}.")
+            return
+        try:
+            balance = self.service.pay_fine(library_id, amount)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        print(f"\nThank you! The remaining balance of {user.name.title()} (Library ID: {library_id}) is {format_money(balance)}.")
+
+    def _loaned_book_lines(self):
+        # Iterating over the users who currently have books and the books loaned to each of them, straight from the loan ledger:
+        for user in self.service.ledger.borrowers():
+            yield f"\nBooks loaned to {user.name} (Library ID: {user.get_library_id()}):\n"
+            for isbn, book in user.get_loans().items():
+                yield f"\n{book.get_title()} by {book.get_author()}, ISBN: {isbn}\n"
                 
     def view_user_info(self):
         print("\nPlease enter the following information:")
-        library_id = input("\nLibrary ID (example: AZ12345):\n").upper().strip()
-        while not re.match(r"^[A-Za-z]{2}\d{5}$", library_id):
-            library_id = input("\nPlease enter the Library ID in the correct format (example: AZ12345):\n").upper().strip()
+        library_id = self._prompt("\nLibrary ID (example: AZ12345):\n",
+                                  "\nPlease enter the Library ID in the correct format (example: AZ12345):\n", validate_library_id)
         # Finding the user with the given library ID:
         user = self.find_user_by_library_id(library_id)
         if user:
             user.show_user_info() # Displaying user's borrowed books
+            if user.get_balance():
+                print(f"\nUnpaid fines: {format_money(user.get_balance())}")
+            reservations = self.service.reservations.of_user(library_id)
+            if reservations:
+                print(f"\nBooks reserved by {user.name.title()}:\n")
+                for reservation in reservations:
+                    book = reservation.book
+                    position = self.service.reservation_position(library_id, book.get_isbn())
+                    print(f"'{book.get_title()}' by {book.get_author()}, ISBN: {book.get_isbn()}, number {position} in line")
         else:
             print(f"\nNo user was found with Library ID {library_id}.") # Printing this message if no user is found with the given Library ID
     
-    def find_user_by_library_id(self, library_id): # Searching for and returning a user by their Library ID, or None if the user is not found
-        for user in self.users:
-            if user.get_library_id() == library_id:
-                return user
-        return None
+    def find_user_by_library_id(self, library_id): # Returning a user by their Library ID, or None if the user is not found
+        return self.service.find_user(library_id)
     
     def display_all_users(self):
         print("\nHere is the list of current users in the library:")
         if not self.users:
             print("\nNo users are found!")
         else:
-            for user in self.users:
-                print(f"\n{user.name.title()} (Library ID: {user.get_library_id()})")
+            self._write_pages(f"\n{user.name.title()} (Library ID: {user.get_library_id()})\n" for user in self.service.iter_users())
 
     def add_author(self, author=None, silent=False): # Making the author parameter optional. It allows us to call the method within add_book() without needing to providing an author argument
                                                      # Adding an optional silent parameter. When silent is True, it suppresses the messages about the author already existing or being added
@@ -239,103 +343,89 @@ class Library:
             author = input("\nAuthor's full name:\n").title().strip()
         else:
             print(f"\nAdding a new author: {author}")
-        biography = input("\nAuthor's biography (no more than 300 characters):\n").capitalize().strip()
-        if len(biography) > 300:
-            biography = biography[:300]
-        new_author = Author(author, biography)
-        # Checking if an author with the same name already exists in the library
-        if any(existing_author.get_name() == author for existing_author in self.authors):
+        # Checking if an author with the same name already exists in the library, and returning that author instead of a duplicate
+        existing_author = self.service.find_author(author)
+        if existing_author:
             if not silent:
-                print(f"\n{new_author.get_name()} already exists in the library")
-        else:
-            self.authors.append(new_author)
-            if not silent:
-                print(f"\n{new_author.get_name()} has been added to the list of authors in the library.")
+                print(f"\n{existing_author.get_name()} already exists in the library")
+            return existing_author
+        biography = input("\nAuthor's biography (no more than 300 characters):\n").capitalize().strip()
+        new_author = self.service.add_author(author, biography) # The service trims the biography to 300 characters
+        if not silent:
+            print(f"\n{new_author.get_name()} has been added to the list of authors in the library.")
         
         return new_author
     
     def view_author_details(self):
         author_name = input("\nPlease enter the name of the author you are interested in:\n").title().strip()
-        # Looking for the authors containing the entered name:
-        matched_authors = [author for author in self.authors if author.get_name() == author_name]
-        if matched_authors:
-            if len(matched_authors) > 1:
-                # If multiple authors match, listing them and letting the user choose
-                print(f"\nMultiple authors found matching '{author_name}':")
-                for idx, author in enumerate(matched_authors, start=1): # Enumerating over matched authors to list them with index numbers starting from 1
-                    print(f"{idx}. {author.get_name()}")
-                # Asking user to select an author:
-                choice = input("\nEnter the number of the author you want to view:\n").strip()
-                while not choice.isdigit() or int(choice) < 1 or int(choice) > len(matched_authors):
-                    choice = input("\nInvalid choice. Please enter a valid number:\n").strip()
-                # Display the selected author's information
-                chosen_author = matched_authors[int(choice) - 1] # Getting the chosen author based on the user's selection and deduct 1 to match the index
-                chosen_author.show_author_info() # Displaying the selected author's information
-            else:
-                # If only one author matches, show that author's information
-                matched_authors[0].show_author_info()
-        else:
-            print(f"\n{author_name} is not in the list of authors in the library!")
+        # Looking the author up by name (author names are unique keys in the authors registry):
+        try:
+            author = self.service.get_author(author_name)
+        except LibraryError as e:
+            print(f"\n{e}")
+            return
+        author.show_author_info()
     
     def display_all_authors(self):
         print("\nHere is the list of current authors in the library:")
         if not self.authors:
             print("\nNo authors have been added to the library yet!")
         else:
-            for author in self.authors:
-                print(f"\nAuthor: {author.get_name()}")
-                print(f"Biography: {author.get_biography()}")
+            self._write_pages(f"\nAuthor: {author.get_name()}\nBiography: {author.get_biography()}\n" for author in self.service.iter_authors())
 
     def add_genre(self, genre=None, silent=False): # Making the genre parameter optional. It allows us to call the method within add_book() without needing to providing a genre argument
                                                    # Adding an optional silent parameter. When silent is True, it suppresses the messages about the genre already existing or being added
         if genre is None:
             genre = input("\nPlease enter the type of genre you want to add (Fiction or Nonfiction):\n").title().strip()
 
-        if genre == "Fiction" or genre == "Nonfiction":
-            description = input("\nGenre description (no more than 200 characters):\n").capitalize().strip()
-            if len(description) > 200:
-                description = description[:200]
-            new_genre = Genre(genre, description)
-        else:
+        if genre != "Fiction" and genre != "Nonfiction":
             print("Invalid genre type. Please specify 'Fiction' or 'Nonfiction'.")
             return None
-        for existing_genre in self.genres: # Checking if the genre already exists:
-            if existing_genre.get_name() == new_genre.get_name():
-                if genre == "Fiction":
-                    category = input("\nFiction Genre category:\n").title().strip()
-                    existing_genre.add_category(category)
-                elif genre == "Nonfiction":
-                    subject = input("\nNonFiction Genre subject:\n").title().strip()
-                    existing_genre.add_category(subject)
-                return existing_genre
-        self.genres.append(new_genre) # If it doesn't exist, adding the new genre to the list
+        existing_genre = self.service.find_genre(genre) # Checking if the genre already exists:
+        if existing_genre:
+            if genre == "Fiction":
+                category = input("\nFiction Genre category:\n").title().strip()
+                self.service.add_category(genre, category)
+            elif genre == "Nonfiction":
+                subject = input("\nNonFiction Genre subject:\n").title().strip()
+                self.service.add_category(genre, subject)
+            return existing_genre
+        description = input("\nGenre description (no more than 200 characters):\n").capitalize().strip()
+        new_genre = self.service.add_genre(genre, description) # The service trims the description to 200 characters
         if not silent:
             print(f"\nGenre '{new_genre.get_name()}' has been added to the list of genres in the library.")
 
         return new_genre
     
     def view_genre_details(self):
-        for genre in self.genres:
-            print(f"\nGenre: {genre.get_name()}, Description: {genre.get_description()}")
+        self.service.load_all() # Genres list their books by category, so every book has to be in memory
+        self._write_pages(self._genre_detail_lines())
+
+    def _genre_detail_lines(self):
+        for genre in self.service.iter_genres():
+            yield f"\nGenre: {genre.get_name()}, Description: {genre.get_description()}\n"
+            # Streaming each category straight from the genre's own index, with the count kept by the genre:
             for category, books in genre.get_categories().items():
-                print(f"Category: {category}")
+                yield f"Category: {category} - {genre.get_category_count(category)} book(s)\n"
                 for book in books:
-                    print(f"  - {book}")
+                    yield f"  - {book}\n"
    
     def view_all_genres(self):
         print("\nHere is the list of all genres in the library:")
+        self.service.load_all()
         if not self.genres:
             print("\nNo genres have been added to the library yet!")
         else:
-            for genre in self.genres:
-                print(f"\nGenre: {genre.get_name()}")
-                print(f"Description: {genre.get_description()}")
-                print("\nBooks in this genre:")
-                # Using self.books.values() to access all the Book objects stored in the library, regardless of their ISBN keys:
-                genre_books = [book for book in self.books.values() if book.get_genre() == genre]
-                if genre_books:
-                    for book in genre_books:
-                        # Using book.get_author().get_name() call to first retrieve the Author object and then get the name of the author:
-                        print(f"  - Title: {book.get_title()}, Author: {book.get_author().get_name()}")
-                else:
-                    print("  - No books in this genre")
\ No newline at end of file
+            self._write_pages(self._genre_lines())
+
+    def _genre_lines(self):
+        for genre in self.service.iter_genres():
+            yield f"\nGenre: {genre.get_name()}\nDescription: {genre.get_description()}\n"
+            yield f"\nBooks in this genre ({genre.get_book_count()}):\n"
+            # Reading the books from the genre's own index instead of scanning the whole catalog for each genre:
+            if genre.get_book_count():
+                for book in genre.iter_books():
+                    # Using book.get_author().get_name() call to first retrieve the Author object and then get the name of the author:
+                    yield f"  - Title: {book.get_title()}, Author: {book.get_author().get_name()}\n"
+            else:
+                yield "  - No books in this genre\n"
\ No newline at end of file
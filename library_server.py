@@ -0,0 +1,399 @@
+from library_service import LibraryService
+from serialization import book_to_dict, user_to_dict, loan_to_dict, reservation_to_dict
+from storage import SQLiteStore
+from snapshot import SnapshotStore
+from instrumentation import instrument
+from errors import (LibraryError, NotFoundError, DuplicateError, BookUnavailableError, BookAvailableError, BookOnLoanError,
+                    LoanNotFoundError, ReadOnlyStoreError)
+from urllib.parse import urlsplit, parse_qs, unquote
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import argparse
+import asyncio
+import json
+
+# A small asyncio HTTP/1.1 server exposing the library as JSON endpoints, so several branch terminals can share one catalog.
+# Only the standard library is used. Connections are kept alive between requests, list endpoints are streamed with chunked
+# transfer encoding (HTTP/1.0 clients get the whole list with a Content-Length), and at most max_concurrent_requests requests are
+# processed at the same time. The event loop only parses and writes: service calls run on a pool of max_concurrent_requests threads,
+# so a slow query or a database write never stalls the other connections. The service must therefore be a LibraryService(concurrent=True).
+#
+#   GET  /books?offset=&limit=      books (streamed)              POST /books    {"title", "author", "isbn", "genre", "category"}
+#   GET  /books/<isbn>              one book                      POST /users    {"name", "library_id"}
+#   GET  /search?title=... | ?author=... | ?isbn=...              GET  /users?offset=&limit=  users (streamed)
+#   GET  /search?title=...&fuzzy=1 | ?author=...&fuzzy=1  closest matches for misspelled queries
+#   GET  /complete?title=... | ?author=... | ?library_id=...  (&limit=10)  as-you-type suggestions
+#   GET  /facets?genre=&category=&author=&available=true|false&offset=&limit=  filtered books with per-facet counts
+#        (genre and category take comma-separated names, any of which matches)
+#   POST /loans   {"library_id", "isbn"}  borrow a book           GET  /users/<library id>
+#   POST /returns {"library_id", "isbn"}  return a book           GET  /loans    all loans (streamed)
+#   POST /reservations  {"library_id", "isbn", "priority"}  wait for a book on loan      GET /reservations/<isbn>  its waitlist
+#   POST /cancellations {"library_id", "isbn"}  cancel a reservation
+#   GET  /overdue   overdue loans, most overdue first          POST /payments {"library_id", "amount" (cents)}  pay a fine
+#   POST /accruals  bring every fine up to date (nightly)
+#   GET  /circulation?since=&until=&limit=10   loans, borrowers, most borrowed books and loan durations between two Unix timestamps
+#   GET  /circulation/genres   checkouts and the share of each genre's books on loan
+#   GET  /metrics, /metrics.json    Prometheus text / JSON metrics, when started with --metrics
+# Started with --snapshot instead of --db, the server is a read-only replica: every request that would change the library gets 403.
+
+MAX_BODY_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 200 # Items per chunk written to the socket when streaming a list
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+def serialize_chunk(items, to_dict): # The next STREAM_CHUNK_SIZE items of an iterator as comma-separated JSON, or "" at its end
+    return ",".join(json.dumps(to_dict(item)) for item in islice(items, STREAM_CHUNK_SIZE))
+
+def error_status(error): # Mapping the service's exceptions to HTTP status codes
+    if isinstance(error, (LoanNotFoundError, NotFoundError)):
+        return 404
+    if isinstance(error, (DuplicateError, BookUnavailableError, BookAvailableError, BookOnLoanError)):
+        return 409
+    if isinstance(error, ReadOnlyStoreError): # A snapshot replica only answers reads
+        return 403
+    return 400 # ValidationError and anything else the client got wrong
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    def __init__(self, method, path, query, headers, body, version):
+        self.method = method
+        self.path = path
+        self.query = query # Parameter -> first value
+        self.headers = headers # Lower-cased header name -> value
+        self.body = body
+        self.version = version
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+
+    def field(self, data, name):
+        value = data.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise HTTPError(400, f"Missing field '{name}'")
+        return value.strip()
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+def resume_listing(listing, offset, limit):
+    # The entities of a lazy listing (service.iter_books or iter_users) from offset on, at most limit of them (None for all).
+    # Requests running on other threads may add entities while the listing is read, which invalidates a dictionary's iterator;
+    # entities are only ever appended, so the listing is then opened again right after the last entity read (see pagination.py).
+    read = 0
+    while limit is None or read < limit:
+        try:
+            for item in listing(offset + read):
+                yield item
+                read += 1
+                if read == limit:
+                    return
+            return
+        except RuntimeError: # "dictionary changed size during iteration"
+            continue
+
+class LibraryServer:
+    def __init__(self, service, host="127.0.0.1", port=8080, max_concurrent_requests=64):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.__request_slots = asyncio.Semaphore(max_concurrent_requests)
+        self.__executor = ThreadPoolExecutor(max_concurrent_requests, thread_name_prefix="library-request")
+        self.__server = None
+
+    async def start(self):
+        self.__server = await asyncio.start_server(self.__handle_connection, self.host, self.port)
+        self.port = self.__server.sockets[0].getsockname()[1] # The actual port when 0 was asked for
+        return self
+
+    async def serve_forever(self):
+        if self.__server is None:
+            await self.start()
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def close(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        self.__executor.shutdown(wait=False)
+
+    async def __run(self, function, *args): # Calling the service on the thread pool, off the event loop
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, partial(function, *args))
+
+    # Connections and HTTP framing:
+    async def __handle_connection(self, reader, writer):
+        try:
+            while True: # Serving requests one after another on the same connection until the client closes it
+                try:
+                    request = await self.__read_request(reader)
+                except HTTPError as e:
+                    await self.__send_json(writer, e.status, {"error": "BadRequest", "message": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                async with self.__request_slots:
+                    await self.__dispatch(request, writer)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def __read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None # The client closed the connection
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        return Request(method.upper(), unquote(url.path), query, headers, body, version)
+
+    def __head(self, status, keep_alive, extra, content_type="application/json"):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}", f"Content-Type: {content_type}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"] + extra
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def __send_json(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(self.__head(status, keep_alive, [f"Content-Length: {len(body)}"]) + body)
+        await writer.drain()
+
+    async def __send_text(self, writer, text, content_type, keep_alive=True):
+        body = text.encode("utf-8")
+        writer.write(self.__head(200, keep_alive, [f"Content-Length: {len(body)}"], content_type) + body)
+        await writer.drain()
+
+    async def __send_stream(self, writer, request, items, to_dict):
+        # Streaming a JSON array with chunked transfer encoding: the first items go out before the rest of the list has been read.
+        # Items are read and serialized STREAM_CHUNK_SIZE at a time on the thread pool, since reading them may load them from the store.
+        items = iter(items)
+        read_chunk = partial(serialize_chunk, items, to_dict)
+        if request.version == "HTTP/1.0": # No chunked encoding before HTTP/1.1: the whole array is sent with its length
+            pieces = []
+            while chunk := await self.__run(read_chunk):
+                pieces.append(chunk)
+            body = ("[" + ",".join(pieces) + "]").encode("utf-8")
+            writer.write(self.__head(200, request.keep_alive, [f"Content-Length: {len(body)}"]) + body)
+            await writer.drain()
+            return
+        writer.write(self.__head(200, request.keep_alive, ["Transfer-Encoding: chunked"]))
+        separator = "["
+        while chunk := await self.__run(read_chunk):
+            self.__write_chunk(writer, separator + chunk)
+            separator = ","
+            await writer.drain() # Letting slow clients apply back-pressure and other connections run
+        self.__write_chunk(writer, "[]" if separator == "[" else "]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def __write_chunk(self, writer, text):
+        data = text.encode("utf-8")
+        writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+
+    # Routing:
+    async def __dispatch(self, request, writer):
+        keep_alive = request.keep_alive
+        try:
+            await self.__route(request, writer, keep_alive)
+        except HTTPError as e:
+            await self.__send_json(writer, e.status, {"error": "HTTPError", "message": str(e)}, keep_alive)
+        except LibraryError as e:
+            await self.__send_json(writer, error_status(e), {"error": type(e).__name__, "message": str(e)}, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            await self.__send_json(writer, 500, {"error": type(e).__name__, "message": str(e)}, keep_alive)
+
+    def __page(self, request, listing): # The entities selected by the optional ?offset=...&limit=... parameters of a listing, read lazily
+        try:
+            offset = int(request.query.get("offset", 0))
+            limit = int(request.query["limit"]) if "limit" in request.query else None
+        except ValueError:
+            raise HTTPError(400, "offset and limit must be integers")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise HTTPError(400, "offset and limit can't be negative")
+        return resume_listing(listing, offset, limit)
+
+    async def __route(self, request, writer, keep_alive):
+        service = self.service
+        run = self.__run
+        parts = [part for part in request.path.split("/") if part]
+        method = request.method
+        if parts == ["books"] and method == "GET":
+            await self.__send_stream(writer, request, self.__page(request, service.iter_books), book_to_dict)
+        elif parts == ["books"] and method == "POST":
+            data = request.json()
+            book = await run(service.add_book, request.field(data, "title"), request.field(data, "author"), request.field(data, "isbn"),
+                             request.field(data, "genre").title(), request.field(data, "category"))
+            await self.__send_json(writer, 201, book_to_dict(book), keep_alive)
+        elif len(parts) == 2 and parts[0] == "books" and method == "GET":
+            await self.__send_json(writer, 200, book_to_dict(await run(service.get_book, parts[1])), keep_alive)
+        elif parts == ["search"] and method == "GET":
+            fuzzy = request.query.get("fuzzy") in ("1", "true") # Typo-tolerant search: the closest matches, best first
+            if "title" in request.query:
+                title = request.query["title"]
+                result = await run(service.fuzzy_search_title if fuzzy else service.search_title, title)
+            elif "author" in request.query:
+                author = request.query["author"]
+                result = await run(service.fuzzy_search_author if fuzzy else service.search_author, author)
+            elif "isbn" in request.query:
+                result = await run(service.search_isbn, request.query["isbn"])
+            else:
+                raise HTTPError(400, "Search needs a title, author or isbn parameter")
+            await self.__send_stream(writer, request, result.values(), book_to_dict)
+        elif parts == ["complete"] and method == "GET":
+            try:
+                limit = int(request.query.get("limit", 10))
+            except ValueError:
+                raise HTTPError(400, "limit must be an integer")
+            if "title" in request.query:
+                completions = await run(service.complete_title, request.query["title"], limit)
+            elif "author" in request.query:
+                completions = await run(service.complete_author, request.query["author"], limit)
+            elif "library_id" in request.query:
+                completions = await run(service.complete_library_id, request.query["library_id"], limit)
+            else:
+                raise HTTPError(400, "Completion needs a title, author or library_id parameter")
+            await self.__send_json(writer, 200, completions, keep_alive)
+        elif parts == ["facets"] and method == "GET":
+            query = request.query
+            try:
+                offset = int(query.get("offset", 0))
+                limit = int(query.get("limit", 50))
+            except ValueError:
+                raise HTTPError(400, "offset and limit must be integers")
+            if "available" in query and query["available"] not in ("true", "false", "1", "0"):
+                raise HTTPError(400, "available must be true or false")
+            available = query["available"] in ("true", "1") if "available" in query else None
+            genre = query["genre"].split(",") if "genre" in query else None
+            category = query["category"].split(",") if "category" in query else None
+            result = await run(service.filter_books, available, genre, category, query.get("author"), max(0, offset), max(0, limit))
+            counts = {facet: [{"value": value, "count": count} for value, count in values.items()] for facet, values in result.counts.items()}
+            await self.__send_json(writer, 200, {"total": result.total, "counts": counts, "books": [book_to_dict(book) for book in result.books],
+                                                 "next_offset": result.books.next_offset}, keep_alive)
+        elif parts == ["users"] and method == "GET":
+            await self.__send_stream(writer, request, self.__page(request, service.iter_users), user_to_dict)
+        elif parts == ["users"] and method == "POST":
+            data = request.json()
+            user = await run(service.add_user, request.field(data, "name"), request.field(data, "library_id"))
+            await self.__send_json(writer, 201, user_to_dict(user), keep_alive)
+        elif len(parts) == 2 and parts[0] == "users" and method == "GET":
+            await self.__send_json(writer, 200, user_to_dict(await run(service.get_user, parts[1].upper())), keep_alive)
+        elif parts == ["loans"] and method == "GET":
+            await self.__send_stream(writer, request, await run(lambda: list(service.ledger.loans())), loan_to_dict)
+        elif parts == ["overdue"] and method == "GET":
+            await self.__send_stream(writer, request, await run(service.overdue_loans), loan_to_dict)
+        elif parts == ["circulation"] and method == "GET":
+            query = request.query
+            try:
+                since = float(query["since"]) if "since" in query else None
+                until = float(query["until"]) if "until" in query else None
+                limit = int(query.get("limit", 10))
+            except ValueError:
+                raise HTTPError(400, "since and until must be timestamps and limit an integer")
+            report = await run(service.circulation_report, since, until, max(0, limit))
+            report["most_borrowed"] = [dict(book_to_dict(book), checkouts=count) for book, count in report["most_borrowed"]]
+            await self.__send_json(writer, 200, report, keep_alive)
+        elif parts == ["circulation", "genres"] and method == "GET":
+            await self.__send_json(writer, 200, await run(service.genre_utilization), keep_alive)
+        elif parts == ["loans"] and method == "POST":
+            data = request.json()
+            book = await run(service.check_out_book, request.field(data, "library_id"), request.field(data, "isbn"))
+            await self.__send_json(writer, 201, book_to_dict(book), keep_alive)
+        elif parts == ["returns"] and method == "POST":
+            data = request.json()
+            book = await run(service.check_in_book, request.field(data, "library_id"), request.field(data, "isbn"))
+            await self.__send_json(writer, 200, book_to_dict(book), keep_alive)
+        elif parts == ["payments"] and method == "POST":
+            data = request.json()
+            library_id = request.field(data, "library_id")
+            balance = await run(service.pay_fine, library_id, data.get("amount"))
+            await self.__send_json(writer, 200, {"library_id": library_id.upper(), "balance": balance}, keep_alive)
+        elif parts == ["accruals"] and method == "POST": # Bringing every fine up to date; meant to be called once a night, e.g. by cron
+            await self.__send_json(writer, 200, {"charged": await run(service.accrue_fines)}, keep_alive)
+        elif parts == ["reservations"] and method == "POST":
+            data = request.json()
+            priority = data.get("priority", 0)
+            if not isinstance(priority, int):
+                raise HTTPError(400, "priority must be an integer")
+            reservation = await run(service.reserve_book, request.field(data, "library_id"), request.field(data, "isbn"), priority)
+            await self.__send_json(writer, 201, reservation_to_dict(reservation), keep_alive)
+        elif len(parts) == 2 and parts[0] == "reservations" and method == "GET":
+            await self.__send_stream(writer, request, await run(service.waitlist, parts[1]), reservation_to_dict)
+        elif parts == ["cancellations"] and method == "POST":
+            data = request.json()
+            reservation = await run(service.cancel_reservation, request.field(data, "library_id"), request.field(data, "isbn"))
+            await self.__send_json(writer, 200, reservation_to_dict(reservation), keep_alive)
+        elif parts in (["metrics"], ["metrics.json"]) and method == "GET":
+            if service.metrics is None:
+                raise HTTPError(404, "Metrics are off (start the server with --metrics)")
+            if parts == ["metrics"]:
+                await self.__send_text(writer, await run(service.metrics.to_prometheus), "text/plain; version=0.0.4", keep_alive)
+            else:
+                await self.__send_text(writer, await run(service.metrics.to_json), "application/json", keep_alive)
+        elif parts and parts[0] in ("books", "search", "complete", "facets", "users", "loans", "returns", "overdue", "circulation", "payments", "accruals",
+                                    "reservations", "cancellations"):
+            raise HTTPError(405, f"{method} is not allowed on {request.path}")
+        else:
+            raise HTTPError(404, f"No endpoint at {request.path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the library as JSON over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", help="SQLite database to serve (default: an empty in-memory library)")
+    parser.add_argument("--snapshot", help="Binary catalog snapshot to serve as a read-only replica (see snapshot.py)")
+    parser.add_argument("--max-concurrent-requests", type=int, default=64)
+    parser.add_argument("--metrics", action="store_true", help="Collect metrics and serve them at /metrics and /metrics.json")
+    args = parser.parse_args()
+    if args.db and args.snapshot:
+        parser.error("--db and --snapshot can't be combined")
+    service = LibraryService(SQLiteStore(args.db) if args.db else SnapshotStore(args.snapshot) if args.snapshot else None, concurrent=True)
+    if args.metrics:
+        instrument(service)
+    server = LibraryServer(service, args.host, args.port, args.max_concurrent_requests)
+    print(f"Serving the library on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.store.close()
@@ -0,0 +1,814 @@
+from user import User
+from author import Author
+from genre import Genre
+from fiction import FictionBook
+from nonfiction import NonFictionBook
+from token_index import TokenIndex, tokenize
+from fuzzy_index import TrigramIndex, BKTree, levenshtein
+from autocomplete import PrefixIndex
+from storage import MemoryStore
+from loan_ledger import LoanLedger
+from reservations import Reservations
+from search_cache import SearchCache, SEARCH_CACHE_SIZE
+from facets import FacetIndex
+from circulation import CirculationAnalytics
+from fines import DAY, LOAN_DAYS, FINE_PER_DAY, MAX_FINE, fine_for, new_charges
+from striped_lock import StripedLock, ReadWriteLock, NoLock
+from pagination import take_page
+from isbn import canonical_isbn
+from errors import (InvalidISBNError, InvalidLibraryIDError, InvalidGenreError, BookNotFoundError, UserNotFoundError, AuthorNotFoundError,
+                    DuplicateBookError, DuplicateUserError, DuplicateAuthorError, DuplicateGenreError,
+                    DuplicateReservationError, BookUnavailableError, BookAvailableError, BookOnLoanError, LoanNotFoundError, ReservationNotFoundError,
+                    InvalidPaymentError, InvalidChargeError, ReadOnlyStoreError)
+from contextlib import contextmanager, nullcontext
+from itertools import count, islice
+from types import MappingProxyType
+import heapq
+import re
+import threading
+import time
+
+LIBRARY_ID_PATTERN = re.compile(r"^[A-Za-z]{2}\d{5}$")
+GENRES = ("Fiction", "Nonfiction") # The only genre types the library knows how to build books for
+
+def validate_isbn(isbn): # Returning the canonical form of the ISBN (see isbn.py), or raising InvalidISBNError
+    key = canonical_isbn(isbn)
+    if key is None:
+        raise InvalidISBNError(isbn.strip())
+    return key
+
+def validate_library_id(library_id): # Returning the library ID in upper case, or raising InvalidLibraryIDError
+    library_id = library_id.strip().upper()
+    if not LIBRARY_ID_PATTERN.match(library_id):
+        raise InvalidLibraryIDError(library_id)
+    return library_id
+
+def book_category(book): # The fiction category or the nonfiction subject of a book
+    return book.get_category() if isinstance(book, FictionBook) else book.get_subject()
+
+class LibraryService:
+    # The headless core of the Library Management System.
+    # Every operation takes typed arguments, returns the affected objects and raises a LibraryError subclass (see errors.py) when
+    # it can't be completed. Nothing here reads from input() or prints, so it can be driven from scripts, importers, benchmarks or
+    # servers; the interactive Library class in library.py is a thin adapter over it.
+
+    def __init__(self, store=None, concurrent=False, lock_stripes=64, loan_days=LOAN_DAYS, search_cache_size=SEARCH_CACHE_SIZE):
+        # The store holds the collections and persists every change: MemoryStore (the default) or SQLiteStore (see storage.py).
+        # A read-only SnapshotStore (see snapshot.py) serves a catalog snapshot; every change is then refused with ReadOnlyStoreError.
+        # With concurrent=True, checkouts and returns can be called from several threads: each one locks the stripes of its ISBN and
+        # library ID, so operations on the same book are atomic while unrelated ones run in parallel.
+        # search_cache_size is the number of recent searches whose results are kept (see search_cache.py); 0 turns the cache off.
+        self.store = store if store is not None else MemoryStore()
+        self.__loan_locks = StripedLock(lock_stripes) if concurrent else NoLock()
+        self.__catalog_lock = ReadWriteLock() if concurrent else NoLock() # Searches share it; adding books, users or authors takes it alone
+        self.__index_lock = threading.RLock() # Held while a lazy index is built (see __building)
+        self.loan_period = loan_days * DAY # Seconds from checkout to the due date
+        self.fine_per_day = FINE_PER_DAY # Cents per started day late, up to max_fine per loan (see fines.py)
+        self.max_fine = MAX_FINE
+        self.__fine_lock = threading.Lock() # Guards balances and the fines charged per loan: fines are accrued for all users at once
+        # Lock order: loan stripes, then the store's transaction (store.batch()), then the fine lock
+        self.books = self.store.books # ISBN -> Book
+        # Registries keyed by library ID / name: O(1) lookups, while iteration keeps the order in which entries were added
+        self.users = self.store.users
+        self.authors = self.store.authors
+        self.genres = self.store.genres
+        self.ledger = LoanLedger() # Who has which book, indexed by ISBN and by borrower
+        self.loaned_books = self.ledger.loaned_books # Read-only view: library ID -> {ISBN: Book}
+        self.reservations = Reservations() # Waitlists of the books on loan, see reserve_book()
+        self.circulation = CirculationAnalytics() # Every checkout and return from now on, with running statistics (see circulation.py)
+        for library_id, isbn, due_at, fine, checked_out_at in self.store.active_loans(): # Restoring the loans of a persistent store (only the books on loan are loaded)
+            # Loans stored before due dates existed are due one loan period from now, and those stored before checkout times were
+            # kept count as checked out now:
+            loan = self.ledger.checkout(self.users[library_id], self.books[isbn], checked_out_at=checked_out_at,
+                                        due_at=due_at if due_at is not None else time.time() + self.loan_period)
+            loan.fine = fine
+            self.circulation.record_restored(loan) # Counted as on loan per genre, though not as a checkout
+        # The search indexes are built on first use, so opening a large persistent catalog doesn't have to read every title:
+        self.__title_index = None
+        self.__author_index = None
+        self.__title_words = None # Fuzzy search structures, also built on first use (see fuzzy_search_title/fuzzy_search_author)
+        self.__author_words = None
+        self.__author_tree = None
+        self.__author_forms = None # Normalized author name -> author names, for the names found in the BK-tree
+        self.__title_completions = None # Prefix indexes for as-you-type suggestions, also built on first use
+        self.__author_completions = None
+        self.__library_id_completions = None
+        self.__facets = None # Facet bitmaps for filter_books(), built on first use as well
+        self.__catalog_versions = count(1) # next() is atomic, so two books added at once never get the same version
+        self.catalog_version = 0 # Bumped after every change to the books a search can find, invalidating the cached searches
+        self.search_cache = SearchCache(search_cache_size) if search_cache_size else None # Set to None to turn caching off
+        self.__listeners = [] # Callables notified after every change, see add_listener()
+        self.metrics = None # A Metrics object collecting index hits and misses once instrumentation.instrument() is called
+
+    def add_listener(self, listener):
+        # Registering a callable that is called as listener(event, *args) after each change to the library:
+        #   "user_added" (user), "author_added" (author), "book_added" (book), "checked_out" (user, book),
+        #   "returned" (user, book, the Unix time of the return, which a replayed return sets in the past),
+        #   "reserved", "reservation_cancelled" and "reservation_fulfilled" (user, book); see reservations.py for ready-made subscribers
+        #   "fine_charged" (user, book or None, cents) and "fine_paid" (user, cents); a loan's fine is notified before its return
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.remove(listener)
+
+    def __notify(self, event, *args):
+        for listener in self.__listeners:
+            listener(event, *args)
+
+    # The indexes below are built on first use. Each one is built whole, under the catalog's read lock (so no book can be added
+    # meanwhile) and the index lock (so only one thread builds it), and published only once it is complete: a search running
+    # at the same time either builds it or waits for it, and never sees it half filled.
+    @contextmanager
+    def __building(self):
+        with self.__catalog_lock.read(), self.__index_lock:
+            yield
+
+    @property
+    def title_index(self): # Inverted index of title tokens -> ISBNs
+        if self.__title_index is None:
+            with self.__building():
+                if self.__title_index is None:
+                    index = TokenIndex()
+                    for isbn, title in self.store.iter_titles():
+                        index.add(isbn, title)
+                    self.__title_index = index
+        return self.__title_index
+
+    @property
+    def author_index(self): # Inverted index of normalized author name tokens -> author names
+        if self.__author_index is None:
+            with self.__building():
+                if self.__author_index is None:
+                    index = TokenIndex()
+                    for name in self.store.iter_author_names():
+                        index.add(name, name)
+                    self.__author_index = index
+        return self.__author_index
+
+    @property
+    def title_words(self): # Trigram index over the distinct words of all titles, for typo-tolerant title search
+        if self.__title_words is None:
+            with self.__building():
+                if self.__title_words is None:
+                    words = TrigramIndex()
+                    for token in self.title_index.tokens():
+                        if not token.isdigit(): # Numbers ("Catch 22") are only ever matched exactly, so they stay out of the vocabulary
+                            words.add(token)
+                    self.__title_words = words
+        return self.__title_words
+
+    @property
+    def title_completions(self): # Sorted prefix index of all titles (see autocomplete.py)
+        if self.__title_completions is None:
+            with self.__building():
+                if self.__title_completions is None:
+                    completions = PrefixIndex()
+                    for _, title in self.store.iter_titles():
+                        completions.add(title)
+                    self.__title_completions = completions
+        return self.__title_completions
+
+    @property
+    def author_completions(self):
+        if self.__author_completions is None:
+            with self.__building():
+                if self.__author_completions is None:
+                    completions = PrefixIndex()
+                    for name in self.store.iter_author_names():
+                        completions.add(name)
+                    self.__author_completions = completions
+        return self.__author_completions
+
+    @property
+    def library_id_completions(self):
+        if self.__library_id_completions is None:
+            with self.__building():
+                if self.__library_id_completions is None:
+                    completions = PrefixIndex(str.upper)
+                    for library_id in self.users.keys():
+                        completions.add(library_id)
+                    self.__library_id_completions = completions
+        return self.__library_id_completions
+
+    @property
+    def facets(self): # Bitmaps of the books by availability, genre, category and author (see facets.py)
+        if self.__facets is None:
+            self.load_all()
+            # Loans change availability without the catalog lock, so the facets are built holding every loan stripe as well
+            with self.__building(), self.__loan_locks.hold_all():
+                if self.__facets is None:
+                    facets = FacetIndex(book_category)
+                    for book in list(self.books.values()):
+                        facets.add(book)
+                    self.__facets = facets
+        return self.__facets
+
+    def __author_fuzzy_index(self):
+        # The author side of fuzzy search: a trigram index over the words of author names, a BK-tree over whole normalized names
+        # and the names of each normalized form, built together on first use and published by setting the tree last
+        if self.__author_tree is None:
+            with self.__building():
+                if self.__author_tree is None:
+                    words, tree, forms = TrigramIndex(), BKTree(), {}
+                    for name in self.store.iter_author_names():
+                        self.__add_fuzzy_author(name, words, tree, forms)
+                    self.__author_words, self.__author_forms = words, forms
+                    self.__author_tree = tree
+        return self.__author_words, self.__author_tree, self.__author_forms
+
+    def __add_fuzzy_author(self, name, words, tree, forms):
+        tokens = tokenize(name)
+        for token in tokens:
+            words.add(token)
+        form = " ".join(tokens)
+        tree.add(form)
+        forms.setdefault(form, []).append(name)
+
+    def __check_writable(self): # Refusing changes up front on a read-only store (a snapshot replica), before anything is touched
+        if self.store.read_only:
+            raise ReadOnlyStoreError()
+
+    def batch(self): # Grouping several changes into one storage transaction: with service.batch(): ...
+        return self.store.batch()
+
+    @contextmanager
+    def frozen(self):
+        # Holding off every change to users, loans and balances while the block runs, so they can be copied as one consistent state
+        # (see LoanJournal.snapshot). Listeners are notified inside these locks, so a listener must not enter this block itself.
+        with self.__catalog_lock.read(), self.__loan_locks.hold_all(), self.__fine_lock:
+            yield
+
+    def load_all(self): # Making sure every book is in memory, e.g. before listing whole genres from a lazily loaded store
+        self.store.load_all()
+
+    # Lookups:
+    def find_user(self, library_id):
+        return self.users.get(library_id)
+
+    def find_author(self, name):
+        return self.authors.get(name)
+
+    def find_genre(self, name):
+        return self.genres.get(name)
+
+    def get_book(self, isbn):
+        book = self.books.get(isbn)
+        if book is None:
+            raise BookNotFoundError(isbn)
+        return book
+
+    def get_user(self, library_id):
+        user = self.users.get(library_id)
+        if user is None:
+            raise UserNotFoundError(library_id)
+        return user
+
+    def get_author(self, name):
+        author = self.authors.get(name)
+        if author is None:
+            raise AuthorNotFoundError(name)
+        return author
+
+    # Users, authors and genres:
+    def add_user(self, name, library_id):
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            library_id = validate_library_id(library_id)
+            if library_id in self.users:
+                raise DuplicateUserError(library_id)
+            user = self.users.add(User(name, library_id))
+            self.store.save_user(user)
+            if self.__library_id_completions is not None:
+                self.__library_id_completions.add(library_id)
+            if self.__listeners:
+                self.__notify("user_added", user)
+            return user
+
+    def add_author(self, name, biography=""):
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            if name in self.authors:
+                raise DuplicateAuthorError(name)
+            author = self.authors.add(Author(name, biography[:300]))
+            self.store.save_author(author)
+            if self.__author_index is not None: # Indexing the author's name so author searches go straight to the author's books
+                self.__author_index.add(name, name)
+            if self.__author_tree is not None:
+                self.__add_fuzzy_author(name, self.__author_words, self.__author_tree, self.__author_forms)
+            if self.__author_completions is not None:
+                self.__author_completions.add(name)
+            if self.__listeners:
+                self.__notify("author_added", author)
+            return author
+
+    def add_genre(self, name, description=""):
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            if name not in GENRES:
+                raise InvalidGenreError(name)
+            if name in self.genres:
+                raise DuplicateGenreError(name)
+            genre = self.genres.add(Genre(name, description[:200]))
+            self.store.save_genre(genre)
+            return genre
+
+    def add_category(self, genre, category): # Adding a fiction category / nonfiction subject to an existing genre
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            genre_obj = self.find_genre(genre)
+            if genre_obj is None:
+                raise InvalidGenreError(genre)
+            genre_obj.add_category(category)
+            self.store.save_category(genre_obj, category)
+            return genre_obj
+
+    # Books:
+    def add_book(self, title, author, isbn, genre, category, replace=False):
+        # author and genre are names; missing authors and genres are created on the fly with an empty biography/description.
+        # category is the fiction category or the nonfiction subject. Set replace=True to overwrite a book with the same ISBN.
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            isbn = validate_isbn(isbn)
+            if genre not in GENRES:
+                raise InvalidGenreError(genre)
+            if isbn in self.books and not replace: # Checking before building the book, because a new Book registers itself with its author
+                raise DuplicateBookError(isbn)
+            # The ISBN's loan lock is taken before the store's transaction, in the same order as loans take them
+            with self.__loan_locks.hold(isbn), self.store.batch(): # Saving the new author/genre and the book in one transaction
+                author_obj = self.find_author(author) or self.add_author(author)
+                genre_obj = self.find_genre(genre) or self.add_genre(genre)
+                if genre == "Fiction":
+                    book = FictionBook(title, author_obj, isbn, genre_obj, category)
+                else:
+                    book = NonFictionBook(title, author_obj, isbn, genre_obj, category)
+                self.__put_book(book, replace)
+            if self.__listeners:
+                self.__notify("book_added", book)
+            return book
+
+    def register_book(self, book, replace=False):
+        # Adding an already built FictionBook/NonFictionBook to the catalog, its genre category and the search indexes
+        with self.__catalog_lock.write():
+            self.__check_writable()
+            # A replacement holds the ISBN's loan lock until the new book is in the catalog, so the old one can't be lent while it is
+            # swapped. A new ISBN has no loans to race with, and going without the lock keeps imports running in service.batch()
+            # from taking loan locks inside the store's transaction (loans take them in the opposite order).
+            isbn = book.get_isbn()
+            with self.__loan_locks.hold(isbn) if isbn in self.books else nullcontext():
+                self.__put_book(book, replace)
+            if self.__listeners:
+                self.__notify("book_added", book)
+            return book
+
+    def __put_book(self, book, replace): # register_book's work; the caller holds the catalog's write lock (and the ISBN's loan lock for a replacement)
+        isbn = book.get_isbn()
+        old_book = self.books.get(isbn)
+        if old_book is not None:
+            if not replace:
+                book.get_author().author_books.remove(book) # Undoing the self-registration done by the Book constructor
+                raise DuplicateBookError(isbn)
+            if self.ledger.holder(isbn) is not None: # The new copy would be on the shelf while the ledger still lends the old one
+                book.get_author().author_books.remove(book)
+                raise BookOnLoanError(isbn)
+            self.__unlink_book(old_book)
+        category = book_category(book)
+        genre = book.get_genre()
+        genre.add_category(category)
+        genre.add_book_to_category(category, book)
+        self.books[isbn] = book
+        with self.store.batch():
+            self.store.save_category(genre, category)
+            self.store.save_book(book, category)
+        if self.__title_index is not None:
+            self.__title_index.add(isbn, book.get_title())
+        if self.__title_words is not None:
+            for token in tokenize(book.get_title()):
+                if not token.isdigit():
+                    self.__title_words.add(token)
+        if self.__title_completions is not None:
+            self.__title_completions.add(book.get_title())
+        if self.__facets is not None:
+            self.__facets.add(book)
+        self.catalog_version = next(self.__catalog_versions) # Only once the book can be found, so no search can cache a result without it
+
+    def __unlink_book(self, book): # Removing a replaced book from its author's and its genre category's book lists
+        author_books = book.get_author().author_books
+        if book in author_books:
+            author_books.remove(book)
+        book.get_genre().remove_book_from_category(book_category(book), book)
+        if self.__title_completions is not None:
+            self.__title_completions.remove(book.get_title())
+
+    # Loans:
+    def check_out_book(self, library_id, isbn, due_at=None, checked_out_at=None):
+        # Loaning a book to an existing user and returning the book. The loan is checked out now and due loan_period later, unless
+        # checked_out_at and due_at (Unix timestamps) say otherwise, e.g. when a journal replays a loan made earlier.
+        self.__check_writable()
+        isbn = validate_isbn(isbn)
+        library_id = validate_library_id(library_id)
+        user = self.get_user(library_id)
+        with self.__loan_locks.hold(isbn, library_id): # The availability check and every update below happen as one step
+            book = self.get_book(isbn) # Looked up under the lock, so a book replaced meanwhile isn't lent in its old form
+            self.__lend(user, book, due_at, checked_out_at)
+        return book
+
+    def __lend(self, user, book, due_at=None, checked_out_at=None): # Loaning an available book; the caller holds the locks of the ISBN and the library ID
+        isbn = book.get_isbn()
+        if self.ledger.holder(isbn) is not None or not book.borrow_book(): # Asking the ledger too, as it is what records the loan
+            raise BookUnavailableError(isbn)
+        if checked_out_at is None:
+            checked_out_at = time.time()
+        if due_at is None:
+            due_at = checked_out_at + self.loan_period
+        try:
+            self.store.record_checkout(user.get_library_id(), isbn, due_at, checked_out_at)
+        except BaseException:
+            book.return_book() # Leaving the book available if the loan couldn't be stored
+            raise
+        loan = self.ledger.checkout(user, book, checked_out_at, due_at) # Recording the loan (this also updates the user's borrowed books and loaned_books)
+        self.circulation.record_checkout(loan)
+        if self.__facets is not None:
+            self.__facets.set_available(isbn, False)
+        if self.__listeners:
+            self.__notify("checked_out", user, book)
+
+    def check_in_book(self, library_id, isbn, returned_at=None):
+        # Returning a loaned book and returning the book. A late return is charged the rest of the loan's fine (what the nightly
+        # accrue_fines() hasn't charged yet). returned_at defaults to now; a journal replaying an old return passes the original time.
+        self.__check_writable()
+        library_id = validate_library_id(library_id)
+        isbn = validate_isbn(isbn)
+        user = self.get_user(library_id)
+        while True:
+            # If someone has reserved the book, it goes straight to them, so their lock is taken as well. The line may change
+            # between looking at it and getting the locks; then the locks are let go and taken again for the new first in line.
+            waiting = self.reservations.peek(isbn)
+            keys = (isbn, library_id) if waiting is None else (isbn, library_id, waiting.user.get_library_id())
+            with self.__loan_locks.hold(*keys):
+                if self.reservations.peek(isbn) is not waiting:
+                    continue
+                loan = self.ledger.get_loan(isbn)
+                if loan is None or loan.user is not user: # Checking if the book is recorded as loaned to the user
+                    raise LoanNotFoundError(library_id, isbn)
+                with self.store.batch(): # The return, its fine and the hand-off to the next in line are stored together
+                    self.store.record_return(library_id, isbn)
+                    self.ledger.return_book(isbn)
+                    returned_at = time.time() if returned_at is None else returned_at
+                    self.__settle_fine(loan, returned_at)
+                    self.circulation.record_return(loan, returned_at)
+                    book = loan.book
+                    book.return_book() # Setting the book as available
+                    if self.__facets is not None:
+                        self.__facets.set_available(isbn, True)
+                    if self.__listeners:
+                        self.__notify("returned", user, book, returned_at)
+                    if waiting is not None: # Handing the book over to the next in line before anyone else can borrow it
+                        self.reservations.pop_next(isbn)
+                        self.__lend(waiting.user, book)
+                        if self.__listeners:
+                            self.__notify("reservation_fulfilled", waiting.user, book)
+            return book
+
+    # Due dates and fines (amounts are in cents):
+    def __settle_fine(self, loan, returned_at): # Charging a returned loan whatever part of its fine hasn't been charged yet
+        if loan.due_at is None or returned_at <= loan.due_at:
+            return
+        with self.__fine_lock:
+            charge = fine_for(loan.due_at, returned_at, self.fine_per_day, self.max_fine) - loan.fine
+            if charge > 0:
+                loan.fine += charge
+                loan.user.charge(charge)
+                self.store.save_balance(loan.user)
+                if self.__listeners: # Inside the fine lock, so listeners see the charges in the order they were made
+                    self.__notify("fine_charged", loan.user, loan.book, charge)
+
+    def overdue_loans(self, now=None): # The loans past their due date, the most overdue first
+        return self.ledger.overdue(now)
+
+    def accrue_fines(self, now=None):
+        # Bringing the fines of every overdue loan up to date, e.g. once a night, and returning library ID -> amount charged.
+        # Only the overdue loans are visited (see LoanLedger.overdue), their new fines are computed in one batch (vectorized when
+        # NumPy is installed), and all the changed balances are stored in one transaction.
+        self.__check_writable()
+        now = time.time() if now is None else now
+        with self.store.batch(), self.__fine_lock:
+            loans = self.ledger.overdue(now)
+            charges = new_charges([loan.due_at for loan in loans], [loan.fine for loan in loans], now, self.fine_per_day, self.max_fine)
+            charged = {} # Library ID -> amount
+            charged_loans = []
+            charged_users = {}
+            for loan, charge in zip(loans, charges):
+                if charge > 0:
+                    loan.fine += charge
+                    loan.user.charge(charge)
+                    library_id = loan.user.get_library_id()
+                    charged[library_id] = charged.get(library_id, 0) + charge
+                    charged_loans.append(loan)
+                    charged_users[library_id] = loan.user
+            if charged_loans:
+                self.store.record_fines(charged_loans, charged_users.values())
+            if self.__listeners:
+                for loan, charge in zip(loans, charges):
+                    if charge > 0:
+                        self.__notify("fine_charged", loan.user, loan.book, charge)
+        return charged
+
+    def charge_fine(self, library_id, amount, isbn=None):
+        # Charging a user a fine directly, e.g. for a damaged book or when a journal replays the fines it recorded, and returning
+        # the new balance. With the ISBN of a book the user has on loan, the charge counts towards that loan's fine as well.
+        self.__check_writable()
+        user = self.get_user(validate_library_id(library_id))
+        if not isinstance(amount, int) or amount <= 0:
+            raise InvalidChargeError(amount)
+        with self.store.batch(), self.__fine_lock:
+            loan = self.ledger.get_loan(validate_isbn(isbn)) if isbn is not None else None
+            if loan is not None and loan.user is not user:
+                loan = None
+            balance = user.charge(amount)
+            if loan is not None:
+                loan.fine += amount
+                self.store.record_fines([loan], [user])
+            else:
+                self.store.save_balance(user)
+            if self.__listeners:
+                self.__notify("fine_charged", user, loan.book if loan is not None else None, amount)
+        return balance
+
+    def pay_fine(self, library_id, amount): # Paying off part or all of a user's fines and returning the balance left
+        self.__check_writable()
+        user = self.get_user(validate_library_id(library_id))
+        with self.store.batch(), self.__fine_lock:
+            balance = user.get_balance()
+            if not isinstance(amount, int) or amount <= 0 or amount > balance:
+                raise InvalidPaymentError(amount, balance)
+            balance = user.pay_fine(amount)
+            self.store.save_balance(user)
+            if self.__listeners:
+                self.__notify("fine_paid", user, amount)
+        return balance
+
+    # Reservations:
+    def reserve_book(self, library_id, isbn, priority=0):
+        # Putting a user in line for a book that is on loan and returning the Reservation. When the book is returned it is loaned
+        # to the first in line right away: the highest priority, then the earliest reservation.
+        self.__check_writable()
+        isbn = validate_isbn(isbn)
+        library_id = validate_library_id(library_id)
+        book = self.get_book(isbn)
+        user = self.get_user(library_id)
+        with self.__loan_locks.hold(isbn, library_id):
+            if book.is_available():
+                raise BookAvailableError(isbn)
+            if self.ledger.holder(isbn) is user or self.reservations.has_reservation(library_id, isbn):
+                raise DuplicateReservationError(library_id, isbn)
+            reservation = self.reservations.add(user, book, priority)
+            if self.__listeners:
+                self.__notify("reserved", user, book)
+        return reservation
+
+    def cancel_reservation(self, library_id, isbn):
+        self.__check_writable()
+        isbn = validate_isbn(isbn)
+        library_id = validate_library_id(library_id)
+        with self.__loan_locks.hold(isbn, library_id):
+            reservation = self.reservations.cancel(library_id, isbn)
+            if reservation is None:
+                raise ReservationNotFoundError(library_id, isbn)
+            if self.__listeners:
+                self.__notify("reservation_cancelled", reservation.user, reservation.book)
+        return reservation
+
+    def waitlist(self, isbn): # The reservations for a book, in the order they will be served
+        return self.reservations.waitlist(validate_isbn(isbn))
+
+    def reservation_position(self, library_id, isbn): # 1 for the next in line, or None if the user isn't waiting for the book
+        return self.reservations.position(validate_library_id(library_id), validate_isbn(isbn))
+
+    def who_has(self, isbn): # The user who currently has the book, or None
+        return self.ledger.holder(validate_isbn(isbn))
+
+    def has_loans(self): # True if any book is on loan
+        return self.ledger.has_loans()
+
+    # Searches (each returns a read-only mapping of ISBN -> Book, best matches first). Results are cached by search type and
+    # normalized query, so repeating a search is one dictionary lookup until the catalog changes:
+    def __cached(self, key, search):
+        with self.__catalog_lock.read(): # No book is added while the search runs
+            return self.__cached_locked(key, search)
+
+    def __cached_locked(self, key, search):
+        cache = self.search_cache
+        if cache is None:
+            return MappingProxyType(search())
+        version = self.catalog_version # Read before searching: a book added meanwhile leaves the entry outdated, never wrong
+        result = cache.get(key, version)
+        if self.metrics is not None:
+            self.metrics.increment("search_cache_hits" if result is not None else "search_cache_misses")
+        if result is None:
+            result = MappingProxyType(search()) # Read-only, as every caller of the same search gets the same mapping
+            cache.put(key, version, result)
+        return result
+
+    def search_title(self, title, substring=False):
+        title = title.lower().strip()
+        return self.__cached(("title", title, substring), lambda: self.__search_title(title, substring))
+
+    def __search_title(self, title, substring):
+        search_result = {}
+        if not substring:
+            # Intersecting the posting sets of every word in the query and keeping the ranked order of the matches:
+            for isbn in self.title_index.search(title):
+                search_result[isbn] = self.books[isbn]
+            if self.metrics is not None:
+                self.metrics.increment("title_index_hits" if search_result else "title_index_misses")
+        if not search_result:
+            # Falling back to substring matching so partial words (e.g. "hobb") still find "The Hobbit":
+            for isbn, book in self.books.items():
+                if title in book.get_title().lower():
+                    search_result[isbn] = book
+        return search_result
+
+    def search_author(self, author):
+        return self.__cached(("author", " ".join(tokenize(author))), lambda: self.__search_author(author))
+
+    def __search_author(self, author):
+        search_result = {}
+        # Finding every author whose normalized name contains all the words of the query ("tolkien" finds "J. R. R. Tolkien"),
+        # with an exact name match ranked first, then collecting the books straight from each author's own list:
+        for name in self.author_index.search(author):
+            for book in self.authors[name].author_books:
+                isbn = book.get_isbn()
+                if self.books.get(isbn) is book: # Skipping books that have since been replaced under the same ISBN
+                    search_result[isbn] = book
+        if self.metrics is not None:
+            self.metrics.increment("author_index_hits" if search_result else "author_index_misses")
+        return search_result
+
+    # Typo-tolerant searches (each returns a read-only mapping of ISBN -> Book for the best matches, best first, cached like the others):
+    def fuzzy_search_title(self, title, limit=10):
+        return self.__cached(("fuzzy_title", " ".join(tokenize(title)), limit), lambda: self.__fuzzy_search_title(title, limit))
+
+    def __fuzzy_search_title(self, title, limit):
+        # Every word of the query is matched to the title words that look like it (just the word itself if it is a known word),
+        # and each title scores the similarity of its best match for every query word. Only the postings of those few words are
+        # read, so the cost depends on how common the words are, not on the size of the catalog.
+        scores = {}
+        for token in tokenize(title):
+            best = {} # ISBN -> similarity of the best alternative of this query word found in the title
+            for similarity, word in self.__word_alternatives(token, self.title_words):
+                for isbn in self.title_index.lookup_token(word):
+                    if best.get(isbn, 0) < similarity:
+                        best[isbn] = similarity
+            for isbn, similarity in best.items():
+                scores[isbn] = scores.get(isbn, 0) + similarity
+        # Keeping a few more than asked for, so equal scores can be ordered by the shorter (closer) title:
+        top = heapq.nlargest(limit * 4, scores.items(), key=lambda item: item[1])
+        text = self.title_index.get_text
+        top.sort(key=lambda item: (-item[1], len(text(item[0])), text(item[0]).lower()))
+        return {isbn: self.books[isbn] for isbn, _ in top[:limit]}
+
+    def fuzzy_search_author(self, author, limit=10):
+        return self.__cached(("fuzzy_author", " ".join(tokenize(author)), limit), lambda: self.__fuzzy_search_author(author, limit))
+
+    def __fuzzy_search_author(self, author, limit):
+        # Finding the `limit` authors closest to the query, from two sources: whole names within a few edits in the BK-tree
+        # ("jrr tolkein" -> "j r r tolkien") and names containing a word close to a query word ("tolkein" -> "tolkien").
+        # The candidates are ranked by how far each query word is from the nearest word of the name, then by the whole-name distance.
+        author_words, author_tree, author_forms = self.__author_fuzzy_index()
+        query_tokens = tokenize(author)
+        query = " ".join(query_tokens)
+        if not query:
+            return {}
+        candidates = set()
+        for _, form in author_tree.search(query, max(1, len(query) // 4)):
+            candidates.update(author_forms[form])
+        # A common word ("ada") can match thousands of names, so the word matches are first scored like titles are, and only
+        # the best few of them get the (more expensive) edit-distance ranking below
+        scores = {}
+        for token in query_tokens:
+            best = {} # Author name -> similarity of the best alternative of this query word found in the name
+            for similarity, word in self.__word_alternatives(token, author_words):
+                for name in self.author_index.lookup_token(word):
+                    if best.get(name, 0) < similarity:
+                        best[name] = similarity
+            for name, similarity in best.items():
+                scores[name] = scores.get(name, 0) + similarity
+        candidates.update(name for name, _ in heapq.nlargest(limit * 4, scores.items(), key=lambda item: (item[1], -len(item[0]))))
+
+        def distance(name):
+            tokens = tokenize(name)
+            return (sum(min(levenshtein(token, word) for word in tokens) for token in query_tokens), levenshtein(query, " ".join(tokens)), name)
+        search_result = {}
+        for name in heapq.nsmallest(limit, candidates, key=distance):
+            for book in self.authors[name].author_books:
+                isbn = book.get_isbn()
+                if self.books.get(isbn) is book:
+                    search_result[isbn] = book
+        return search_result
+
+    def __word_alternatives(self, word, vocabulary, limit=3):
+        # The (similarity, word) pairs a query word may have meant: the word itself if it is in the vocabulary, otherwise the closest
+        # trigram matches, re-ranked by edit distance and kept only within about one typo per three letters
+        if word in vocabulary or word.isdigit():
+            return [(1.0, word)]
+        if len(word) < 3: # Too short to guess from
+            return []
+        max_distance = max(1, len(word) // 3)
+        alternatives = []
+        for _, candidate in vocabulary.similar(word, limit=limit * 4):
+            distance = levenshtein(word, candidate, max_distance)
+            if distance <= max_distance:
+                alternatives.append((1 - distance / max(len(word), len(candidate)), candidate))
+        alternatives.sort(key=lambda pair: (-pair[0], pair[1]))
+        return alternatives[:limit]
+
+    def search_isbn(self, isbn): # Not cached: the lookup is a single dictionary access already
+        isbn = validate_isbn(isbn)
+        book = self.books.get(isbn)
+        if self.metrics is not None:
+            self.metrics.increment("isbn_lookup_hits" if book is not None else "isbn_lookup_misses")
+        return MappingProxyType({isbn: book} if book is not None else {})
+
+    # Circulation analytics (loans restored from a store at startup aren't counted as checkouts):
+    def most_borrowed(self, limit=10): # (Book, checkouts) pairs, most borrowed first
+        return self.circulation.most_borrowed(limit)
+
+    def genre_utilization(self):
+        # Genre name -> {"checkouts", "on_loan", "books", "utilization"}, where utilization is the share of the genre's books on loan now
+        self.load_all() # Genres count their books as they are loaded
+        stats = self.circulation.genre_stats()
+        utilization = {}
+        with self.__catalog_lock.read():
+            for genre in self.genres.values():
+                checkouts, on_loan = stats.get(genre.get_name(), (0, 0))
+                books = genre.get_book_count()
+                utilization[genre.get_name()] = {"checkouts": checkouts, "on_loan": on_loan, "books": books,
+                                                 "utilization": on_loan / books if books else 0.0}
+        return utilization
+
+    def circulation_report(self, since=None, until=None, limit=10):
+        # Circulation between two Unix timestamps (see CirculationAnalytics.report), with the number of users holding books right now
+        report = self.circulation.report(since, until, limit)
+        report["active_borrowers"] = len(self.loaned_books)
+        return report
+
+    # Faceted filtering:
+    def filter_books(self, available=None, genre=None, category=None, author=None, offset=0, limit=50):
+        # The books matching every filter given, with the number of matches per facet value (see facets.FacetResult), e.g.
+        # filter_books(available=True, genre="Fiction", category="Fantasy", author="tolkien"). genre and category are names or lists
+        # of names (any of them matches), compared without regard to case; author is a query matched like search_author's.
+        # available=True keeps the books on the shelf, False the books on loan.
+        facets = self.facets
+        with self.__catalog_lock.read():
+            genres = self.__facet_values(facets, "genre", genre)
+            categories = self.__facet_values(facets, "category", category)
+            authors = self.author_index.search(author) if author is not None and author.strip() else None
+            return facets.query(available, genres, categories, authors, offset, limit)
+
+    def __facet_values(self, facets, facet, names): # The known values of a facet matching the names asked for, or None for no filter
+        if names is None:
+            return None
+        wanted = {name.strip().lower() for name in ([names] if isinstance(names, str) else names) if name.strip()}
+        if not wanted:
+            return None
+        return [value for value in facets.values(facet) if value.lower() in wanted]
+
+    # As-you-type suggestions (each returns up to limit completions of the prefix, in alphabetical order):
+    def complete_title(self, prefix, limit=10):
+        return self.title_completions.complete(prefix, limit)
+
+    def complete_author(self, prefix, limit=10):
+        return self.author_completions.complete(prefix, limit)
+
+    def complete_library_id(self, prefix, limit=10):
+        return self.library_id_completions.complete(prefix.strip(), limit)
+
+    # Listings (lazy, in the stable order the entities were added; offset skips that many entities, so a listing can resume where a
+    # previous page ended). Only the keys are skipped, so a lazily loaded store doesn't build the entities before the offset:
+    def iter_books(self, offset=0):
+        books = self.books
+        return (books[isbn] for isbn in islice(books.keys(), offset, None))
+
+    def iter_users(self, offset=0):
+        users = self.users
+        return (users[library_id] for library_id in islice(users.keys(), offset, None))
+
+    def iter_authors(self, offset=0):
+        authors = self.authors
+        return (authors[name] for name in islice(authors.keys(), offset, None))
+
+    def iter_genres(self, offset=0):
+        genres = self.genres
+        return (genres[name] for name in islice(genres.keys(), offset, None))
+
+    def list_books(self, offset=0, limit=50): # One Page of books; page.next_offset is where the next page starts (None at the end)
+        return take_page(self.iter_books(offset), offset, limit)
+
+    def list_users(self, offset=0, limit=50):
+        return take_page(self.iter_users(offset), offset, limit)
+
+    def list_authors(self, offset=0, limit=50):
+        return take_page(self.iter_authors(offset), offset, limit)
+
+    def list_genres(self, offset=0, limit=50):
+        return take_page(self.iter_genres(offset), offset, limit)
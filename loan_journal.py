@@ -0,0 +1,231 @@
+from errors import LibraryError
+import json
+import os
+import threading
+import time
+
+# An append-only, group-committed journal of loan events (user created, checkout, return, fine charged, fine paid) with compacted snapshots.
+# The catalog itself comes from the store or an import; the journal makes the users and the loans on top of it durable.
+# Recovery loads the latest snapshot and replays only the journal records written after it.
+#
+#   journal = LoanJournal("library_journal")
+#   journal.recover(service) # Rebuilding users and loans after a restart
+#   journal.attach(service) # Recording every change from now on
+#   ...
+#   journal.close()
+
+JOURNAL_FILE = "journal.log"
+SNAPSHOT_FILE = "snapshot.json"
+
+class RecoveryReport:
+    def __init__(self):
+        self.snapshot_users = 0
+        self.snapshot_loans = 0
+        self.replayed = 0 # Journal records applied on top of the snapshot
+        self.skipped = 0 # Records that could not be applied, e.g. a book missing from the catalog
+        self.truncated = False # True if a torn record at the end of the journal (a crash mid-write) was dropped
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f"Recovered {self.snapshot_users} users and {self.snapshot_loans} loans from the snapshot and replayed "
+                f"{self.replayed} journal records ({self.skipped} skipped) in {self.elapsed * 1000:.1f} ms")
+
+class LoanJournal:
+    def __init__(self, directory, group_commit_size=512, group_commit_interval=0.01, snapshot_every=100_000):
+        # Records are buffered and written with one fsync per group: when group_commit_size records are waiting, or at the latest
+        # group_commit_interval seconds after the first one. A snapshot is taken automatically every snapshot_every records, by the
+        # background flusher: the records are appended from the service's listeners, inside the locks a snapshot has to take.
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.group_commit_size = group_commit_size
+        self.group_commit_interval = group_commit_interval
+        self.snapshot_every = snapshot_every
+        self.__journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.__snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.__file = None # Opened on the first write, so recover() can drop a torn tail first
+        self.__buffer = []
+        self.__sequence = 0 # Sequence number of the last record, continued from the snapshot and the journal on recovery
+        self.__since_snapshot = 0
+        self.__service = None
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__flusher = None
+
+    # Recording events:
+    def attach(self, service): # Journaling every change made to the service from now on
+        self.__open()
+        self.__service = service
+        service.add_listener(self.__on_event)
+        if self.__flusher is None: # A background thread makes sure buffered records are written within group_commit_interval
+            self.__flusher = threading.Thread(target=self.__flush_periodically, name="loan-journal-flusher", daemon=True)
+            self.__flusher.start()
+
+    def __on_event(self, event, *args):
+        if event == "user_added":
+            user = args[0]
+            self.append({"op": "user", "library_id": user.get_library_id(), "name": user.name})
+        elif event == "checked_out":
+            user, book = args
+            loan = self.__service.ledger.get_loan(book.get_isbn())
+            self.append({"op": "checkout", "library_id": user.get_library_id(), "isbn": book.get_isbn(), "due_at": loan.due_at,
+                         "at": loan.checked_out_at})
+        elif event == "returned":
+            user, book, returned_at = args # The time the return took effect, which decides whether it was late
+            self.append({"op": "return", "library_id": user.get_library_id(), "isbn": book.get_isbn(), "at": returned_at})
+        elif event == "fine_charged": # Journaled before the return of a late book, so replaying the return charges nothing twice
+            user, book, amount = args
+            self.append({"op": "fine", "library_id": user.get_library_id(), "isbn": book.get_isbn() if book is not None else None, "amount": amount})
+        elif event == "fine_paid":
+            user, amount = args
+            self.append({"op": "payment", "library_id": user.get_library_id(), "amount": amount})
+
+    def append(self, record):
+        with self.__lock:
+            self.__sequence += 1
+            record["seq"] = self.__sequence
+            self.__buffer.append(json.dumps(record, separators=(",", ":")))
+            self.__since_snapshot += 1
+            if len(self.__buffer) >= self.group_commit_size:
+                self.__flush_locked()
+
+    def sync(self): # Writing and fsyncing everything buffered so far; after this returns every appended record is durable
+        with self.__lock:
+            self.__flush_locked()
+
+    def __flush_locked(self):
+        if not self.__buffer:
+            return
+        self.__open()
+        self.__file.write("\n".join(self.__buffer) + "\n")
+        self.__file.flush()
+        os.fsync(self.__file.fileno()) # One fsync for the whole group of records
+        self.__buffer.clear()
+
+    def __flush_periodically(self):
+        while True:
+            time.sleep(self.group_commit_interval)
+            with self.__lock:
+                if self.__closed:
+                    return
+                self.__flush_locked()
+                service = self.__service if self.__since_snapshot >= self.snapshot_every else None
+            if service is not None:
+                self.snapshot(service)
+
+    def __open(self):
+        if self.__file is None:
+            self.__file = open(self.__journal_path, "a", encoding="utf-8")
+
+    # Snapshots:
+    def snapshot(self, service):
+        # Writing the current users and loans to a new snapshot file, then starting an empty journal.
+        # The snapshot replaces the old one atomically (write to a temporary file, fsync, rename), and it carries the sequence number
+        # of the last record it includes, so a crash between the rename and the journal reset can't replay anything twice.
+        # The service is frozen meanwhile: no user, loan or fine can change (or be journaled) between the copy and its sequence number.
+        with service.frozen(), self.__lock:
+            if self.__closed: # The flusher's automatic snapshot lost the race with close()
+                return
+            self.__flush_locked()
+            snapshot = {
+                "seq": self.__sequence,
+                "users": [[user.get_library_id(), user.name, user.get_balance()] for user in service.users],
+                "loans": [[loan.user.get_library_id(), loan.book.get_isbn(), loan.due_at, loan.fine, loan.checked_out_at] for loan in service.ledger.loans()],
+            }
+            temporary_path = self.__snapshot_path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(snapshot, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.__snapshot_path)
+            self.__open()
+            self.__file.truncate(0)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__since_snapshot = 0
+
+    # Recovery:
+    def recover(self, service):
+        # Rebuilding users and loans in the given service (whose catalog is already loaded) from the snapshot and the journal.
+        # Call this before attach(), so the replayed operations are not journaled a second time.
+        report = RecoveryReport()
+        start = time.perf_counter()
+        snapshot_sequence = 0
+        if os.path.exists(self.__snapshot_path):
+            with open(self.__snapshot_path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+            snapshot_sequence = snapshot["seq"]
+            balances = {}
+            for library_id, name, *balance in snapshot["users"]: # Snapshots written before fines were journaled have no balances
+                if self.__apply(service, {"op": "user", "library_id": library_id, "name": name}):
+                    report.snapshot_users += 1
+                    balances[library_id] = balance[0] if balance else None
+            for library_id, isbn, *fields in snapshot["loans"]: # Older snapshots have no due date (third field), fine or checkout time
+                due_at, fine, checked_out_at = (fields + [None, 0, None][len(fields):])[:3]
+                if self.__apply(service, {"op": "checkout", "library_id": library_id, "isbn": isbn, "due_at": due_at, "at": checked_out_at}):
+                    report.snapshot_loans += 1
+                    if fine:
+                        self.__apply(service, {"op": "fine", "library_id": library_id, "isbn": isbn, "amount": fine})
+            for library_id, balance in balances.items(): # Bringing each balance to its snapshot value, loan fines included
+                difference = balance - service.get_user(library_id).get_balance() if balance is not None else 0
+                if difference > 0:
+                    self.__apply(service, {"op": "fine", "library_id": library_id, "isbn": None, "amount": difference})
+                elif difference < 0: # Part of an open loan's fine had been paid already
+                    self.__apply(service, {"op": "payment", "library_id": library_id, "amount": -difference})
+        last_sequence = snapshot_sequence
+        valid_length = 0 # Byte length of the journal up to the last complete record
+        if os.path.exists(self.__journal_path):
+            with open(self.__journal_path, "rb") as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line)
+                    except ValueError:
+                        report.truncated = True # Everything from a torn record on was never acknowledged as durable
+                        break
+                    valid_length += len(line)
+                    last_sequence = max(last_sequence, record["seq"])
+                    if record["seq"] <= snapshot_sequence: # Already part of the snapshot
+                        continue
+                    if self.__apply(service, record):
+                        report.replayed += 1
+                    else:
+                        report.skipped += 1
+            if report.truncated:
+                with open(self.__journal_path, "r+b") as file:
+                    file.truncate(valid_length)
+        with self.__lock:
+            self.__sequence = last_sequence
+            self.__since_snapshot = last_sequence - snapshot_sequence
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def __apply(self, service, record):
+        try:
+            if record["op"] == "user":
+                if service.find_user(record["library_id"]) is None:
+                    service.add_user(record["name"], record["library_id"])
+            elif record["op"] == "checkout":
+                service.check_out_book(record["library_id"], record["isbn"], record.get("due_at"), record.get("at"))
+            elif record["op"] == "return": # With the original time of the return, so a late return is fined as it was then
+                service.check_in_book(record["library_id"], record["isbn"], record.get("at"))
+            elif record["op"] == "fine":
+                service.charge_fine(record["library_id"], record["amount"], record.get("isbn"))
+            elif record["op"] == "payment":
+                service.pay_fine(record["library_id"], record["amount"])
+            else:
+                return False
+        except LibraryError:
+            return False
+        return True
+
+    def close(self):
+        with self.__lock:
+            self.__flush_locked() # Opens the journal if nothing was written yet, so records still in the buffer aren't lost
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+            self.__closed = True
+        if self.__service is not None:
+            self.__service.remove_listener(self.__on_event)
+            self.__service = None
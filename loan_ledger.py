@@ -0,0 +1,132 @@
+from collections.abc import Mapping
+from types import MappingProxyType
+import heapq
+import itertools
+import threading
+import time
+
+# The single source of truth for who has which book.
+# Every loan is indexed both by ISBN and by borrower, and the counters are updated with each change, so checkout, return,
+# "who has this book" and "is anything loaned" are all O(1). User.borrowed_books and LibraryService.loaned_books are views over it.
+# Loans with a due date are also kept in a min-heap ordered by due date, so the overdue loans are found without looking at the others.
+# The ledger relies on its callers to serialize changes to the same book and the same user (LibraryService does with striped locks).
+
+class Loan:
+    __slots__ = ("user", "book", "checked_out_at", "due_at", "fine")
+
+    def __init__(self, user, book, checked_out_at=None, due_at=None):
+        self.user = user
+        self.book = book
+        self.checked_out_at = time.time() if checked_out_at is None else checked_out_at
+        self.due_at = due_at # None for a loan without a due date
+        self.fine = 0 # Cents charged so far for returning the book late (see fines.py)
+
+class LoanedBooksView(Mapping):
+    # Read-only mapping of library ID -> {ISBN: Book} for the users that currently have books, in the shape of the old loaned_books dictionary
+    def __init__(self, borrowers):
+        self.__borrowers = borrowers
+
+    def __getitem__(self, library_id):
+        return MappingProxyType(self.__borrowers[library_id].get_loans())
+
+    def __iter__(self):
+        return iter(self.__borrowers)
+
+    def __len__(self):
+        return len(self.__borrowers)
+
+class LoanLedger:
+    def __init__(self):
+        self.__by_isbn = {} # ISBN -> Loan
+        self.__borrowers = {} # Library ID -> User, only for users with at least one book on loan
+        self.__total_checkouts = 0
+        self.__total_returns = 0
+        self.__counter_lock = threading.Lock() # Guards only the two counters: "+=" isn't atomic when loans change from several threads
+        self.__due = [] # Min-heap of (due date, sequence, Loan). Returned loans stay in it until they reach the top (lazy deletion)
+        self.__overdue = [] # The entries that have left the heap because they came due, still in due date order
+        self.__due_sequence = itertools.count() # Breaks ties between equal due dates, so loans themselves are never compared
+        self.__due_lock = threading.Lock()
+        self.loaned_books = LoanedBooksView(self.__borrowers)
+
+    def checkout(self, user, book, checked_out_at=None, due_at=None):
+        isbn = book.get_isbn()
+        if isbn in self.__by_isbn:
+            raise ValueError(f"ISBN {isbn} is already on loan")
+        loan = self.__by_isbn[isbn] = Loan(user, book, checked_out_at, due_at)
+        user.add_borrowed_book(book)
+        self.__borrowers[user.get_library_id()] = user
+        if due_at is not None:
+            with self.__due_lock:
+                heapq.heappush(self.__due, (due_at, next(self.__due_sequence), loan))
+        with self.__counter_lock:
+            self.__total_checkouts += 1
+        return loan
+
+    def return_book(self, isbn): # Closing the loan of a book and returning it, or None if the book isn't on loan
+        loan = self.__by_isbn.pop(isbn, None)
+        if loan is None:
+            return None
+        user = loan.user
+        user.remove_borrowed_book(isbn)
+        if not user.get_loans(): # Dropping users with no loans left, so the borrowers are always exactly the users with books
+            del self.__borrowers[user.get_library_id()]
+        with self.__counter_lock:
+            self.__total_returns += 1
+        if len(self.__due) > 2 * len(self.__by_isbn) + 64: # Mostly returned loans: rebuilding the heap from the live ones, O(n) now and then
+            with self.__due_lock:
+                self.__due = [entry for entry in self.__due if self.__is_live(entry)]
+                heapq.heapify(self.__due)
+        return loan
+
+    def __is_live(self, entry): # Whether a heap entry's loan is still out (and not a returned loan of the same ISBN)
+        return self.__by_isbn.get(entry[2].book.get_isbn()) is entry[2]
+
+    def overdue(self, now=None):
+        # The loans whose due date has passed, the most overdue first. A loan leaves the heap once, when it comes due, and is kept
+        # from then on in a list sorted by due date, where returned loans are dropped at the next query. So a query costs
+        # O(k + d log n) for k overdue loans of which d came due since the last query: the loans not due yet are never looked at.
+        now = time.time() if now is None else now
+        with self.__due_lock:
+            heap = self.__due
+            came_due = [] # In due date order, as they leave the heap
+            while heap and heap[0][0] <= now:
+                entry = heapq.heappop(heap)
+                if self.__is_live(entry):
+                    came_due.append(entry)
+            # A loan given a due date already past (e.g. replayed from a journal) can come due after later ones have left the heap,
+            # so the two sorted runs are merged rather than appended. Entries compare by (due date, sequence number), never by loan.
+            overdue = list(heapq.merge((entry for entry in self.__overdue if self.__is_live(entry)), came_due))
+            self.__overdue = overdue
+            # Asking about an earlier moment than before (e.g. a test clock) only happens by hand, so a filter is good enough there
+            return [entry[2] for entry in overdue if entry[0] <= now]
+
+    def get_loan(self, isbn):
+        return self.__by_isbn.get(isbn)
+
+    def holder(self, isbn): # The user who has the book, or None
+        loan = self.__by_isbn.get(isbn)
+        return loan.user if loan is not None else None
+
+    def has_loans(self):
+        return bool(self.__by_isbn)
+
+    def borrowers(self): # Users with at least one book on loan, in the order they first borrowed
+        return self.__borrowers.values()
+
+    def loans(self):
+        return self.__by_isbn.values()
+
+    def __len__(self): # Number of books currently on loan
+        return len(self.__by_isbn)
+
+    @property
+    def borrower_count(self):
+        return len(self.__borrowers)
+
+    @property
+    def total_checkouts(self):
+        return self.__total_checkouts
+
+    @property
+    def total_returns(self):
+        return self.__total_returns
@@ -1,6 +1,8 @@
 from book import Book
 
 class NonFictionBook(Book):
+    __slots__ = ("__subject",)
+
     def __init__(self, title, author, isbn, genre, subject):
         super().__init__(title, author, isbn, genre)
         self.__subject = subject
@@ -0,0 +1,31 @@
+from itertools import islice
+
+# Offset pagination over the library's listings.
+# Every listing walks its collection in the order the entities were added, and entities are only ever appended (a replaced book keeps
+# its place), so an offset is a stable cursor: the next page starts right after the last item seen, even if items were added meanwhile.
+
+class Page:
+    def __init__(self, items, offset, next_offset):
+        self.items = items
+        self.offset = offset
+        self.next_offset = next_offset # Offset of the following page, or None on the last page
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def take_page(items, offset, limit): # Cutting one page out of an iterator that is already positioned at offset
+    items = list(islice(items, limit + 1)) # Reading one item more than asked for tells whether another page follows
+    if len(items) > limit:
+        return Page(items[:limit], offset, offset + limit)
+    return Page(items, offset, None)
+
+def iter_pages(items, page_size): # Splitting any iterable into lists of page_size items, reading only as far as the pages requested
+    items = iter(items)
+    while True:
+        page = list(islice(items, page_size))
+        if not page:
+            return
+        yield page
@@ -0,0 +1,42 @@
+class Registry:
+    # A keyed collection of library entities (users, authors, genres).
+    # Lookups by key are O(1) dictionary hits, while iterating the registry still yields the objects in the order they were added,
+    # so the display methods can keep using "for user in self.users" just like they did with plain lists.
+    def __init__(self, key_func):
+        self.__key_func = key_func # Function extracting the key from an object, e.g. User.get_library_id
+        self.__items = {} # key -> object (dictionaries preserve insertion order)
+
+    def key_of(self, obj):
+        return self.__key_func(obj)
+
+    def add(self, obj): # Adding an object unless its key is already taken; returning the object stored under that key
+        key = self.__key_func(obj)
+        existing = self.__items.get(key)
+        if existing is not None:
+            return existing
+        self.__items[key] = obj
+        return obj
+
+    def get(self, key, default=None):
+        return self.__items.get(key, default)
+
+    def keys(self):
+        return self.__items.keys()
+
+    def values(self):
+        return self.__items.values()
+
+    def __getitem__(self, key):
+        return self.__items[key]
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def __iter__(self):
+        return iter(self.__items.values())
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __repr__(self):
+        return f"Registry({list(self.__items)})"
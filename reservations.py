@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import time
+
+# Reservation waitlists: patrons line up for a book that is on loan, and when it is returned it goes straight to the next in line
+# (see LibraryService.reserve_book and check_in_book).
+# Every book with holds has its own Waitlist, a heap ordered by priority and then by arrival, so equal priorities are served first
+# come, first served. Adding, cancelling and handing off are O(log n) at most, however many holds a popular title has.
+
+RESERVATION_EVENTS = ("reserved", "reservation_cancelled", "reservation_fulfilled")
+
+class Reservation:
+    __slots__ = ("user", "book", "priority", "sequence", "reserved_at")
+
+    def __init__(self, user, book, priority, sequence):
+        self.user = user
+        self.book = book
+        self.priority = priority # Higher priorities are served first (e.g. 1 for staff or course reserves, 0 for everyone else)
+        self.sequence = sequence # Arrival order, breaking ties between equal priorities
+        self.reserved_at = time.time()
+
+    def sort_key(self):
+        return (-self.priority, self.sequence)
+
+class Waitlist:
+    # The line of reservations for one book. Cancelling only drops the reservation from the dictionary, in O(1): its heap entry
+    # stays behind and is skipped once it reaches the top (lazy deletion). The heap is rebuilt when cancelled entries outnumber
+    # the live ones, so it never holds more than about twice the reservations actually waiting.
+    def __init__(self):
+        self.__heap = [] # (-priority, sequence, library ID)
+        self.__entries = {} # Library ID -> Reservation
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, library_id):
+        return library_id in self.__entries
+
+    def __iter__(self): # The reservations in the order they will be served (sorts the whole line, so meant for display only)
+        return iter(sorted(self.__entries.values(), key=Reservation.sort_key))
+
+    def add(self, reservation):
+        library_id = reservation.user.get_library_id()
+        self.__entries[library_id] = reservation
+        heapq.heappush(self.__heap, (-reservation.priority, reservation.sequence, library_id))
+
+    def cancel(self, library_id): # Removing a user's reservation and returning it, or None if the user isn't waiting
+        reservation = self.__entries.pop(library_id, None)
+        if reservation is not None and len(self.__heap) > 2 * len(self.__entries) + 16:
+            self.__heap = [(-live.priority, live.sequence, key) for key, live in self.__entries.items()]
+            heapq.heapify(self.__heap)
+        return reservation
+
+    def peek(self): # The reservation served next, or None
+        heap = self.__heap
+        entries = self.__entries
+        while heap:
+            _, sequence, library_id = heap[0]
+            reservation = entries.get(library_id)
+            if reservation is not None and reservation.sequence == sequence:
+                return reservation
+            heapq.heappop(heap) # Cancelled (or cancelled and made again later, with a new sequence number)
+        return None
+
+    def pop(self): # Removing and returning the reservation served next, or None
+        reservation = self.peek()
+        if reservation is not None:
+            heapq.heappop(self.__heap)
+            del self.__entries[reservation.user.get_library_id()]
+        return reservation
+
+    def position(self, library_id): # 1 for the next in line; O(n), for showing a patron where they stand
+        reservation = self.__entries.get(library_id)
+        if reservation is None:
+            return None
+        key = reservation.sort_key()
+        return 1 + sum(1 for other in self.__entries.values() if other.sort_key() < key)
+
+class Reservations:
+    # Every waitlist of the library, plus an index of each user's reservations. Like the LoanLedger, it relies on its caller to
+    # serialize changes to the same book and the same user.
+    def __init__(self):
+        self.__waitlists = {} # ISBN -> Waitlist, only for books someone is waiting for
+        self.__by_user = {} # Library ID -> {ISBN: Reservation}, only for users with reservations
+        self.__sequence = itertools.count()
+
+    def __len__(self): # Number of books with a waitlist
+        return len(self.__waitlists)
+
+    def add(self, user, book, priority=0):
+        reservation = Reservation(user, book, priority, next(self.__sequence))
+        isbn = book.get_isbn()
+        waitlist = self.__waitlists.get(isbn)
+        if waitlist is None:
+            waitlist = self.__waitlists[isbn] = Waitlist()
+        waitlist.add(reservation)
+        self.__by_user.setdefault(user.get_library_id(), {})[isbn] = reservation
+        return reservation
+
+    def cancel(self, library_id, isbn): # Returning the cancelled reservation, or None if there was none
+        waitlist = self.__waitlists.get(isbn)
+        reservation = waitlist.cancel(library_id) if waitlist is not None else None
+        if reservation is not None:
+            self.__forget(waitlist, library_id, isbn)
+        return reservation
+
+    def peek(self, isbn): # The reservation that will get the book when it is returned, or None
+        waitlist = self.__waitlists.get(isbn)
+        return waitlist.peek() if waitlist is not None else None
+
+    def pop_next(self, isbn):
+        waitlist = self.__waitlists.get(isbn)
+        reservation = waitlist.pop() if waitlist is not None else None
+        if reservation is not None:
+            self.__forget(waitlist, reservation.user.get_library_id(), isbn)
+        return reservation
+
+    def __forget(self, waitlist, library_id, isbn): # Dropping emptied waitlists and user entries, so both only hold live reservations
+        if not waitlist:
+            del self.__waitlists[isbn]
+        user_reservations = self.__by_user[library_id]
+        del user_reservations[isbn]
+        if not user_reservations:
+            del self.__by_user[library_id]
+
+    def has_reservation(self, library_id, isbn):
+        return isbn in self.__by_user.get(library_id, ())
+
+    def waitlist(self, isbn): # The reservations for a book, in the order they will be served
+        waitlist = self.__waitlists.get(isbn)
+        return list(waitlist) if waitlist is not None else []
+
+    def waitlist_length(self, isbn):
+        waitlist = self.__waitlists.get(isbn)
+        return len(waitlist) if waitlist is not None else 0
+
+    def position(self, library_id, isbn):
+        waitlist = self.__waitlists.get(isbn)
+        return waitlist.position(library_id) if waitlist is not None else None
+
+    def of_user(self, library_id): # The reservations a user is waiting on, in the order they were made
+        return list(self.__by_user.get(library_id, {}).values())
+
+# Subscribers: listeners (see LibraryService.add_listener) that pass only the reservation events on, in the shape each consumer needs.
+#   service.add_listener(CallbackSubscriber(lambda event, user, book: ...))
+#   service.add_listener(LogFileSubscriber("reservations.log"))
+#   service.add_listener(QueueSubscriber(notifications)) # notifications = queue.Queue(), drained by e.g. an e-mail sender thread
+
+class Subscriber:
+    events = RESERVATION_EVENTS
+
+    def __call__(self, event, *args):
+        if event in self.events:
+            self.handle(event, *args)
+
+    def handle(self, event, user, book):
+        raise NotImplementedError
+
+class CallbackSubscriber(Subscriber):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def handle(self, event, user, book):
+        self.callback(event, user, book)
+
+class LogFileSubscriber(Subscriber):
+    # Appending one line per event to a text file, e.g. for the front desk to print the day's "ready for pickup" slips
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8", buffering=1) # Line buffered: every event is in the file as soon as it happens
+
+    def handle(self, event, user, book):
+        self.file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{event}\t{user.get_library_id()}\t{book.get_isbn()}\t{book.get_title()}\n")
+
+    def close(self):
+        self.file.close()
+
+class QueueSubscriber(Subscriber):
+    # Putting (event, library ID, ISBN) tuples on a queue (queue.Queue, multiprocessing.Queue, ...), so slow work such as sending
+    # e-mails happens in a consumer and never holds up a return
+    def __init__(self, queue):
+        self.queue = queue
+
+    def handle(self, event, user, book):
+        self.queue.put((event, user.get_library_id(), book.get_isbn()))
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+import threading
+
+# A bounded LRU cache of search results, so the same title or author search run over and over (e.g. at the front desk) is one
+# dictionary lookup. Every entry remembers the catalog version it was computed at (see LibraryService.catalog_version); the service
+# bumps the version whenever a book is added or replaced, so an entry from before the change is never returned, however long ago
+# it was stored. Results are mappings of ISBN -> Book: the books are the live objects, so their availability is always current and
+# checkouts and returns don't have to throw any cached search away.
+
+SEARCH_CACHE_SIZE = 1024 # Entries kept by default
+MAX_CACHED_RESULT = 10_000 # Bigger results aren't cached: showing them costs far more than finding them again
+
+class SearchCache:
+    def __init__(self, capacity=SEARCH_CACHE_SIZE, max_result=MAX_CACHED_RESULT):
+        self.capacity = capacity
+        self.max_result = max_result
+        self.__entries = OrderedDict() # (search type, normalized query, options) -> (catalog version, result), least recently used first
+        self.__lock = threading.Lock() # Searches may come from several threads (concurrent mode, sharded workers)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0 # Misses that found an entry computed before the catalog changed
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key, version): # The cached result, or None if there is none for this catalog version
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.__entries[key] # Computed before the catalog changed
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, result):
+        if len(result) > self.max_result:
+            return
+        with self.__lock:
+            self.__entries[key] = (version, result)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.__entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                    "stale": self.stale, "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
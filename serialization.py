@@ -0,0 +1,19 @@
+from library_service import book_category
+
+# Plain-dictionary forms of the library's entities, ready for json.dumps or pickling: what the HTTP server sends and what the shard
+# processes of sharded_catalog.py return. Only keys are included for related entities (an author's name, a user's ISBNs), so
+# serializing a book never drags its author's and genre's whole book lists along with it.
+
+def book_to_dict(book):
+    return {"isbn": book.get_isbn(), "title": book.get_title(), "author": book.get_author().get_name(),
+            "genre": book.get_genre().get_name(), "category": book_category(book), "available": book.is_available()}
+
+def user_to_dict(user):
+    return {"library_id": user.get_library_id(), "name": user.name, "borrowed": list(user.get_loans()), "balance": user.get_balance()}
+
+def loan_to_dict(loan):
+    return {"library_id": loan.user.get_library_id(), "isbn": loan.book.get_isbn(), "due_at": loan.due_at, "fine": loan.fine}
+
+def reservation_to_dict(reservation):
+    return {"library_id": reservation.user.get_library_id(), "isbn": reservation.book.get_isbn(), "priority": reservation.priority,
+            "reserved_at": reservation.reserved_at}
@@ -0,0 +1,235 @@
+from library_service import LibraryService, validate_isbn, validate_library_id
+from serialization import book_to_dict
+from errors import LibraryError
+from token_index import rank, tokenize
+import multiprocessing
+import zlib
+
+# A catalog split across worker processes, so searches and loans can use more than one core despite the GIL.
+# Every shard is a separate process running its own LibraryService over a slice of the books. Books are assigned to shards by
+# the CRC32 of their ISBN (rather than the registrant prefix of the 978-xx-xxxxx structure, which would pile big publishers onto one
+# shard). ISBN operations go straight to the owning shard, title and author searches are sent to every shard at once and the answers
+# merged, and users are added to every shard so any shard can lend its books to them.
+# Results come back as plain dictionaries (see serialization.py, the HTTP server sends the same ones), because pickling a Book would drag its author's and
+# genre's whole book lists along with it.
+
+def shard_of(isbn, shard_count): # The shard owning an ISBN; crc32 is the same in every process, unlike hash() of a string
+    return zlib.crc32(isbn.encode("ascii")) % shard_count
+
+# Commands run inside a shard process. Each takes the shard's service and returns something cheap to pickle:
+def add_books(service, records):
+    rejected = [] # Errors of the books that couldn't be added
+    with service.batch():
+        for title, author, isbn, genre, category in records:
+            try:
+                service.add_book(title, author, isbn, genre, category)
+            except LibraryError as e:
+                rejected.append(e)
+    return rejected
+
+def add_user(service, name, library_id):
+    service.add_user(name, library_id)
+
+def check_out_books(service, loans):
+    # Running a group of checkouts in one round trip; each outcome is the book, or the error raised for that loan
+    results = []
+    for library_id, isbn in loans:
+        try:
+            results.append(book_to_dict(service.check_out_book(library_id, isbn)))
+        except LibraryError as e:
+            results.append(e)
+    return results
+
+def check_in_books(service, loans):
+    results = []
+    for library_id, isbn in loans:
+        try:
+            results.append(book_to_dict(service.check_in_book(library_id, isbn)))
+        except LibraryError as e:
+            results.append(e)
+    return results
+
+def search_title(service, title, substring):
+    if substring:
+        return [book_to_dict(book) for book in service.search_title(title, substring=True).values()]
+    # Only the index here: whether to fall back to substring matching depends on the other shards' answers too
+    return [book_to_dict(service.books[isbn]) for isbn in service.title_index.search(title.lower().strip())]
+
+def search_author(service, author):
+    return [book_to_dict(book) for book in service.search_author(author).values()]
+
+def search_isbn(service, isbn):
+    return [book_to_dict(book) for book in service.search_isbn(isbn).values()]
+
+def count_books(service):
+    return len(service.books)
+
+SHARD_COMMANDS = {command.__name__: command for command in
+                  (add_books, add_user, check_out_books, check_in_books, search_title, search_author, search_isbn, count_books)}
+
+def run_shard(connection):
+    # The main loop of a shard process: executing commands until the parent sends None
+    service = LibraryService()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        name, args = message
+        try:
+            connection.send((True, SHARD_COMMANDS[name](service, *args)))
+        except Exception as e: # Any failure goes back to the parent, which raises it, and the shard keeps serving
+            try:
+                connection.send((False, e))
+            except Exception: # The exception can't be pickled (nothing was written to the pipe then): sending its description
+                connection.send((False, RuntimeError(f"{type(e).__name__} in shard: {e}")))
+    connection.close()
+
+class ShardedLibrary:
+    def __init__(self, shards=None):
+        shards = shards or multiprocessing.cpu_count()
+        self.__connections = []
+        self.__processes = []
+        for _ in range(shards):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_shard, args=(child_end,), daemon=True)
+            process.start()
+            child_end.close()
+            self.__connections.append(parent_end)
+            self.__processes.append(process)
+
+    @property
+    def shard_count(self):
+        return len(self.__connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connection in self.__connections:
+            connection.send(None)
+        for process in self.__processes:
+            process.join()
+        for connection in self.__connections:
+            connection.close()
+        self.__connections = []
+        self.__processes = []
+
+    # Talking to the shards:
+    def __call(self, shard, name, *args):
+        connection = self.__connections[shard]
+        connection.send((name, args))
+        return self.__receive(connection)
+
+    def __scatter(self, calls):
+        # Sending every (shard, name, args) call before waiting for any answer, so the shards work in parallel; answers come back in call order
+        for shard, name, args in calls:
+            self.__connections[shard].send((name, args))
+        answers = [self.__connections[shard].recv() for shard, _, _ in calls]
+        for ok, result in answers: # Raising only after every answer has been read, so no pipe is left with a stale answer in it
+            if not ok:
+                raise result
+        return [result for _, result in answers]
+
+    def __receive(self, connection):
+        ok, result = connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def __broadcast(self, name, *args):
+        return self.__scatter([(shard, name, args) for shard in range(self.shard_count)])
+
+    def __group_by_shard(self, items, isbn_position): # Splitting (..., ISBN, ...) tuples into one list per shard, remembering where each came from
+        groups = {}
+        for position, item in enumerate(items):
+            shard = shard_of(item[isbn_position], self.shard_count)
+            positions, group = groups.setdefault(shard, ([], []))
+            positions.append(position)
+            group.append(item)
+        return groups
+
+    # Books and users:
+    def add_book(self, title, author, isbn, genre, category):
+        rejected = self.add_books([(title, author, isbn, genre, category)])
+        if rejected:
+            raise rejected[0]
+
+    def add_books(self, records):
+        # Adding (title, author, ISBN, genre, category) records in one batch per shard and returning the errors of the rejected ones.
+        # ISBNs are validated here first, so every shard receives them in the same canonical form.
+        rejected = []
+        cleaned = []
+        for title, author, isbn, genre, category in records:
+            try:
+                cleaned.append((title, author, validate_isbn(isbn), genre, category))
+            except LibraryError as e:
+                rejected.append(e)
+        groups = self.__group_by_shard(cleaned, 2)
+        for shard_rejections in self.__scatter([(shard, "add_books", (group,)) for shard, (_, group) in groups.items()]):
+            rejected.extend(shard_rejections)
+        return rejected
+
+    def add_user(self, name, library_id): # Users are copied to every shard, since any of them may lend a book to the user
+        self.__broadcast("add_user", name, validate_library_id(library_id))
+
+    def book_count(self):
+        return sum(self.__broadcast("count_books"))
+
+    # Loans (routed to the shard owning the book):
+    def check_out_book(self, library_id, isbn):
+        result = self.check_out_books([(library_id, isbn)])[0]
+        if isinstance(result, LibraryError):
+            raise result
+        return result
+
+    def check_in_book(self, library_id, isbn):
+        result = self.check_in_books([(library_id, isbn)])[0]
+        if isinstance(result, LibraryError):
+            raise result
+        return result
+
+    def check_out_books(self, loans):
+        # Running many (library ID, ISBN) checkouts with one round trip per shard. Returns, in the order of the loans,
+        # the book dictionary of each successful checkout or the LibraryError that made it fail.
+        return self.__route_loans("check_out_books", loans)
+
+    def check_in_books(self, loans):
+        return self.__route_loans("check_in_books", loans)
+
+    def __route_loans(self, name, loans):
+        results = [None] * len(loans)
+        cleaned = []
+        for position, (library_id, isbn) in enumerate(loans):
+            try:
+                cleaned.append((position, (validate_library_id(library_id), validate_isbn(isbn))))
+            except LibraryError as e:
+                results[position] = e
+        groups = self.__group_by_shard([loan for _, loan in cleaned], 1)
+        calls = [(shard, name, (group,)) for shard, (_, group) in groups.items()]
+        for (shard, (positions, _)), shard_results in zip(groups.items(), self.__scatter(calls)):
+            for position, result in zip(positions, shard_results):
+                results[cleaned[position][0]] = result
+        return results
+
+    # Searches (each returns a list of book dictionaries, best matches first):
+    def search_isbn(self, isbn):
+        isbn = validate_isbn(isbn)
+        return self.__call(shard_of(isbn, self.shard_count), "search_isbn", isbn)
+
+    def search_title(self, title, substring=False):
+        books = [book for books in self.__broadcast("search_title", title, substring) for book in books]
+        if substring or not books:
+            if not books: # Falling back to substring matching only when no shard had an indexed match, as LibraryService does
+                books = [book for books in self.__broadcast("search_title", title, True) for book in books]
+            return books
+        # Each shard ranked its own matches; ranking the merged list the same way gives the order a single catalog would have
+        phrase = " ".join(tokenize(title))
+        return sorted(books, key=lambda book: rank(book["title"], phrase))
+
+    def search_author(self, author):
+        results = self.__broadcast("search_author", author)
+        phrase = " ".join(tokenize(author))
+        return sorted((book for books in results for book in books), key=lambda book: rank(book["author"], phrase))
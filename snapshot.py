@@ -0,0 +1,373 @@
+from user import User
+from author import Author
+from genre import Genre
+from fiction import FictionBook
+from nonfiction import NonFictionBook
+from storage import LazyBookTable, LazyRegistry, SQLiteStore
+from isbn import isbn_to_int, int_to_isbn
+from errors import ReadOnlyStoreError
+from library_service import LibraryService, book_category
+import argparse
+import math
+import mmap
+import os
+import struct
+import threading
+
+# Binary catalog snapshots, for instant startup and read-only search replicas.
+# write_snapshot() exports a library's books, authors, genres with their categories, users and loans to one file with a fixed layout:
+# a header giving the position of every section, a string table (one offset per string, then the UTF-8 bytes back to back), and
+# fixed-size records that point at strings and at each other by number. Authors, users and ISBNs also have sorted key indexes.
+# SnapshotStore opens such a file with mmap and serves it to LibraryService as a read-only store. Nothing is parsed when it opens:
+# record n of a section sits at the section's offset + n * record size, lookups binary search the key indexes in place, and records
+# are read straight from the mapped pages with struct.unpack_from. A book, author, genre or user only becomes a Python object the first
+# time it is looked up (looking up an author builds all of their books), so a replica of any size starts in milliseconds and the
+# operating system only pages in the parts of the file that are read.
+
+MAGIC = b"LIBSNAP\x00"
+VERSION = 2 # Version 2 added the checkout time of loans
+HEADER = struct.Struct("<8sII") # Magic, version, number of sections
+SECTION = struct.Struct("<QQ") # Offset in the file, number of records (of bytes for the string data)
+SECTIONS = ("strings", "string_data", "genres", "categories", "authors", "author_index", "author_books", "books", "isbn_index",
+            "users", "user_index", "loans")
+# The records of each section (the string data is raw bytes). String and row numbers are 32-bit, ISBNs are stored as 13-digit integers.
+RECORDS = {
+    "strings": struct.Struct("<Q"), # Offset of the string in the string data; one more entry marks the end of the last string
+    "genres": struct.Struct("<IIII"), # Name, description, first category, number of categories
+    "categories": struct.Struct("<I"), # Name
+    "authors": struct.Struct("<IIII"), # Name, biography, first entry in author_books, number of books
+    "author_index": struct.Struct("<I"), # Author rows in name order
+    "author_books": struct.Struct("<I"), # Book rows, each author's books in the order they were added
+    "books": struct.Struct("<QIIIIB"), # ISBN, title, author row, genre row, category, 1 if on loan
+    "isbn_index": struct.Struct("<QI"), # (ISBN, book row) in ISBN order
+    "users": struct.Struct("<IIq"), # Library ID, name, balance in cents
+    "user_index": struct.Struct("<I"), # User rows in library ID order
+    "loans": struct.Struct("<IIdqd"), # Book row, user row, due date (NaN for none), fine charged so far, checkout time
+}
+TABLE_SECTIONS = {"books": "books", "authors": "authors", "genres": "genres", "users": "users"} # The storage.py table names
+
+class StringTable:
+    def __init__(self):
+        self.__ids = {} # String -> number, so each distinct string is stored once
+        self.offsets = [0]
+        self.data = bytearray()
+
+    def add(self, text):
+        number = self.__ids.get(text)
+        if number is None:
+            number = self.__ids[text] = len(self.offsets) - 1
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return number
+
+def write_snapshot(service, path):
+    # Writing the whole library to a snapshot file. The file replaces any previous one atomically (write to a temporary file, fsync,
+    # rename), so a replica never opens a half-written snapshot.
+    service.load_all()
+    strings = StringTable()
+    sections = {name: [] for name in SECTIONS if name not in ("strings", "string_data")}
+    genre_rows = {}
+    for genre in service.genres.values():
+        categories = list(genre.get_categories())
+        genre_rows[genre.get_name()] = len(sections["genres"])
+        sections["genres"].append((strings.add(genre.get_name()), strings.add(genre.get_description()), len(sections["categories"]),
+                                   len(categories)))
+        sections["categories"].extend((strings.add(category),) for category in categories)
+    books = list(service.books.values())
+    book_rows = {book.get_isbn(): row for row, book in enumerate(books)}
+    authors = list(service.authors.values())
+    author_rows = {author.get_name(): row for row, author in enumerate(authors)}
+    for author in authors:
+        rows = [book_rows[book.get_isbn()] for book in author.author_books if book_rows.get(book.get_isbn()) is not None]
+        sections["authors"].append((strings.add(author.get_name()), strings.add(author.get_biography()), len(sections["author_books"]),
+                                    len(rows)))
+        sections["author_books"].extend((row,) for row in rows)
+    names = [author.get_name().encode("utf-8") for author in authors]
+    sections["author_index"] = [(row,) for row in sorted(range(len(authors)), key=names.__getitem__)]
+    for book in books:
+        sections["books"].append((isbn_to_int(book.get_isbn()), strings.add(book.get_title()), author_rows[book.get_author().get_name()],
+                                  genre_rows[book.get_genre().get_name()], strings.add(book_category(book)), 0 if book.is_available() else 1))
+    sections["isbn_index"] = sorted((record[0], row) for row, record in enumerate(sections["books"]))
+    users = list(service.users.values())
+    user_rows = {user.get_library_id(): row for row, user in enumerate(users)}
+    sections["users"] = [(strings.add(user.get_library_id()), strings.add(user.name), user.get_balance()) for user in users]
+    library_ids = [user.get_library_id().encode("utf-8") for user in users]
+    sections["user_index"] = [(row,) for row in sorted(range(len(users)), key=library_ids.__getitem__)]
+    sections["loans"] = [(book_rows[loan.book.get_isbn()], user_rows[loan.user.get_library_id()],
+                          math.nan if loan.due_at is None else loan.due_at, loan.fine, loan.checked_out_at) for loan in service.ledger.loans()]
+
+    # Laying the sections out one after the other behind the header and the section table:
+    blobs = {"strings": b"".join(RECORDS["strings"].pack(offset) for offset in strings.offsets), "string_data": bytes(strings.data)}
+    counts = {"strings": len(strings.offsets) - 1, "string_data": len(strings.data)}
+    for name, records in sections.items():
+        blobs[name] = b"".join(RECORDS[name].pack(*record) for record in records)
+        counts[name] = len(records)
+    position = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    for name in SECTIONS:
+        table.append(SECTION.pack(position, counts[name]))
+        position += len(blobs[name])
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS)))
+        file.write(b"".join(table))
+        for name in SECTIONS:
+            file.write(blobs[name])
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+class SnapshotStore:
+    # A read-only store over a snapshot file. It provides the queries storage.py's lazy collections need (has_row, count_rows,
+    # iter_keys and the load_* functions), so the books, authors, genres and users are the same LazyBookTable and LazyRegistry as
+    # SQLiteStore's. Every save_*/record_* method raises ReadOnlyStoreError; LibraryService checks read_only before changing anything.
+    read_only = True
+
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # An empty file can't be mapped
+            self.__file.close()
+            raise ValueError(f"{path} is not a library snapshot")
+        self.__view = memoryview(self.__map) # Strings are decoded straight from the mapped pages
+        magic, version, section_count = HEADER.unpack_from(self.__map, 0) if len(self.__map) >= HEADER.size else (None, None, 0)
+        if magic != MAGIC or version != VERSION or section_count != len(SECTIONS):
+            self.close()
+            raise ValueError(f"{path} is not a library snapshot (version {VERSION})")
+        self.__sections = {name: SECTION.unpack_from(self.__map, HEADER.size + number * SECTION.size) for number, name in enumerate(SECTIONS)}
+        self.load_lock = threading.RLock() # Held while an entity is built on first access, as in SQLiteStore
+        self.books = LazyBookTable(self)
+        self.users = LazyRegistry(self, User.get_library_id, "users", "library_id", self.load_user)
+        self.authors = LazyRegistry(self, Author.get_name, "authors", "name", self.load_author)
+        self.genres = LazyRegistry(self, Genre.get_name, "genres", "name", self.load_genre)
+        self.__partial_authors = {} # Author row -> Author built for the books looked up so far, until the author is looked up
+
+    # Reading the file:
+    def record(self, section, row): # The fields of one record, unpacked in place from the mapped file
+        offset, count = self.__sections[section]
+        if not 0 <= row < count:
+            raise IndexError(f"{section} has no row {row}")
+        layout = RECORDS[section]
+        return layout.unpack_from(self.__map, offset + row * layout.size)
+
+    def string(self, number):
+        offset = self.__sections["strings"][0]
+        start, end = struct.unpack_from("<QQ", self.__map, offset + number * 8)
+        data_offset = self.__sections["string_data"][0]
+        return str(self.__view[data_offset + start:data_offset + end], "utf-8")
+
+    def __string_bytes(self, number): # The UTF-8 bytes of a string, for comparing keys during binary searches
+        offset = self.__sections["strings"][0]
+        start, end = struct.unpack_from("<QQ", self.__map, offset + number * 8)
+        data_offset = self.__sections["string_data"][0]
+        return self.__map[data_offset + start:data_offset + end]
+
+    def __search(self, index, section, key): # The row whose first field (a string) is key, by binary search over a sorted index
+        wanted = key.encode("utf-8")
+        offset, count = self.__sections[index]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            row, = RECORDS[index].unpack_from(self.__map, offset + middle * 4)
+            if self.__string_bytes(self.record(section, row)[0]) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count:
+            row, = RECORDS[index].unpack_from(self.__map, offset + low * 4)
+            if self.__string_bytes(self.record(section, row)[0]) == wanted:
+                return row
+        return None
+
+    def __book_row(self, isbn):
+        try:
+            number = isbn_to_int(isbn)
+        except ValueError: # Not an ISBN at all
+            return None
+        offset, count = self.__sections["isbn_index"]
+        layout = RECORDS["isbn_index"]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if layout.unpack_from(self.__map, offset + middle * layout.size)[0] < number:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count:
+            found, row = layout.unpack_from(self.__map, offset + low * layout.size)
+            if found == number:
+                return row
+        return None
+
+    def __genre_row(self, name): # Linear: a library has a couple of genres
+        for row in range(self.__sections["genres"][1]):
+            if self.string(self.record("genres", row)[0]) == name:
+                return row
+        return None
+
+    def __find(self, table, key):
+        if table == "books":
+            return self.__book_row(key)
+        if table == "genres":
+            return self.__genre_row(key)
+        return self.__search("author_index" if table == "authors" else "user_index", table, key)
+
+    def __key_at(self, table, row):
+        fields = self.record(TABLE_SECTIONS[table], row)
+        return int_to_isbn(fields[0]) if table == "books" else self.string(fields[0])
+
+    # Generic queries used by the lazy collections:
+    def has_row(self, table, column, key):
+        return self.__find(table, key) is not None
+
+    def count_rows(self, table):
+        return self.__sections[TABLE_SECTIONS[table]][1]
+
+    def iter_keys(self, table, column): # Keys in the order the entities were added to the library
+        for row in range(self.count_rows(table)):
+            yield self.__key_at(table, row)
+
+    # Loading entities on first access:
+    def __author_at(self, row): # The Author of a row: the registered one, or one built for some of its books only (see load_book)
+        author = self.authors.cache.get(self.__key_at("authors", row))
+        if author is None:
+            author = self.__partial_authors.get(row)
+        if author is None:
+            name, biography = self.record("authors", row)[:2]
+            author = self.__partial_authors[row] = Author(self.string(name), self.string(biography))
+        return author
+
+    def __build_book(self, row, author): # Materializing one book (the Book constructor adds it to author.author_books)
+        number, title, _, genre_row, category, on_loan = self.record("books", row)
+        isbn = int_to_isbn(number)
+        genre_name = self.string(self.record("genres", genre_row)[0])
+        genre = self.genres[genre_name]
+        category = self.string(category)
+        book_class = FictionBook if genre_name == "Fiction" else NonFictionBook
+        book = book_class(self.string(title), author, isbn, genre, category)
+        if on_loan:
+            book.set_is_available(False)
+        genre.add_book_to_category(category, book)
+        self.books.cache[isbn] = book
+        return book
+
+    def load_author(self, name):
+        row = self.__find("authors", name)
+        if row is None:
+            return None
+        author = self.__author_at(row)
+        # Completing the author's books before registering the author, so Author.author_books is always complete and in order:
+        _, _, first_book, book_count = self.record("authors", row)
+        books = []
+        for entry in range(first_book, first_book + book_count):
+            book_row, = self.record("author_books", entry)
+            book = self.books.cache.get(int_to_isbn(self.record("books", book_row)[0]))
+            books.append(book if book is not None else self.__build_book(book_row, author))
+        author.author_books[:] = books
+        self.__partial_authors.pop(row, None)
+        return self.authors.add(author)
+
+    def load_book(self, isbn):
+        # Only the book itself is built: its author stays unregistered (and its other books unread) until the author is looked up
+        row = self.__book_row(isbn)
+        if row is None:
+            return None
+        return self.__build_book(row, self.__author_at(self.record("books", row)[2]))
+
+    def load_genre(self, name):
+        row = self.__genre_row(name)
+        if row is None:
+            return None
+        _, description, first_category, category_count = self.record("genres", row)
+        genre = self.genres.add(Genre(name, self.string(description)))
+        for entry in range(first_category, first_category + category_count):
+            genre.add_category(self.string(self.record("categories", entry)[0]))
+        return genre
+
+    def __user_at(self, row):
+        library_id, name, balance = self.record("users", row)
+        library_id = self.string(library_id)
+        user = self.users.cache.get(library_id)
+        if user is None:
+            user = self.users.add(User(self.string(name), library_id, balance)) # The user's loans are restored by the service from active_loans()
+        return user
+
+    def load_user(self, library_id):
+        row = self.__find("users", library_id)
+        return self.__user_at(row) if row is not None else None
+
+    def load_all(self): # Materializing every author (and with them every book) and every genre
+        for _ in self.genres.values():
+            pass
+        for _ in self.authors.values():
+            pass
+
+    def active_loans(self): # (library ID, ISBN, due date, fine charged so far, checkout time) of the books on loan when the snapshot was written
+        # The borrowers and the books are built here from their rows, so the service finds them cached instead of searching the indexes
+        loans = []
+        for row in range(self.__sections["loans"][1]):
+            book_row, user_row, due_at, fine, checked_out_at = self.record("loans", row)
+            isbn = int_to_isbn(self.record("books", book_row)[0])
+            if isbn not in self.books.cache:
+                self.__build_book(book_row, self.__author_at(self.record("books", book_row)[2]))
+            loans.append((self.__user_at(user_row).get_library_id(), isbn, None if math.isnan(due_at) else due_at, fine, checked_out_at))
+        return loans
+
+    def iter_titles(self): # Read from the records without building any book
+        for row in range(self.count_rows("books")):
+            number, title = self.record("books", row)[:2]
+            yield int_to_isbn(number), self.string(title)
+
+    def iter_author_names(self):
+        return self.iter_keys("authors", "name")
+
+    # A snapshot is never written to:
+    def batch(self):
+        raise ReadOnlyStoreError()
+
+    def save_book(self, book, category):
+        raise ReadOnlyStoreError()
+
+    def save_user(self, user):
+        raise ReadOnlyStoreError()
+
+    def save_author(self, author):
+        raise ReadOnlyStoreError()
+
+    def save_genre(self, genre):
+        raise ReadOnlyStoreError()
+
+    def save_category(self, genre, category):
+        raise ReadOnlyStoreError()
+
+    def record_checkout(self, library_id, isbn, due_at=None, checked_out_at=None):
+        raise ReadOnlyStoreError()
+
+    def record_return(self, library_id, isbn):
+        raise ReadOnlyStoreError()
+
+    def save_balance(self, user):
+        raise ReadOnlyStoreError()
+
+    def record_fines(self, loans, users):
+        raise ReadOnlyStoreError()
+
+    def close(self):
+        if self.__map.closed:
+            return
+        self.__view.release()
+        self.__map.close()
+        self.__file.close()
+
+if __name__ == "__main__":
+    # Exporting a database to a snapshot, e.g.: python snapshot.py library.db library.snapshot
+    # The snapshot can then be served by read-only replicas: python library_server.py --snapshot library.snapshot
+    parser = argparse.ArgumentParser(description="Export a library database to a binary snapshot for read-only replicas.")
+    parser.add_argument("db", help="SQLite database to export")
+    parser.add_argument("path", help="Snapshot file to write")
+    args = parser.parse_args()
+    service = LibraryService(SQLiteStore(args.db))
+    write_snapshot(service, args.path)
+    print(f"Wrote {len(service.books)} books, {len(service.authors)} authors and {len(service.users)} users to {args.path}")
+    service.store.close()
@@ -0,0 +1,346 @@
+from user import User
+from author import Author
+from genre import Genre
+from fiction import FictionBook
+from nonfiction import NonFictionBook
+from registry import Registry
+from contextlib import contextmanager, nullcontext
+import sqlite3
+import threading
+
+# Storage backends for LibraryService.
+# A store owns the library's collections (books, users, authors, genres) and is told about every change through the save_*/record_*
+# methods. MemoryStore keeps everything in dictionaries and forgets it on exit (handy for tests and benchmarks); SQLiteStore persists
+# every change and loads entities lazily, the first time they are looked up.
+
+class MemoryStore:
+    read_only = False # See snapshot.SnapshotStore for a store that is
+
+    def __init__(self):
+        self.books = {} # ISBN -> Book
+        self.users = Registry(User.get_library_id)
+        self.authors = Registry(Author.get_name)
+        self.genres = Registry(Genre.get_name)
+
+    # Nothing needs to be written anywhere, the collections above are the whole state:
+    def save_book(self, book, category):
+        pass
+
+    def save_user(self, user):
+        pass
+
+    def save_author(self, author):
+        pass
+
+    def save_genre(self, genre):
+        pass
+
+    def save_category(self, genre, category):
+        pass
+
+    def record_checkout(self, library_id, isbn, due_at=None, checked_out_at=None):
+        pass
+
+    def record_return(self, library_id, isbn):
+        pass
+
+    def save_balance(self, user):
+        pass
+
+    def record_fines(self, loans, users): # The new fine totals of some loans and the new balances of their users
+        pass
+
+    def batch(self):
+        return nullcontext()
+
+    def active_loans(self): # (library ID, ISBN, due date, fine charged so far, checkout time) of the books on loan when the store was opened
+        return []
+
+    def iter_titles(self): # (ISBN, title) pairs of the whole catalog, used to build the title index
+        return ((isbn, book.get_title()) for isbn, book in self.books.items())
+
+    def iter_author_names(self):
+        return iter(self.authors.keys())
+
+    def load_all(self): # Materializing every entity (nothing to do: everything is already in memory)
+        pass
+
+    def close(self):
+        pass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS authors (name TEXT PRIMARY KEY, biography TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS genres (name TEXT PRIMARY KEY, description TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS categories (genre TEXT NOT NULL, name TEXT NOT NULL, PRIMARY KEY (genre, name));
+CREATE TABLE IF NOT EXISTS books (isbn TEXT PRIMARY KEY, title TEXT NOT NULL, author TEXT NOT NULL, genre TEXT NOT NULL, category TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS books_by_author ON books (author);
+CREATE TABLE IF NOT EXISTS users (library_id TEXT PRIMARY KEY, name TEXT NOT NULL, balance INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS loans (isbn TEXT PRIMARY KEY, library_id TEXT NOT NULL, due_at REAL, fine INTEGER NOT NULL DEFAULT 0,
+                                  checked_out_at REAL);
+CREATE INDEX IF NOT EXISTS loans_by_user ON loans (library_id);
+"""
+# Columns added to the schema later, and added to databases created before them when they are opened:
+ADDED_COLUMNS = (("users", "balance", "INTEGER NOT NULL DEFAULT 0"), ("loans", "due_at", "REAL"), ("loans", "fine", "INTEGER NOT NULL DEFAULT 0"),
+                 ("loans", "checked_out_at", "REAL"))
+
+class LazyBookTable:
+    # A dictionary-like view of the books table. Books are built the first time they are looked up and cached afterwards;
+    # iterating the table walks the rows in insertion order and materializes them one by one.
+    def __init__(self, store):
+        self.__store = store
+        self.cache = {} # ISBN -> Book, for the books materialized so far
+
+    def get(self, isbn, default=None):
+        book = self.cache.get(isbn)
+        if book is None:
+            with self.__store.load_lock: # Two threads missing the same book must not both build it
+                book = self.cache.get(isbn) or self.__store.load_book(isbn)
+        return default if book is None else book
+
+    def __getitem__(self, isbn):
+        book = self.get(isbn)
+        if book is None:
+            raise KeyError(isbn)
+        return book
+
+    def __setitem__(self, isbn, book): # The row itself is written by SQLiteStore.save_book()
+        self.cache[isbn] = book
+
+    def __contains__(self, isbn):
+        return isbn in self.cache or self.__store.has_row("books", "isbn", isbn)
+
+    def __len__(self):
+        return self.__store.count_rows("books")
+
+    def __iter__(self):
+        return iter(self.__store.iter_keys("books", "isbn"))
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (self[isbn] for isbn in self)
+
+    def items(self):
+        return ((isbn, self[isbn]) for isbn in self)
+
+class LazyRegistry:
+    # The lazily loaded counterpart of Registry, backed by one table of the database
+    def __init__(self, store, key_func, table, key_column, loader):
+        self.__store = store
+        self.__key_func = key_func
+        self.__table = table
+        self.__key_column = key_column
+        self.__loader = loader # Function building the object for a key from the database, or returning None
+        self.cache = {}
+
+    def key_of(self, obj):
+        return self.__key_func(obj)
+
+    def add(self, obj): # Caching a new object; the row itself is written by the matching SQLiteStore.save_*() method
+        return self.cache.setdefault(self.__key_func(obj), obj)
+
+    def get(self, key, default=None):
+        obj = self.cache.get(key)
+        if obj is None:
+            with self.__store.load_lock:
+                obj = self.cache.get(key) or self.__loader(key)
+        return default if obj is None else obj
+
+    def __getitem__(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __contains__(self, key):
+        return key in self.cache or self.__store.has_row(self.__table, self.__key_column, key)
+
+    def __len__(self):
+        return self.__store.count_rows(self.__table)
+
+    def keys(self):
+        return self.__store.iter_keys(self.__table, self.__key_column)
+
+    def values(self):
+        return (self[key] for key in self.keys())
+
+    def __iter__(self):
+        return self.values()
+
+class SQLiteStore:
+    read_only = False
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer and commits only append to the log
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        for table, column, definition in ADDED_COLUMNS:
+            if column not in {row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")}:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self.connection.commit()
+        self.__batch_depth = 0
+        self.__write_lock = threading.RLock() # One connection means one writer at a time, even when loans arrive from several threads
+        self.load_lock = threading.RLock() # Held while an entity is built on first access (loading an author builds its books and genre)
+        self.books = LazyBookTable(self)
+        self.users = LazyRegistry(self, User.get_library_id, "users", "library_id", self.load_user)
+        self.authors = LazyRegistry(self, Author.get_name, "authors", "name", self.load_author)
+        self.genres = LazyRegistry(self, Genre.get_name, "genres", "name", self.load_genre)
+        # Only the ISBNs on loan are read at startup, so lazily built books know whether they are available:
+        self.__loaned_isbns = {isbn for isbn, in self.connection.execute("SELECT isbn FROM loans")}
+
+    # Generic queries used by the lazy collections:
+    def has_row(self, table, column, key):
+        return self.connection.execute(f"SELECT 1 FROM {table} WHERE {column} = ?", (key,)).fetchone() is not None
+
+    def count_rows(self, table):
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def iter_keys(self, table, column): # Keys in insertion order, fetched in chunks so huge tables don't have to fit in memory
+        cursor = self.connection.execute(f"SELECT {column} FROM {table} ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for key, in rows:
+                yield key
+
+    # Loading entities on first access:
+    def load_author(self, name):
+        row = self.connection.execute("SELECT biography FROM authors WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        author = self.authors.add(Author(name, row[0]))
+        # Building all of the author's books along with the author, so Author.author_books is always complete (served by books_by_author):
+        rows = self.connection.execute("SELECT isbn, title, genre, category FROM books WHERE author = ? ORDER BY rowid", (name,))
+        for isbn, title, genre_name, category in rows.fetchall():
+            if isbn in self.books.cache:
+                continue
+            genre = self.genres[genre_name]
+            book_class = FictionBook if genre_name == "Fiction" else NonFictionBook
+            book = book_class(title, author, isbn, genre, category)
+            if isbn in self.__loaned_isbns:
+                book.set_is_available(False)
+            genre.add_book_to_category(category, book)
+            self.books.cache[isbn] = book
+        return author
+
+    def load_book(self, isbn):
+        row = self.connection.execute("SELECT author FROM books WHERE isbn = ?", (isbn,)).fetchone()
+        if row is None:
+            return None
+        self.authors.get(row[0]) # Loading the author builds the book as well
+        return self.books.cache.get(isbn)
+
+    def load_genre(self, name):
+        row = self.connection.execute("SELECT description FROM genres WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        genre = self.genres.add(Genre(name, row[0]))
+        for category, in self.connection.execute("SELECT name FROM categories WHERE genre = ? ORDER BY rowid", (name,)).fetchall():
+            genre.add_category(category)
+        return genre
+
+    def load_user(self, library_id):
+        row = self.connection.execute("SELECT name, balance FROM users WHERE library_id = ?", (library_id,)).fetchone()
+        if row is None:
+            return None
+        return self.users.add(User(row[0], library_id, row[1])) # The user's loans are restored by the service from active_loans()
+
+    def load_all(self): # Materializing every author (and with them every book) and every genre, e.g. before listing whole genres
+        for _ in self.genres.values():
+            pass
+        for _ in self.authors.values():
+            pass
+
+    # Writing changes:
+    @contextmanager
+    def batch(self): # Grouping several writes into one transaction, e.g. a batch of imported books
+        with self.__write_lock:
+            self.__batch_depth += 1
+            try:
+                yield
+            except BaseException:
+                self.__batch_depth -= 1
+                if self.__batch_depth == 0:
+                    self.connection.rollback()
+                raise
+            self.__batch_depth -= 1
+            self.__commit()
+
+    def __commit(self):
+        if self.__batch_depth == 0:
+            self.connection.commit()
+
+    def __write(self, sql, parameters):
+        with self.__write_lock:
+            try:
+                self.connection.execute(sql, parameters)
+            except BaseException:
+                if self.__batch_depth == 0:
+                    self.connection.rollback()
+                raise
+            self.__commit()
+
+    def __write_many(self, sql, rows):
+        with self.__write_lock:
+            try:
+                self.connection.executemany(sql, rows)
+            except BaseException:
+                if self.__batch_depth == 0:
+                    self.connection.rollback()
+                raise
+            self.__commit()
+
+    def save_book(self, book, category):
+        self.__write("INSERT INTO books (isbn, title, author, genre, category) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, "
+                     "genre = excluded.genre, category = excluded.category",
+                     (book.get_isbn(), book.get_title(), book.get_author().get_name(), book.get_genre().get_name(), category))
+
+    def save_user(self, user):
+        self.__write("INSERT OR IGNORE INTO users (library_id, name) VALUES (?, ?)", (user.get_library_id(), user.name))
+
+    def save_author(self, author):
+        self.__write("INSERT OR IGNORE INTO authors (name, biography) VALUES (?, ?)", (author.get_name(), author.get_biography()))
+
+    def save_genre(self, genre):
+        self.__write("INSERT OR IGNORE INTO genres (name, description) VALUES (?, ?)", (genre.get_name(), genre.get_description()))
+
+    def save_category(self, genre, category):
+        self.__write("INSERT OR IGNORE INTO categories (genre, name) VALUES (?, ?)", (genre.get_name(), category))
+
+    # Each loan change is a single-statement transaction committed on its own:
+    def record_checkout(self, library_id, isbn, due_at=None, checked_out_at=None):
+        self.__write("INSERT INTO loans (isbn, library_id, due_at, checked_out_at) VALUES (?, ?, ?, ?)", (isbn, library_id, due_at, checked_out_at))
+        self.__loaned_isbns.add(isbn)
+
+    def record_return(self, library_id, isbn):
+        self.__write("DELETE FROM loans WHERE isbn = ? AND library_id = ?", (isbn, library_id))
+        self.__loaned_isbns.discard(isbn)
+
+    def save_balance(self, user):
+        self.__write("UPDATE users SET balance = ? WHERE library_id = ?", (user.get_balance(), user.get_library_id()))
+
+    def record_fines(self, loans, users): # One transaction for a whole run of fine accrual
+        with self.batch():
+            self.__write_many("UPDATE loans SET fine = ? WHERE isbn = ?", [(loan.fine, loan.book.get_isbn()) for loan in loans])
+            self.__write_many("UPDATE users SET balance = ? WHERE library_id = ?", [(user.get_balance(), user.get_library_id()) for user in users])
+
+    def active_loans(self):
+        return self.connection.execute("SELECT library_id, isbn, due_at, fine, checked_out_at FROM loans ORDER BY rowid").fetchall()
+
+    def iter_titles(self):
+        cursor = self.connection.execute("SELECT isbn, title FROM books ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            yield from rows
+
+    def iter_author_names(self):
+        return self.iter_keys("authors", "name")
+
+    def close(self):
+        self.connection.close()
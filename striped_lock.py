@@ -0,0 +1,106 @@
+from contextlib import contextmanager, nullcontext
+import threading
+
+# Striped locking: a fixed pool of locks, with every key (an ISBN, a library ID) mapped to one of them by its hash.
+# Operations on keys in different stripes proceed in parallel, and memory stays constant however many keys there are.
+# ReadWriteLock guards the catalog itself: searches share it, additions to the catalog and its indexes take it alone.
+
+class StripedLock:
+    def __init__(self, stripes=64):
+        self.__locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe_of(self, key):
+        return hash(key) % len(self.__locks)
+
+    def hold(self, *keys):
+        # Locking the stripes of all the keys at once. Stripes are always taken in ascending order (and each one only once),
+        # so two threads locking overlapping sets of keys can't deadlock.
+        return self.__hold_stripes(sorted({self.stripe_of(key) for key in keys}))
+
+    def hold_all(self): # Every stripe, e.g. to build something that no loan may change meanwhile
+        return self.__hold_stripes(range(len(self.__locks)))
+
+    @contextmanager
+    def __hold_stripes(self, stripes):
+        for stripe in stripes:
+            self.__locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self.__locks[stripe].release()
+
+class ReadWriteLock:
+    # Any number of readers, or a single writer. A waiting writer goes first, so a steady stream of searches can't starve additions.
+    # Both sides are reentrant: a reader may read again and a writer may read or write again, but a reader can't start writing
+    # (two readers doing so would wait for each other forever), which raises RuntimeError instead.
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__readers = 0
+        self.__writer = None # Ident of the thread writing
+        self.__write_depth = 0
+        self.__waiting_writers = 0
+        self.__local = threading.local() # The read depth of each thread
+
+    @contextmanager
+    def read(self):
+        local = self.__local
+        depth = getattr(local, "depth", 0)
+        if depth or self.__writer == threading.get_ident(): # Already inside: nothing to wait for
+            local.depth = depth + 1
+            try:
+                yield
+            finally:
+                local.depth = depth
+            return
+        with self.__condition:
+            while self.__writer is not None or self.__waiting_writers:
+                self.__condition.wait()
+            self.__readers += 1
+        local.depth = 1
+        try:
+            yield
+        finally:
+            local.depth = 0
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer != me:
+                if getattr(self.__local, "depth", 0):
+                    raise RuntimeError("A thread holding the read lock can't take the write lock")
+                self.__waiting_writers += 1
+                try:
+                    while self.__writer is not None or self.__readers:
+                        self.__condition.wait()
+                finally:
+                    self.__waiting_writers -= 1
+                self.__writer = me
+            self.__write_depth += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__write_depth -= 1
+                if not self.__write_depth:
+                    self.__writer = None
+                    self.__condition.notify_all()
+
+class NoLock:
+    # Stand-in for StripedLock and ReadWriteLock when the library is used from a single thread
+    def hold(self, *keys):
+        return nullcontext()
+
+    def hold_all(self):
+        return nullcontext()
+
+    def read(self):
+        return nullcontext()
+
+    def write(self):
+        return nullcontext()
@@ -0,0 +1,97 @@
+from isbn import check_digit, format_isbn
+import argparse
+import json
+import random
+
+# Deterministic synthetic library data for benchmarks and load tests.
+# The same seed and sizes always produce exactly the same authors, books, users and loan history, so runs on different machines or
+# different versions of the code are measured against identical data. Book records have the fields catalog_import.py expects.
+
+FIRST_NAMES = ("Ada", "Ben", "Clara", "David", "Elena", "Felix", "Grace", "Hugo", "Iris", "Jonas", "Karin", "Leo", "Maya", "Nora",
+               "Oscar", "Paula", "Quentin", "Rosa", "Samuel", "Tara", "Ulrich", "Vera", "Walter", "Xenia", "Yusuf", "Zoe")
+LAST_NAMES = ("Abbott", "Berg", "Castillo", "Dubois", "Eriksen", "Fischer", "Garcia", "Hansen", "Ivanova", "Jensen", "Kowalski",
+              "Lindqvist", "Moreau", "Novak", "Okafor", "Petrov", "Quinn", "Rossi", "Schmidt", "Tanaka", "Ueda", "Varga", "Weber",
+              "Xu", "Yilmaz", "Zimmermann")
+TITLE_WORDS = ("river", "night", "garden", "winter", "stone", "silver", "empire", "shadow", "ocean", "letters", "fire", "glass",
+               "storm", "forest", "crown", "memory", "island", "city", "wolf", "light", "house", "road", "mountain", "song",
+               "daughter", "king", "secret", "war", "summer", "bridge", "machine", "tower", "star", "dream", "history", "world")
+FICTION_CATEGORIES = ("Fantasy", "Mystery", "Romance", "Science Fiction", "Thriller", "Historical Fiction", "Horror", "Adventure")
+NONFICTION_SUBJECTS = ("History", "Science", "Biography", "Philosophy", "Travel", "Economics", "Psychology", "Cooking")
+
+def make_isbn(number): # Building a valid, hyphenated ISBN-13 (978-xx-xxxxx-xx-c) from a running number
+    digits = f"978{number:09d}"
+    return format_isbn(f"{digits}{check_digit(digits)}")
+
+def make_library_id(number): # AA00000, AA00001, ..., AA99999, AB00000, ... (67,600,000 distinct IDs)
+    letters, digits = divmod(number, 100_000)
+    return f"{chr(65 + letters // 26 % 26)}{chr(65 + letters % 26)}{digits:05d}"
+
+def author_name(number): # Unique author names: every first/last name pair, then the pairs again with a running suffix
+    pairs = len(FIRST_NAMES) * len(LAST_NAMES)
+    round_number, pair = divmod(number, pairs)
+    name = f"{FIRST_NAMES[pair % len(FIRST_NAMES)]} {LAST_NAMES[pair // len(FIRST_NAMES)]}"
+    return name if round_number == 0 else f"{name} {round_number + 1}"
+
+def author_count_for(books): # Roughly 20 books per author, like a real catalog with a long tail of one-book authors
+    return max(1, books // 20)
+
+def generate_books(count, seed=0, fiction_share=0.6):
+    # Yielding count book records. Author popularity is skewed (a few authors write many of the books) and titles are drawn from
+    # a small vocabulary, so searches return realistic numbers of matches.
+    rng = random.Random(seed)
+    authors = author_count_for(count)
+    for number in range(count):
+        author = author_name(min(int(rng.paretovariate(1.2)) - 1, authors - 1)) if rng.random() < 0.5 else author_name(rng.randrange(authors))
+        title = " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 4))).title()
+        if rng.random() < fiction_share:
+            genre, category = "Fiction", rng.choice(FICTION_CATEGORIES)
+        else:
+            genre, category = "Nonfiction", rng.choice(NONFICTION_SUBJECTS)
+        yield {"title": f"{title} {number}", "author": author, "isbn": make_isbn(number), "genre": genre, "category": category,
+               "biography": f"{author} is a synthetic author.", "description": f"{genre} books."}
+
+def generate_users(count): # Yielding (name, library ID) pairs
+    for number in range(count):
+        yield f"{FIRST_NAMES[number % len(FIRST_NAMES)]} {LAST_NAMES[number // len(FIRST_NAMES) % len(LAST_NAMES)]}", make_library_id(number)
+
+def generate_loan_history(events, books, users, seed=0, return_share=0.45):
+    # Yielding (event, library ID, ISBN) tuples, event being "checked_out" or "returned". The history is always valid: only available
+    # books are checked out and only loaned books are returned, by the user who has them, so it can be replayed against a fresh library.
+    rng = random.Random(seed)
+    on_loan = {} # ISBN -> library ID
+    loaned = [] # ISBNs on loan, for picking a random one to return in O(1)
+    for _ in range(events):
+        if loaned and (rng.random() < return_share or len(loaned) >= books):
+            position = rng.randrange(len(loaned))
+            loaned[position], loaned[-1] = loaned[-1], loaned[position]
+            isbn = loaned.pop()
+            yield "returned", on_loan.pop(isbn), isbn
+        else:
+            isbn = make_isbn(rng.randrange(books))
+            while isbn in on_loan:
+                isbn = make_isbn(rng.randrange(books))
+            library_id = make_library_id(rng.randrange(users))
+            on_loan[isbn] = library_id
+            loaned.append(isbn)
+            yield "checked_out", library_id, isbn
+
+def populate(service, books, users, seed=0): # Filling a LibraryService with the synthetic catalog and users
+    with service.batch():
+        for record in generate_books(books, seed):
+            service.add_book(record["title"], record["author"], record["isbn"], record["genre"], record["category"])
+        for name, library_id in generate_users(users):
+            service.add_user(name, library_id)
+    return service
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic catalog as JSONL (importable with catalog_import.py).")
+    parser.add_argument("path")
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_jsonl(args.path, generate_books(args.books, args.seed))
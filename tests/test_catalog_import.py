@@ -0,0 +1,13 @@
+from catalog_import import CatalogImporter
+from library_service import LibraryService
+from synthetic_data import make_isbn
+
+def record(number, **extra):
+    return {"title": f"Book {number}", "author": f"Author {number}", "isbn": make_isbn(number), "genre": "Fiction", "category": "Novel", **extra}
+
+def test_non_text_optional_fields_reject_the_row():
+    service = LibraryService()
+    report = CatalogImporter(service).import_records([record(0, biography=42), record(1, description=["x"]), record(2, biography="Wrote things")])
+    assert (report.added, report.rejected) == (1, 2) # The bad rows are rejected and the import carries on
+    assert report.rejections == [(1, "invalid biography"), (2, "invalid description")]
+    assert service.find_author("Author 2").get_biography() == "Wrote things"
@@ -0,0 +1,52 @@
+import random
+import pytest
+import circulation
+from author import Author
+from circulation import CirculationAnalytics
+from fiction import FictionBook
+from genre import Genre
+from loan_ledger import Loan
+from synthetic_data import make_isbn
+from user import User
+
+def make_analytics(books=50, checkouts=400, seed=7):
+    # Checkouts spread over few books with small counts, so many books tie at the cutoff of a top-k
+    rng = random.Random(seed)
+    genres = [Genre(name, "") for name in ("Fiction", "Mystery", "Poetry")]
+    author = Author("Author", "")
+    catalog = [FictionBook(f"Book {number}", author, make_isbn(number), genres[number % len(genres)], "Novel") for number in range(books)]
+    users = [User(f"User {number}", f"AA{number:05d}") for number in range(20)]
+    analytics = CirculationAnalytics()
+    for step in range(checkouts):
+        loan = Loan(rng.choice(users), rng.choice(catalog), checked_out_at=1_000_000 + step * 3600)
+        analytics.record_checkout(loan)
+        if rng.random() < 0.7:
+            analytics.record_return(loan, loan.checked_out_at + rng.uniform(0, 30 * 86400))
+    return analytics
+
+def python_report(analytics, monkeypatch, **window):
+    with monkeypatch.context() as patch:
+        patch.setattr(circulation, "numpy", None)
+        return analytics.report(**window)
+
+@pytest.mark.parametrize("limit", [1, 5, 13, 50, 80])
+@pytest.mark.parametrize("window", [{}, {"since": 1_200_000, "until": 1_900_000}])
+def test_numpy_report_matches_python(monkeypatch, limit, window):
+    pytest.importorskip("numpy")
+    analytics = make_analytics()
+    vectorized = analytics.report(limit=limit, **window)
+    scanned = python_report(analytics, monkeypatch, limit=limit, **window)
+    assert vectorized["most_borrowed"] == scanned["most_borrowed"] # Same books, including which of the tied ones make the cut
+    for key in ("checkouts", "returns", "borrowers", "genre_checkouts"):
+        assert vectorized[key] == scanned[key]
+    assert vectorized["loan_days"] == pytest.approx(scanned["loan_days"])
+
+def test_most_borrowed_ties_keep_earlier_books(monkeypatch):
+    analytics = make_analytics(books=10, checkouts=0)
+    author = Author("Author", "")
+    genre = Genre("Fiction", "")
+    user = User("User", "AA00001")
+    for number in (3, 1, 2, 0):
+        analytics.record_checkout(Loan(user, FictionBook(f"Book {number}", author, make_isbn(number), genre, "Novel"), checked_out_at=1.0))
+    report = python_report(analytics, monkeypatch, limit=2)
+    assert [book.get_isbn() for book, count in report["most_borrowed"]] == [make_isbn(3), make_isbn(1)] # Equal counts: first recorded first
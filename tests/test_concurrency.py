@@ -0,0 +1,114 @@
+import random
+import threading
+from errors import BookOnLoanError, BookUnavailableError
+from library_service import LibraryService
+from storage import SQLiteStore
+from synthetic_data import make_isbn
+
+def test_concurrent_loans_never_lend_a_book_twice():
+    # Threads borrow and return books from a small, heavily contended set. A listener keeps its own record of who holds each book:
+    # the service notifies under the book's lock, so a checkout of a book already held means it was lent twice.
+    service = LibraryService(concurrent=True)
+    for number in range(20):
+        service.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    for number in range(100):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    holders = {}
+    double_loans = []
+
+    def listen(event, *args):
+        if event == "checked_out":
+            user, book = args
+            if holders.setdefault(book.get_isbn(), user) is not user:
+                double_loans.append(book.get_isbn())
+        elif event == "returned":
+            del holders[args[1].get_isbn()]
+
+    service.add_listener(listen)
+    loans = [0] * 8
+
+    def worker(index):
+        rng = random.Random(index)
+        for _ in range(3_000):
+            isbn = make_isbn(rng.randrange(20))
+            library_id = f"AA{rng.randrange(100):05d}"
+            try:
+                service.check_out_book(library_id, isbn)
+            except BookUnavailableError:
+                continue
+            loans[index] += 1
+            service.check_in_book(library_id, isbn)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(loans))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not double_loans
+    assert not holders and not service.has_loans()
+    assert all(book.is_available() for book in service.books.values())
+    assert service.ledger.total_checkouts == service.ledger.total_returns == sum(loans) > 0
+
+def test_concurrent_first_searches_see_the_whole_catalog():
+    # The indexes are built on the first search. Threads searching at the same moment must all wait for the complete index
+    # rather than read one still being filled (and the search cache must not keep such a partial result).
+    service = LibraryService(concurrent=True)
+    for number in range(20_000):
+        service.add_book(f"Common Book {number}", f"Author {number % 50}", make_isbn(number), "Fiction", "Novel")
+    start = threading.Barrier(6)
+    results = []
+
+    def search(index):
+        start.wait()
+        if index % 3 == 0:
+            results.append(len(service.search_title("common book")))
+        elif index % 3 == 1:
+            results.append(len(service.complete_title("Common Book 1", limit=100_000)))
+        else:
+            results.append(service.filter_books(genre="Fiction", limit=0).total)
+
+    threads = [threading.Thread(target=search, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [11_111] * 2 + [20_000] * 4
+    assert len(service.search_title("common book")) == 20_000
+
+def test_replacing_books_while_they_circulate_doesnt_deadlock(tmp_path):
+    # Replacing a book takes its loan lock and the store's transaction, as loans do; taking them in a different order would
+    # leave a replacement and a return waiting for each other
+    service = LibraryService(store=SQLiteStore(str(tmp_path / "library.db")), concurrent=True)
+    for number in range(4):
+        service.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    for number in range(4):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    stop = threading.Event()
+
+    def circulate(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            isbn = make_isbn(rng.randrange(4))
+            try:
+                service.check_out_book(f"AA{index:05d}", isbn)
+            except BookUnavailableError:
+                continue
+            service.check_in_book(f"AA{index:05d}", isbn)
+
+    def replace():
+        for edition in range(300):
+            try:
+                service.add_book(f"Book {edition % 4}, edition {edition}", "Author", make_isbn(edition % 4), "Fiction", "Novel", replace=True)
+            except BookOnLoanError:
+                pass
+        stop.set()
+
+    threads = [threading.Thread(target=circulate, args=(index,), daemon=True) for index in range(4)]
+    threads.append(threading.Thread(target=replace, daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    assert not any(thread.is_alive() for thread in threads)
+    assert not service.has_loans() and all(book.is_available() for book in service.books.values())
+    service.store.close()
@@ -0,0 +1,55 @@
+from library_service import LibraryService
+from synthetic_data import make_isbn
+
+BOOKS = (("The Hobbit", "J. R. R. Tolkien", "Fiction", "Fantasy"),
+         ("The Silmarillion", "J. R. R. Tolkien", "Fiction", "Fantasy"),
+         ("Dune", "Frank Herbert", "Fiction", "Science Fiction"),
+         ("Cosmos", "Carl Sagan", "Nonfiction", "Astronomy"),
+         ("Pale Blue Dot", "Carl Sagan", "Nonfiction", "Astronomy"))
+
+def make_library():
+    service = LibraryService()
+    for number, (title, author, genre, category) in enumerate(BOOKS):
+        service.add_book(title, author, make_isbn(number), genre, category)
+    service.add_user("User", "AA00000")
+    service.check_out_book("AA00000", make_isbn(1))
+    return service
+
+def titles(result):
+    return [book.get_title() for book in result.books]
+
+def test_counts_cover_every_facet_of_the_matches():
+    result = make_library().filter_books()
+    assert result.total == 5
+    assert result.counts["available"] == {True: 4, False: 1}
+    assert result.counts["genre"] == {"Fiction": 3, "Nonfiction": 2}
+    assert result.counts["category"] == {"Fantasy": 2, "Science Fiction": 1, "Astronomy": 2}
+
+def test_filters_combine_and_count_the_remaining_matches():
+    service = make_library()
+    result = service.filter_books(genre="fiction", available=True) # Genre and category names ignore case
+    assert titles(result) == ["The Hobbit", "Dune"]
+    assert result.counts["category"] == {"Fantasy": 1, "Science Fiction": 1}
+    result = service.filter_books(category=["Fantasy", "Astronomy"], author="tolkien")
+    assert titles(result) == ["The Hobbit", "The Silmarillion"]
+    assert result.counts["available"] == {True: 1, False: 1}
+    assert result.counts["author"] == {"J. R. R. Tolkien": 2}
+    assert service.filter_books(genre="Poetry").total == 0 # An unknown value matches nothing
+    page = service.filter_books(genre="Nonfiction", offset=1, limit=1)
+    assert titles(page) == ["Pale Blue Dot"] and page.total == 2
+
+def test_loans_and_replacements_update_the_counts():
+    service = make_library()
+    service.filter_books() # Building the bitmaps, so the changes below must update them
+    service.check_in_book("AA00000", make_isbn(1))
+    service.check_out_book("AA00000", make_isbn(3))
+    assert titles(service.filter_books(available=False)) == ["Cosmos"]
+    # Replacing a book moves it to its new genre, category and author, in its old place in the order:
+    service.add_book("Foundation", "Isaac Asimov", make_isbn(4), "Fiction", "Science Fiction", replace=True)
+    result = service.filter_books()
+    assert result.total == 5
+    assert result.counts["genre"] == {"Fiction": 4, "Nonfiction": 1}
+    assert result.counts["category"] == {"Fantasy": 2, "Science Fiction": 2, "Astronomy": 1}
+    assert titles(service.filter_books(category="Science Fiction")) == ["Dune", "Foundation"]
+    assert service.filter_books(author="sagan").counts["author"] == {"Carl Sagan": 1}
+    assert titles(service.filter_books(author="asimov", available=True)) == ["Foundation"]
@@ -0,0 +1,48 @@
+import asyncio
+import json
+from library_server import LibraryServer, resume_listing
+from library_service import LibraryService
+from synthetic_data import make_isbn
+
+def make_library(books):
+    service = LibraryService(concurrent=True)
+    for number in range(books):
+        service.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    return service
+
+async def fetch(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request.encode("latin-1"))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return head.decode("latin-1").split("\r\n"), body
+
+def serve(service, *requests):
+    async def run():
+        server = await LibraryServer(service, port=0).start()
+        try:
+            return [await fetch(server.port, request) for request in requests]
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+def test_http_1_0_listing_has_content_length():
+    (head, body), = serve(make_library(450), "GET /books?offset=5 HTTP/1.0\r\n\r\n")
+    assert "Transfer-Encoding: chunked" not in head
+    assert f"Content-Length: {len(body)}" in head
+    assert [book["isbn"] for book in json.loads(body)] == [make_isbn(number) for number in range(5, 450)]
+
+def test_http_1_1_listing_is_chunked():
+    (head, body), = serve(make_library(3), "GET /books?limit=2 HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert "Transfer-Encoding: chunked" in head
+    assert body.endswith(b"0\r\n\r\n")
+
+def test_listing_resumes_after_concurrent_adds():
+    service = make_library(10)
+    listing = resume_listing(service.iter_books, 2, 6)
+    seen = [next(listing).get_isbn()]
+    service.add_book("Book 10", "Author", make_isbn(10), "Fiction", "Novel") # Invalidates the dictionary iterator under the listing
+    seen.extend(book.get_isbn() for book in listing)
+    assert seen == [make_isbn(number) for number in range(2, 8)]
@@ -0,0 +1,72 @@
+import pytest
+from errors import AuthorNotFoundError, BookOnLoanError, BookUnavailableError
+from library_service import LibraryService
+from snapshot import SnapshotStore, write_snapshot
+from storage import SQLiteStore
+from synthetic_data import make_isbn
+
+def make_library(books=3, users=3):
+    service = LibraryService()
+    for number in range(books):
+        service.add_book(f"Book {number}", f"Author {number}", make_isbn(number), "Fiction", "Novel")
+    for number in range(users):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    return service
+
+def test_a_loaned_book_cant_be_replaced():
+    service = make_library()
+    isbn = make_isbn(0)
+    loaned = service.check_out_book("AA00000", isbn)
+    with pytest.raises(BookOnLoanError):
+        service.add_book("New Edition", "Author 0", isbn, "Fiction", "Novel", replace=True)
+    assert service.books[isbn] is loaned and not loaned.is_available()
+    assert [book.get_title() for book in service.authors["Author 0"].author_books] == ["Book 0"]
+    with pytest.raises(BookUnavailableError): # Still lent, and refused cleanly rather than by the ledger
+        service.check_out_book("AA00001", isbn)
+    service.check_in_book("AA00000", isbn)
+    replacement = service.add_book("New Edition", "Author 0", isbn, "Fiction", "Novel", replace=True)
+    assert service.check_out_book("AA00001", isbn) is replacement
+    assert service.who_has(isbn).get_library_id() == "AA00001"
+
+def test_persistent_stores_restore_checkout_times(tmp_path):
+    path = str(tmp_path / "library.db")
+    service = LibraryService(store=SQLiteStore(path))
+    service.add_book("Book", "Author", make_isbn(0), "Fiction", "Novel")
+    service.add_user("User", "AA00000")
+    service.check_out_book("AA00000", make_isbn(0), due_at=2_000_000.0, checked_out_at=1_000_000.0)
+    snapshot_path = str(tmp_path / "library.snapshot")
+    write_snapshot(service, snapshot_path)
+    service.store.close()
+    for store in (SQLiteStore(path), SnapshotStore(snapshot_path)):
+        loan, = LibraryService(store=store).ledger.loans()
+        assert (loan.user.get_library_id(), loan.checked_out_at, loan.due_at) == ("AA00000", 1_000_000.0, 2_000_000.0)
+        store.close()
+
+def test_a_return_is_stored_in_one_transaction(tmp_path):
+    # The return, the late fine and the hand-off to the next in line commit together, so a crash can't keep only part of them
+    service = LibraryService(store=SQLiteStore(str(tmp_path / "library.db")))
+    service.add_book("Book", "Author", make_isbn(0), "Fiction", "Novel")
+    service.add_user("User 0", "AA00000")
+    service.add_user("User 1", "AA00001")
+    service.check_out_book("AA00000", make_isbn(0), due_at=1_000_000.0)
+    service.reserve_book("AA00001", make_isbn(0))
+    statements = []
+    service.store.connection.set_trace_callback(statements.append)
+    service.check_in_book("AA00000", make_isbn(0))
+    assert [statement.split()[0] for statement in statements] == ["BEGIN", "DELETE", "UPDATE", "INSERT", "COMMIT"]
+    service.store.close()
+
+def test_overdue_loans_stay_most_overdue_first():
+    service = make_library()
+    service.check_out_book("AA00000", make_isbn(0), due_at=2_000.0)
+    assert [loan.book.get_isbn() for loan in service.overdue_loans(now=5_000.0)] == [make_isbn(0)]
+    # Loans coming due after the first query, one of them due even before the loan already overdue:
+    service.check_out_book("AA00001", make_isbn(1), due_at=1_000.0)
+    service.check_out_book("AA00002", make_isbn(2), due_at=3_000.0)
+    assert [loan.due_at for loan in service.overdue_loans(now=5_000.0)] == [1_000.0, 2_000.0, 3_000.0]
+
+def test_author_lookups_raise_for_unknown_names():
+    service = make_library()
+    assert service.get_author("Author 1").get_name() == "Author 1"
+    with pytest.raises(AuthorNotFoundError):
+        service.get_author("Nobody")
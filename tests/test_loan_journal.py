@@ -0,0 +1,102 @@
+import os
+import threading
+import pytest
+from fines import DAY
+from library_service import LibraryService
+from loan_journal import LoanJournal
+from synthetic_data import make_isbn
+
+DUE = 1_000_000.0
+
+def make_library():
+    service = LibraryService()
+    for number in range(10):
+        service.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    for number in range(4):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    return service
+
+def fine_state(service):
+    return (sorted((user.get_library_id(), user.get_balance()) for user in service.users),
+            sorted((loan.book.get_isbn(), loan.fine) for loan in service.ledger.loans()))
+
+def run_fines(service, journal):
+    for number, library_id in enumerate(("AA00001", "AA00001", "AA00002")):
+        service.check_out_book(library_id, make_isbn(number), due_at=DUE)
+    service.accrue_fines(DUE + 3 * DAY)
+    service.pay_fine("AA00001", 30) # Part of the fines of loans still out
+    service.check_in_book("AA00002", make_isbn(2))
+    service.charge_fine("AA00003", 500)
+    service.accrue_fines(DUE + 4 * DAY)
+    if journal is not None:
+        journal.snapshot(service)
+    service.pay_fine("AA00003", 100)
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_recovery_restores_balances_and_loan_fines(tmp_path, snapshot):
+    service = make_library()
+    journal = LoanJournal(tmp_path, group_commit_size=10_000) # Nothing is flushed before close()
+    journal.attach(service)
+    run_fines(service, journal if snapshot else None)
+    journal.close()
+    recovered = make_library()
+    report = LoanJournal(tmp_path).recover(recovered)
+    assert report.skipped == 0
+    assert fine_state(recovered) == fine_state(service)
+
+def test_recovery_replays_returns_at_their_effective_time(tmp_path):
+    service = make_library()
+    journal = LoanJournal(tmp_path)
+    journal.attach(service)
+    service.check_out_book("AA00001", make_isbn(0), due_at=DUE)
+    service.check_in_book("AA00001", make_isbn(0), returned_at=DUE - 1) # On time, although the clock is far past the due date
+    journal.close()
+    recovered = make_library()
+    LoanJournal(tmp_path).recover(recovered)
+    assert recovered.get_user("AA00001").get_balance() == service.get_user("AA00001").get_balance() == 0
+    assert not recovered.has_loans()
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_recovery_keeps_checkout_times(tmp_path, snapshot):
+    service = make_library()
+    journal = LoanJournal(tmp_path)
+    journal.attach(service)
+    service.check_out_book("AA00001", make_isbn(0), checked_out_at=DUE - 14 * DAY)
+    service.check_out_book("AA00002", make_isbn(1), due_at=DUE, checked_out_at=DUE - 3 * DAY)
+    if snapshot:
+        journal.snapshot(service)
+    journal.close()
+    recovered = make_library()
+    LoanJournal(tmp_path).recover(recovered)
+    loans = sorted((loan.book.get_isbn(), loan.checked_out_at, loan.due_at) for loan in recovered.ledger.loans())
+    assert loans == [(make_isbn(0), DUE - 14 * DAY, DUE - 14 * DAY + recovered.loan_period), (make_isbn(1), DUE - 3 * DAY, DUE)]
+
+def test_automatic_snapshots_are_consistent_under_concurrent_loans(tmp_path):
+    service = LibraryService(concurrent=True)
+    for number in range(40):
+        service.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    for number in range(8):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    journal = LoanJournal(tmp_path, group_commit_interval=0.001, snapshot_every=50)
+    journal.attach(service)
+
+    def worker(index):
+        for round in range(200):
+            isbn = make_isbn(index * 5 + round % 5)
+            service.check_out_book(f"AA{index:05d}", isbn, due_at=DUE)
+            service.check_in_book(f"AA{index:05d}", isbn) # Late, so every return charges a fine as well
+        service.check_out_book(f"AA{index:05d}", make_isbn(index * 5), due_at=DUE)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    assert os.path.exists(tmp_path / "snapshot.json")
+    recovered = make_library()
+    for number in range(10, 40):
+        recovered.add_book(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel")
+    report = LoanJournal(tmp_path).recover(recovered)
+    assert report.skipped == 0
+    assert fine_state(recovered) == fine_state(service)
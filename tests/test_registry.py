@@ -0,0 +1,42 @@
+from registry import Registry
+
+class Key:
+    # A registry key that counts how often it is hashed and compared: a dictionary lookup costs one hash and a comparison or two
+    # whatever the size, while a scan would compare (or extract the key of) every entry
+    hashes = comparisons = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        Key.hashes += 1
+        return hash(self.value)
+
+    def __eq__(self, other):
+        Key.comparisons += 1
+        return self.value == other.value
+
+class Entity:
+    key_extractions = 0
+
+    def __init__(self, key):
+        self.key = key
+
+    def get_key(self):
+        Entity.key_extractions += 1
+        return self.key
+
+def lookup_cost(size):
+    registry = Registry(Entity.get_key)
+    for number in range(size):
+        registry.add(Entity(Key(number)))
+    Key.hashes = Key.comparisons = Entity.key_extractions = 0
+    for number in (0, size // 2, size - 1, size): # Equal but distinct keys, so identity can't short-cut the comparison; the last is missing
+        registry.get(Key(number))
+        assert Key(number) in registry or number == size
+    return Key.hashes, Key.comparisons, Entity.key_extractions
+
+def test_lookups_dont_depend_on_the_registry_size():
+    small, large = lookup_cost(10), lookup_cost(100_000)
+    assert small == large
+    assert small[2] == 0 # Lookups never walk the entries
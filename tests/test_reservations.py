@@ -0,0 +1,46 @@
+from library_service import LibraryService
+from synthetic_data import make_isbn
+
+ISBN = make_isbn(0)
+
+def make_library(users=5):
+    service = LibraryService()
+    service.add_book("Book", "Author", ISBN, "Fiction", "Novel")
+    for number in range(users):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    service.check_out_book("AA00000", ISBN)
+    return service
+
+def waiting(service):
+    return [reservation.user.get_library_id() for reservation in service.waitlist(ISBN)]
+
+def test_a_returned_book_goes_to_the_next_in_line():
+    service = make_library()
+    events = []
+    service.add_listener(lambda event, *args: events.append((event, args[0].get_library_id())))
+    service.reserve_book("AA00001", ISBN)
+    service.reserve_book("AA00002", ISBN, priority=1) # Served first despite reserving later
+    service.check_in_book("AA00000", ISBN)
+    assert service.who_has(ISBN).get_library_id() == "AA00002"
+    assert not service.books[ISBN].is_available()
+    assert waiting(service) == ["AA00001"] # The reservation was used up
+    assert service.reservation_position("AA00002", ISBN) is None
+    assert ("reservation_fulfilled", "AA00002") in events
+    service.check_in_book("AA00002", ISBN)
+    assert service.who_has(ISBN).get_library_id() == "AA00001" and waiting(service) == []
+    service.check_in_book("AA00001", ISBN)
+    assert service.who_has(ISBN) is None and service.books[ISBN].is_available() # Nobody left in line
+
+def test_cancelled_reservations_are_skipped():
+    service = make_library()
+    for library_id in ("AA00001", "AA00002", "AA00003"):
+        service.reserve_book(library_id, ISBN)
+    service.cancel_reservation("AA00001", ISBN)
+    service.cancel_reservation("AA00002", ISBN)
+    service.reserve_book("AA00002", ISBN) # Back in line, but behind AA00003 now
+    service.check_in_book("AA00000", ISBN)
+    assert service.who_has(ISBN).get_library_id() == "AA00003"
+    assert waiting(service) == ["AA00002"]
+    service.check_in_book("AA00003", ISBN)
+    assert service.who_has(ISBN).get_library_id() == "AA00002"
+    assert "AA00001" not in service.loaned_books # The user who left the line never got the book
@@ -0,0 +1,34 @@
+from library_service import LibraryService
+from synthetic_data import make_isbn
+
+def titles(result):
+    return sorted(book.get_title() for book in result.values())
+
+def make_library():
+    service = LibraryService()
+    service.add_book("The Hobbit", "J. R. R. Tolkien", make_isbn(0), "Fiction", "Fantasy")
+    service.add_book("Dune", "Frank Herbert", make_isbn(1), "Fiction", "Science Fiction")
+    return service
+
+def test_adding_a_book_invalidates_cached_searches():
+    service = make_library()
+    assert titles(service.search_title("hobbit")) == ["The Hobbit"]
+    assert titles(service.search_author("tolkien")) == ["The Hobbit"]
+    service.add_book("The Hobbit: Illustrated", "J. R. R. Tolkien", make_isbn(2), "Fiction", "Fantasy")
+    assert titles(service.search_title("hobbit")) == ["The Hobbit", "The Hobbit: Illustrated"]
+    assert titles(service.search_author("tolkien")) == ["The Hobbit", "The Hobbit: Illustrated"]
+    assert titles(service.fuzzy_search_title("hobit")) == ["The Hobbit", "The Hobbit: Illustrated"]
+
+def test_a_replaced_book_leaves_and_enters_cached_searches():
+    # The service has no book removal: a replacement is what takes a book out of the results it used to match
+    service = make_library()
+    assert titles(service.search_title("dune")) == ["Dune"]
+    assert titles(service.search_author("herbert")) == ["Dune"]
+    assert titles(service.search_title("messiah")) == []
+    service.add_book("Dune Messiah", "Brian Herbert", make_isbn(1), "Fiction", "Science Fiction", replace=True)
+    assert titles(service.search_title("messiah")) == ["Dune Messiah"]
+    assert titles(service.search_author("frank herbert")) == [] # The old author no longer has the book
+    assert titles(service.search_author("brian herbert")) == ["Dune Messiah"]
+    service.add_book("Children of Dune", "Frank Herbert", make_isbn(1), "Fiction", "Science Fiction", replace=True)
+    assert titles(service.search_title("messiah")) == [] # The replaced title is gone from the cached search
+    assert titles(service.search_title("dune")) == ["Children of Dune"]
@@ -0,0 +1,11 @@
+import pytest
+from sharded_catalog import ShardedLibrary
+from synthetic_data import make_isbn
+
+def test_unexpected_shard_errors_are_raised_in_the_parent():
+    with ShardedLibrary(2) as library:
+        library.add_books([(f"Book {number}", "Author", make_isbn(number), "Fiction", "Novel") for number in range(20)])
+        with pytest.raises(AttributeError): # Not a LibraryError, but raised in the parent all the same
+            library.search_title(None)
+        assert library.book_count() == 20 # The shards are still serving
+        assert [book["isbn"] for book in library.search_isbn(make_isbn(3))] == [make_isbn(3)]
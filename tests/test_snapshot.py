@@ -0,0 +1,73 @@
+import pytest
+from errors import ReadOnlyStoreError
+from fines import DAY
+from library_service import LibraryService, book_category
+from snapshot import SnapshotStore, write_snapshot
+from synthetic_data import make_isbn
+
+DUE = 1_000_000.0
+
+def make_library():
+    service = LibraryService()
+    service.add_author("Carl Sagan", "Astronomer and author")
+    service.add_genre("Nonfiction", "Books about the real world")
+    for number in range(30):
+        genre, category = ("Fiction", f"Category {number % 3}") if number % 2 else ("Nonfiction", "Astronomy")
+        service.add_book(f"Book {number}", "Carl Sagan" if number % 5 == 0 else f"Author {number % 4}", make_isbn(number), genre, category)
+    for number in range(6):
+        service.add_user(f"User {number}", f"AA{number:05d}")
+    service.check_out_book("AA00001", make_isbn(3), due_at=DUE, checked_out_at=DUE - 14 * DAY)
+    service.check_out_book("AA00002", make_isbn(10))
+    service.accrue_fines(DUE + 2 * DAY) # A fine on the first loan
+    service.charge_fine("AA00004", 150)
+    return service
+
+def books(service):
+    return {isbn: (book.get_title(), book.get_author().get_name(), book.get_genre().get_name(), book_category(book), book.is_available())
+            for isbn, book in service.books.items()}
+
+def authors(service):
+    return {author.get_name(): (author.get_biography(), [book.get_isbn() for book in author.author_books]) for author in service.authors}
+
+def users(service):
+    return {user.get_library_id(): (user.name, user.get_balance(), sorted(user.get_loans())) for user in service.users}
+
+def loans(service):
+    return sorted((loan.book.get_isbn(), loan.user.get_library_id(), loan.checked_out_at, loan.due_at, loan.fine) for loan in service.ledger.loans())
+
+@pytest.fixture
+def replica(tmp_path):
+    service = make_library()
+    path = str(tmp_path / "library.snapshot")
+    write_snapshot(service, path)
+    store = SnapshotStore(path)
+    yield service, LibraryService(store=store)
+    store.close()
+
+def test_the_replica_serves_the_snapshot(replica):
+    service, copy = replica
+    assert copy.store.read_only
+    assert loans(copy) == loans(service)
+    assert users(copy) == users(service)
+    assert books(copy) == books(service)
+    assert authors(copy) == authors(service)
+    assert {genre.get_name(): genre.get_description() for genre in copy.genres} == {genre.get_name(): genre.get_description() for genre in service.genres}
+    assert copy.get_user("AA00004").get_balance() == 150
+    assert [book.get_title() for book in copy.search_title("book 12").values()] == ["Book 12"]
+    assert copy.search_isbn(make_isbn(3))[make_isbn(3)].is_available() is False
+
+def test_the_replica_refuses_every_change(replica):
+    service, copy = replica
+    changes = (lambda: copy.add_book("New", "Author 0", make_isbn(99), "Fiction", "Novel"),
+               lambda: copy.add_user("New User", "AA00099"),
+               lambda: copy.add_author("New Author"),
+               lambda: copy.check_out_book("AA00000", make_isbn(0)),
+               lambda: copy.check_in_book("AA00001", make_isbn(3)),
+               lambda: copy.reserve_book("AA00000", make_isbn(3)),
+               lambda: copy.accrue_fines(DUE + 10 * DAY),
+               lambda: copy.charge_fine("AA00000", 100),
+               lambda: copy.pay_fine("AA00004", 50))
+    for change in changes:
+        with pytest.raises(ReadOnlyStoreError):
+            change()
+    assert loans(copy) == loans(service) and users(copy) == users(service) and books(copy) == books(service) # Nothing was touched
@@ -0,0 +1,75 @@
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text): # Normalizing text into lowercase word tokens ("The Hobbit: Part 2" -> ["the", "hobbit", "part", "2"])
+    return TOKEN_PATTERN.findall(text.lower())
+
+def rank(text, phrase):
+    # Sort key of a matching text for a normalized query phrase. Lower tuples sort first: exact matches, then texts starting with the
+    # query, then texts containing the query as a phrase, then shorter texts (the query covers more of them), and finally alphabetical
+    # order to keep results stable
+    normalized = " ".join(tokenize(text))
+    return (normalized != phrase, not normalized.startswith(phrase), phrase not in normalized, len(normalized), text.lower())
+
+class TokenIndex:
+    # An inverted index mapping every normalized token to the set of keys (e.g. ISBNs) whose text contains it.
+    # The index is maintained incrementally: adding one entry only touches the posting sets of its own tokens.
+    def __init__(self):
+        self.__postings = {} # token -> set of keys
+        self.__texts = {} # key -> original text, used for ranking and for removing an entry again
+
+    def __len__(self):
+        return len(self.__texts)
+
+    def __contains__(self, key):
+        return key in self.__texts
+
+    def add(self, key, text):
+        if key in self.__texts: # Re-adding a key (e.g. a book replaced under the same ISBN) must not leave stale tokens behind
+            self.remove(key)
+        self.__texts[key] = text
+        for token in set(tokenize(text)):
+            self.__postings.setdefault(token, set()).add(key)
+
+    def remove(self, key):
+        text = self.__texts.pop(key, None)
+        if text is None:
+            return
+        for token in set(tokenize(text)):
+            posting = self.__postings.get(token)
+            if posting is not None:
+                posting.discard(key)
+                if not posting: # Dropping empty posting sets so the index doesn't grow with removed tokens
+                    del self.__postings[token]
+
+    def get_text(self, key):
+        return self.__texts.get(key)
+
+    def tokens(self): # Every distinct token in the index
+        return self.__postings.keys()
+
+    def lookup_token(self, token): # Returning the posting set of a single token (empty if the token is unknown)
+        return self.__postings.get(token.lower(), set())
+
+    def match(self, query): # Returning the unranked set of keys that contain every token of the query
+        tokens = set(tokenize(query))
+        if not tokens:
+            return set()
+        # Intersecting the smallest posting sets first keeps the intermediate results as small as possible:
+        postings = sorted((self.__postings.get(token, set()) for token in tokens), key=len)
+        if not postings[0]:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(self, query, limit=None): # Returning the matching keys ordered from the best to the weakest match
+        matches = self.match(query)
+        phrase = " ".join(tokenize(query))
+        texts = self.__texts
+        ranked = sorted(matches, key=lambda key: rank(texts[key], phrase))
+        return ranked if limit is None else ranked[:limit]
@@ -1,12 +1,41 @@
 class User:
-    def __init__(self, name, library_id):
+    def __init__(self, name, library_id, balance=0):
         self.name = name
         self.__library_id = library_id
-        self.borrowed_books = [] # stores book objects - instances of the book class
+        self.__loans = {} # ISBN -> Book for the books currently on loan, maintained by the library's LoanLedger
+        self.__balance = balance # Unpaid fines, in cents (see fines.py)
 
     def get_library_id(self):
         return self.__library_id
 
+    @property
+    def borrowed_books(self): # A live view of the book objects (instances of the book class) the user has borrowed
+        return self.__loans.values()
+
+    def get_loans(self):
+        return self.__loans
+
+    def add_borrowed_book(self, book):
+        self.__loans[book.get_isbn()] = book
+
+    def remove_borrowed_book(self, isbn):
+        return self.__loans.pop(isbn, None)
+
+    def get_balance(self): # The fines the user still owes, in cents
+        return self.__balance
+
+    def charge(self, amount): # Adding a fine (in cents) to the user's balance
+        if amount < 0:
+            raise ValueError("A fine can't be negative")
+        self.__balance += amount
+        return self.__balance
+
+    def pay_fine(self, amount): # Paying off part or all of the balance (in cents) and returning what is left to pay
+        if amount <= 0 or amount > self.__balance:
+            raise ValueError(f"A payment must be more than 0 and at most the balance of {self.__balance} cents")
+        self.__balance -= amount
+        return self.__balance
+
     def show_user_info(self):
         # Displaying user's borrowed books:
         if self.borrowed_books:
@@ -14,4 +43,4 @@ class User:
             for book in self.borrowed_books:
                 print(f"'{book.get_title()}' by {book.get_author()}, ISBN: {book.get_isbn()}")
         else:
-            print(f"\n{self.name.title()} (Library ID: {self.__library_id}) has no borrowed books.")
\ No newline at end of file
+            print(f"\n{self.name.title()} (Library ID: {self.__library_id}) has no borrowed books.")